@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares the throughput of mrkdwn_to_html with the former chain of regex
+substitutions of the Slack to ScribbleLive converter.
+
+The former conversion passed the regex flags as count and so stopped after ten
+substitutions of each kind, which makes it look fast on long messages. The same
+chain without that limit is measured as well.
+
+Usage: python benchmarks/bench_convert_scribble.py [lines] [rounds]
+"""
+import re
+import sys
+import timeit
+from livebridge_slack.converters.mrkdwn import mrkdwn_to_html
+
+IMAGE = "http://img.example.com/c55d86a5c5b6144bebe2490f4ce14be671dd7"
+LINE = "Ein *wichtiger* Satz mit _Formatierungen_, einem <http://dpa.de/|Link> und ~altem~ Text.\n"
+
+
+def legacy_convert(text, images, count=re.I|re.M):
+    content = text.strip()
+    for url in images:
+        content = content.replace('<{}>'.format(url), '<img src="{}" />'.format(url))
+    content = re.sub(r'\*([^\*]*)\*?', "<b>\\1</b>", content, count)
+    content = re.sub(r'\_([^\_]*)\_?', "<i>\\1</i>", content, count)
+    content = re.sub(r'\~([^\~]*)\~?', "<s>\\1</s>", content, count)
+    content = re.sub(r'\<(http[^\>\|]*)\|([^\>]*)\>?', '<a href="\\1">\\2</a>', content, count)
+    content = re.sub(r'\<(http[^\>\|]*)\>?', '<a href="\\1">\\1</a>', content, count)
+    content = re.sub(r'\n', '<br>', content, count)
+    return content
+
+
+def unlimited_convert(text, images):
+    return legacy_convert(text, images, count=0)
+
+
+def new_convert(text, images):
+    return mrkdwn_to_html(text.strip(), images)
+
+
+def main(lines, rounds):
+    images = set([IMAGE])
+    short = LINE * 2 + "<{}>".format(IMAGE)
+    assert legacy_convert(short, images) == new_convert(short, images)
+    text = LINE * lines + "<{}>".format(IMAGE)
+    assert unlimited_convert(text, images) == new_convert(text, images)
+    print("{} lines, {} chars".format(lines, len(text)))
+    for name, func in [("regex chain", legacy_convert),
+                       ("unlimited chain", unlimited_convert),
+                       ("mrkdwn_to_html", new_convert)]:
+        duration = min(timeit.repeat(lambda: func(text, images), number=rounds, repeat=3))
+        print("{:<16} {:>10.3f} ms/post {:>10.1f} KB/s".format(
+            name, duration / rounds * 1000, len(text) * rounds / duration / 1024))
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    main(lines, rounds)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares the throughput of html_to_mrkdwn with the former bleach and regex
+based conversion of liveblog text items.
+
+Usage: python benchmarks/bench_convert_text.py [paragraphs] [rounds]
+"""
+import bleach
+import re
+import sys
+import timeit
+from livebridge_slack.converters.mrkdwn import html_to_mrkdwn
+
+PARAGRAPH = "<p>Ein <b>wichtiger</b> Satz&nbsp; mit  <i>Formatierungen</i>, einem " \
+            "<a href=\"http://dpa.de/?a=1&amp;b=2\">Link</a> und <strike>altem</strike> " \
+            "<span class=\"x\">Text</span>.<br><br>«Zitat» <b> fett </b></p>" \
+            "<ul><li>Eins</li><li>Zwei</li></ul><ol><li>Drei</li></ol>"
+
+
+def legacy_convert_text(text):
+    content = "\n"+text
+    content = content.replace("&nbsp;", " ")
+    content = bleach.clean(content, tags=["p", "br", "b", "i", "strike", "ul", "li", "ol", "a", "div"], strip=True)
+    content = re.sub(r'<a.*?href="([^"]*)".*?>(.*?)</a>', '<\\1|\\2>', content, flags=re.I|re.M)
+    content = content.replace("<ol>", "").replace("</ol>", "\n")
+    content = re.sub(r'[ ]+', ' ', content)
+    content = re.sub(r'<b> ', ' <b>', content)
+    content = re.sub(r' </b>', '</b> ', content)
+    content = re.sub(r'<i> ', ' <i>', content)
+    content = re.sub(r' </i>', '</i> ', content)
+    content = re.sub(r'<b>[ ]*</b>', ' ', content)
+    content = re.sub(r'<i>[ ]*</i>', ' ', content)
+    content = content.replace("<ul>", "").replace("</ul>", "\n")
+    content = content.replace("</li>", "\n")
+    content = content.replace("<li>", " • ")
+    content = content.replace("</p>", "\n")
+    content = content.replace("</div>", "\n")
+    content = content.replace("<b>", "*")
+    content = content.replace("</b>", "* ")
+    content = content.replace("<br><br>", "<br>")
+    content = content.replace("<br>", "\n")
+    content = re.sub(r'<\/?i>', '_', content)
+    content = re.sub(r'<\/?strike>', '~', content)
+    content = re.sub('<(a|br|div|p)>', '', content)
+    content = content.replace("«_", "_«")
+    content = content.replace("_»", "»_")
+    content = content.replace("«*", "*«")
+    content = content.replace("*»", "»*")
+    content = content.replace(" ** ", " ")
+    content = content.replace("\n**", " ")
+    content = content.replace("*\n*", "\n")
+    return content+"\n"
+
+
+def new_convert_text(text):
+    return html_to_mrkdwn("\n"+text)+"\n"
+
+
+def main(paragraphs, rounds):
+    text = PARAGRAPH * paragraphs
+    assert legacy_convert_text(text) == new_convert_text(text)
+    print("{} paragraphs, {} chars".format(paragraphs, len(text)))
+    for name, func in [("bleach + regex", legacy_convert_text), ("html_to_mrkdwn", new_convert_text)]:
+        duration = min(timeit.repeat(lambda: func(text), number=rounds, repeat=3))
+        print("{:<16} {:>10.2f} ms/post {:>10.1f} KB/s".format(
+            name, duration / rounds * 1000, len(text) * rounds / duration / 1024))
+
+
+if __name__ == "__main__":
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    main(paragraphs, rounds)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares requests/sec of one ClientSession per call with the shared session
+of SlackClient against a local stub of the Slack API.
+
+Usage: python benchmarks/bench_http_session.py [requests] [concurrency]
+"""
+import aiohttp
+import asyncio
+import sys
+import time
+from aiohttp import web
+from livebridge_slack.common import SlackClient
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+async def chat_post_message(request):
+    await request.post()
+    return web.json_response({"ok": True, "ts": "1466511630.000011"})
+
+
+async def start_stub():
+    app = web.Application()
+    app.router.add_post("/api/chat.postMessage", chat_post_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, PORT).start()
+    return runner
+
+
+async def post_with_new_session(url, data):
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, data=data) as resp:
+            return await resp.json()
+
+
+async def run(name, func, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await func()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    duration = time.perf_counter() - start
+    print("{:<20} {:>8} requests {:>8.2f}s {:>10.1f} req/s".format(name, requests, duration, requests / duration))
+
+
+async def main(requests, concurrency):
+    runner = await start_stub()
+    client = SlackClient(config={"auth": {"token": "bench"}, "channel": "bench"})
+    client.endpoint = "http://{}:{}/api/".format(HOST, PORT)
+    url = "{}chat.postMessage".format(client.endpoint)
+    data = [("token", client.token), ("channel", "C123"), ("text", "Benchmark")]
+    try:
+        await run("session per call", lambda: post_with_new_session(url, data), requests, concurrency)
+        await run("shared session", lambda: client._post(url, data), requests, concurrency)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.get_event_loop().run_until_complete(main(requests, concurrency))
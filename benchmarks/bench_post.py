@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares memory and throughput of SlackPost with the former dict backed
+implementation, for posts of edited messages as received via RTM.
+
+Usage: python benchmarks/bench_post.py [posts] [rounds]
+"""
+import copy
+import json
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+from livebridge.base import BasePost
+from livebridge_slack.post import SlackPost
+
+DOC = """{"type":"message","message":{"type":"message","user":"U1F2VML58","text":"Foo baz %(n)d",
+"edited":{"user":"U1F2VML58","ts":"1475166092.000000"},"ts":"1475157232.%(n)06d"},"subtype":"message_changed",
+"hidden":true,"channel":"C1123456","previous_message":{"type":"message","user":"U1F2VML58",
+"text":"Foo baz!","edited":{"user":"U1F2VML58","ts":"1475166025.000000"},"ts":"1475157232.%(n)06d"},
+"event_ts":"1475166092.396510","ts":"1475166092.000018","livebridge":{"action":"update"}}"""
+
+
+class LegacySlackPost(BasePost):
+
+    source = "slack"
+
+    @property
+    def id(self):
+        return self.data.get("deleted_ts", self.data.get("message", self.data).get("ts"))
+
+    @property
+    def source_id(self):
+        return self.data.get("channel")
+
+    @property
+    def created(self):
+        return datetime.utcfromtimestamp(float(self.data.get("message", self.data).get("ts")))
+
+    @property
+    def updated(self):
+        return datetime.utcfromtimestamp(float(self.data.get("ts", None)))
+
+    @property
+    def is_update(self):
+        return (self.data.get("livebridge", {}).get("action") == "update")
+
+    @property
+    def is_deleted(self):
+        return (self.data.get("livebridge", {}).get("action") == "delete")
+
+    @property
+    def is_sticky(self):
+        return False
+
+    def get_action(self):
+        return self.data.get("livebridge", {}).get("action", None)
+
+
+def handle(cls, doc):
+    # what the source, livebridge and the target do with a post
+    post = copy.deepcopy(cls(doc))
+    for _ in range(5):
+        post.id, post.source_id, post.get_action(), post.is_update, post.is_deleted
+    return post.created, post.updated
+
+
+def memory(cls, docs):
+    # documents are parsed from a websocket frame and only referenced by the post
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    posts = [cls(json.loads(doc)) for doc in docs]
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del posts
+    return size
+
+
+def main(count, rounds):
+    docs = [DOC % {"n": n} for n in range(count)]
+    parsed = json.loads(docs[0])
+    print("{} posts".format(count))
+    for name, cls in [("legacy", LegacySlackPost), ("slots", SlackPost)]:
+        size = memory(cls, docs)
+        duration = min(timeit.repeat(lambda: handle(cls, parsed), number=rounds, repeat=3))
+        print("{:<8} {:>10.0f} bytes/post {:>12.0f} posts/s".format(name, size / count, rounds / duration))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    main(count, rounds)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks of the hot paths of the plugin. The results are written as JSON,
+so they can be compared with the ones of an earlier release.
+
+Usage: python benchmarks/suite.py [--output FILE] [--compare FILE] [--only NAME] [--quick]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+from livebridge_slack import LiveblogSlackConverter, SlackScribbleliveConverter, SlackPost, SlackSource, SlackTarget
+from livebridge_slack.common import SlackClient
+from livebridge_slack.history import ChannelHistory
+from livebridge_slack.ratelimit import METHOD_LIMITS, Scheduler
+from livebridge_slack.rtm import RTMConnection
+from tests import load_json
+from tests.fake_slack import FakeSlack
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+CHANNEL_ID = "C1123456"
+
+BENCHMARKS = []
+
+
+def benchmark(number):
+    """Registers a benchmark, the decorated function does the setup and returns the function
+       to measure, a coroutine function for async code. *number* is the calls per round."""
+    def register(setup):
+        BENCHMARKS.append((setup.__name__.replace("bench_", ""), setup, number))
+        return setup
+    return register
+
+
+def _liveblog_post(items):
+    post = load_json("post_to_convert.json")
+    main = [g for g in post["groups"] if g["id"] == "main"][0]
+    refs = []
+    for n in range(items):
+        ref = copy.deepcopy(main["refs"][n % len(main["refs"])])
+        if ref["item"]["item_type"] == "text":
+            ref["item"]["text"] += " #{}".format(n)
+        refs.append(ref)
+    main["refs"] = refs
+    return post
+
+
+def _pathological_post():
+    post = _liveblog_post(1)
+    text = "".join(["<p><b> <i>«{}»</i> </b>&nbsp;&nbsp; <a href=\"http://dpa.de/?{}\">x</a><br><br>".format(n, n)
+                    for n in range(500)])
+    text += "<b>" * 500 + "unclosed" + "<span>" * 500
+    post["groups"][1]["refs"][0]["item"]["text"] = text
+    return post
+
+
+def _converter(post, cached):
+    converter = LiveblogSlackConverter()
+
+    async def convert():
+        if not cached:
+            converter.cache.clear()
+        return await converter.convert(post)
+    return convert
+
+
+@benchmark(number=2000)
+def bench_liveblog_convert_small():
+    return _converter(_liveblog_post(6), cached=False)
+
+
+@benchmark(number=2000)
+def bench_liveblog_convert_small_cached():
+    return _converter(_liveblog_post(6), cached=True)
+
+
+@benchmark(number=50)
+def bench_liveblog_convert_large():
+    return _converter(_liveblog_post(300), cached=False)
+
+
+@benchmark(number=20)
+def bench_liveblog_convert_pathological():
+    return _converter(_pathological_post(), cached=False)
+
+
+def _scribble_msg(lines):
+    line = "Ein *wichtiger* Satz mit _Formatierungen_, einem <http://dpa.de/a_b|Link> und ~altem~ Text.\n"
+    return {"text": line * lines + "<http://img.example.com/c55d86a5c5b6.jpg>",
+            "attachments": [{"from_url": "http://img.example.com/c55d86a5c5b6.jpg"}]}
+
+
+def _scribble_converter(msg):
+    converter = SlackScribbleliveConverter()
+
+    async def convert():
+        return await converter.convert(msg)
+    return convert
+
+
+@benchmark(number=5000)
+def bench_scribble_convert_small():
+    return _scribble_converter(_scribble_msg(3))
+
+
+@benchmark(number=100)
+def bench_scribble_convert_large():
+    return _scribble_converter(_scribble_msg(300))
+
+
+@benchmark(number=100)
+def bench_scribble_convert_pathological():
+    return _scribble_converter({"text": "*_~" * 3000 + "<http://dpa.de/" + "_" * 3000})
+
+
+class _NullDispatcher(object):
+
+    async def put(self, key, post):
+        pass
+
+
+@benchmark(number=20)
+def bench_rtm_route_stream():
+    with open(os.path.join(DATA_DIR, "rtm_stream.jsonl")) as f:
+        frames = f.read().splitlines()
+    connection = RTMConnection("https://slack.com/api/", "xoxb-bench")
+    for channel_id in [CHANNEL_ID, "C0OTHER01"]:
+        source = SlackSource(config={"auth": {"token": "xoxb-bench"}, "channel": "foo"})
+        source._channel_id = channel_id
+        source.dispatcher = _NullDispatcher()
+        connection.sources[channel_id] = [source]
+
+    async def route():
+        for sources in connection.sources.values():
+            # every round sees the stream for the first time
+            sources[0].history = ChannelHistory(500)
+        for frame in frames:
+            await connection._route(frame)
+    return route
+
+
+@benchmark(number=20000)
+def bench_post_properties():
+    with open(os.path.join(DATA_DIR, "rtm_stream.jsonl")) as f:
+        doc = [json.loads(frame) for frame in f if "message_changed" in frame][0]
+    doc["livebridge"] = {"action": "update"}
+    post = SlackPost(doc)
+
+    def access():
+        post.id, post.source_id, post.get_action(), post.is_update, post.is_deleted, post.is_sticky
+        return post.created, post.updated
+    return access
+
+
+async def _target():
+    slack = await FakeSlack(channels={"foo": CHANNEL_ID}).start()
+    target = SlackTarget(config={"auth": {"token": "xoxb-bench"}, "channel": "foo"})
+    target.endpoint = slack.endpoint
+    await target.channel_id
+    return slack, target
+
+
+@benchmark(number=200)
+def bench_target_post_update_delete():
+    # the limits of Slack would dominate, only the overhead of the plugin is measured
+    METHOD_LIMITS.update({method: (6000000, 1000) for method in ("chat.postMessage", "chat.update", "chat.delete")})
+    Scheduler.clear()
+    loop = asyncio.get_event_loop()
+    slack, target = loop.run_until_complete(_target())
+    doc = {"type": "message", "channel": CHANNEL_ID, "text": "Foo", "ts": "1475157232.000001",
+           "livebridge": {"action": "create"}}
+
+    async def cycle():
+        slack.calls.clear()
+        post = SlackPost(doc)
+        post.content = "*Breaking:* the vote has started"
+        post.target_doc = await target.post_item(post)
+        post.content = "*Breaking:* the vote has ended"
+        await target.update_item(post)
+        await target.delete_item(post)
+    return cycle
+
+
+def measure(func, number, repeat):
+    """Returns the seconds per call of every round."""
+    loop = asyncio.get_event_loop()
+    is_async = asyncio.iscoroutinefunction(func)
+
+    async def run_async():
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        return time.perf_counter() - start
+
+    def run_sync():
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - start
+
+    timings = []
+    for _ in range(repeat):
+        duration = loop.run_until_complete(run_async()) if is_async else run_sync()
+        timings.append(duration / number)
+    return timings
+
+
+def run(only=None, quick=False):
+    results = {}
+    for name, setup, number in BENCHMARKS:
+        if only and not any(o in name for o in only):
+            continue
+        number = max(1, number // 10) if quick else number
+        func = setup()
+        measure(func, max(1, number // 10), 1)
+        timings = measure(func, number, 3 if quick else 5)
+        results[name] = {
+            "min": min(timings),
+            "mean": statistics.mean(timings),
+            "stdev": statistics.stdev(timings),
+            "number": number,
+            "rounds": len(timings),
+        }
+        print("{:<40} {:>12.3f} us/call {:>8.1f}% stdev".format(
+            name, results[name]["min"] * 1e6, results[name]["stdev"] / results[name]["mean"] * 100))
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(SlackClient.close_session())
+    return results
+
+
+def _version():
+    """Returns the version in setup.py of the checkout, as the package isn't installed necessarily."""
+    try:
+        with open(os.path.join(os.path.dirname(__file__), "..", "setup.py")) as f:
+            return re.search(r"version = '([^']+)'", f.read()).group(1)
+    except Exception:
+        return "unknown"
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of every benchmark against *baseline*, returns the names of regressions."""
+    regressions = []
+    print("\ncompared with {} ({}, Python {}):".format(
+        baseline.get("version"), baseline.get("created"), baseline.get("python")))
+    for name, result in sorted(results.items()):
+        old = baseline.get("benchmarks", {}).get(name)
+        if not old:
+            print("{:<40} {:>12}".format(name, "new"))
+            continue
+        ratio = result["min"] / old["min"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print("{:<40} {:>+11.1f}% {}".format(name, (ratio - 1) * 100, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks of livebridge-slack.")
+    parser.add_argument("--output", help="JSON file to write the results to, default: benchmarks/results/")
+    parser.add_argument("--compare", help="JSON file of earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown reported as regression, default: 0.2")
+    parser.add_argument("--only", action="append", help="run only benchmarks containing this name")
+    parser.add_argument("--quick", action="store_true", help="less calls and rounds, for a smoke test")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.quick)
+    doc = {
+        "version": _version(),
+        "created": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, "{}-py{}-{}.json".format(
+            doc["version"], doc["python"], datetime.utcnow().strftime("%Y%m%d%H%M%S")))
+    with open(output, "w") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+    print("\nresults written to {}".format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
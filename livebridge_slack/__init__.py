@@ -13,8 +13,8 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from .source import SlackSource
-from .target import SlackTarget
+from .source import SlackSource, SlackEventsSource, SlackPollingSource
+from .target import SlackTarget, SlackFanoutTarget
 from .post import SlackPost
 from .converters.liveblog_slack import LiveblogSlackConverter
 from .converters.slack_scribblelive import SlackScribbleliveConverter
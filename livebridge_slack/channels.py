@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelIndex(object):
+    """Index of channel names to channel ids, shared by all clients using the same token."""
+
+    # seconds until the index gets rebuilt
+    ttl = 600
+    # seconds an unknown channel name is not looked up again
+    negative_ttl = 60
+    # page size of channels.list
+    page_size = 1000
+
+    _indexes = {}
+
+    def __init__(self, endpoint, token):
+        self.endpoint = endpoint
+        self.token = token
+        self.channels = {}
+        self.updated = None
+        self._misses = {}
+        self._pending = None
+
+    @classmethod
+    def get(cls, client):
+        """Returns the index for the token and endpoint of *client*."""
+        key = (client.endpoint, client.token)
+        if key not in cls._indexes:
+            cls._indexes[key] = cls(client.endpoint, client.token)
+        return cls._indexes[key]
+
+    @classmethod
+    def clear(cls):
+        cls._indexes.clear()
+
+    def _expired(self, now):
+        return self.updated is None or now - self.updated > self.ttl
+
+    async def lookup(self, client, name):
+        """Returns channel id for channel *name* or None if unknown."""
+        now = asyncio.get_event_loop().time()
+        if self._expired(now):
+            await self.refresh(client)
+        elif name not in self.channels:
+            # channel could be created since last listing
+            missed = self._misses.get(name)
+            if missed is not None and now - missed <= self.negative_ttl:
+                return None
+            await self.refresh(client)
+
+        channel_id = self.channels.get(name)
+        if channel_id is None:
+            self._misses[name] = asyncio.get_event_loop().time()
+        else:
+            self._misses.pop(name, None)
+        return channel_id
+
+    async def refresh(self, client):
+        """Rebuilds the index, concurrent callers are waiting for the same request."""
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.ensure_future(self._list_channels(client))
+        await asyncio.shield(self._pending)
+
+    async def _list_channels(self, client):
+        channels = {}
+        cursor = None
+        while True:
+            data = [("token", self.token), ("limit", self.page_size)]
+            if cursor:
+                data.append(("cursor", cursor))
+            res = await client._request("channels.list", data)
+            if not res:
+                logger.error("Listing slack channels failed, keeping previous index.")
+                return False
+            for c in res.get("channels", []):
+                if c.get("is_channel") == True and c.get("name"):
+                    channels[c["name"]] = c["id"]
+            cursor = res.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+        self.channels = channels
+        self.updated = asyncio.get_event_loop().time()
+        logger.debug("Indexed {} slack channels.".format(len(channels)))
+        return True
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore(object):
+    """Remembers the ts of the last message dispatched completely per channel, so a
+       restarted source only has to fetch the messages posted since.
+
+    Updates are kept in memory and written in batches, after *flush_count* updates or
+    *flush_interval* seconds, whatever comes first. :func:`get` returns the store for
+    a path, a SQLite database for paths ending with *.db*, *.sqlite* or *.sqlite3*,
+    otherwise a JSON file."""
+
+    flush_count = 50
+    flush_interval = 5
+
+    _stores = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self._load()
+        self.pending = 0
+        self.flushes = 0
+        self._timer = None
+
+    @classmethod
+    def get(cls, path):
+        """Returns the store at *path*, shared by all sources using it."""
+        if path not in cls._stores:
+            if os.path.splitext(path)[1] in (".db", ".sqlite", ".sqlite3"):
+                cls._stores[path] = SQLiteCheckpointStore(path)
+            else:
+                cls._stores[path] = FileCheckpointStore(path)
+        return cls._stores[path]
+
+    @classmethod
+    def clear(cls):
+        for store in cls._stores.values():
+            store.close()
+        cls._stores = {}
+
+    def lookup(self, key):
+        """Returns the checkpoint ts of *key*, **None** if unknown."""
+        return self.entries.get(key)
+
+    def update(self, key, ts):
+        """Moves the checkpoint of *key* forward to *ts*, older ones are ignored."""
+        current = self.entries.get(key)
+        if current is not None and float(ts) <= float(current):
+            return
+        self.entries[key] = ts
+        self.pending += 1
+        if self.pending >= self.flush_count:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """Writes pending updates."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        try:
+            self._write(dict(self.entries))
+            self.pending = 0
+            self.flushes += 1
+        except Exception as e:
+            logger.error("Writing checkpoints to {} failed: {}".format(self.path, e))
+
+    def close(self):
+        self.flush()
+
+    def _load(self):
+        raise NotImplementedError()
+
+    def _write(self, entries):
+        raise NotImplementedError()
+
+
+class FileCheckpointStore(CheckpointStore):
+    """Keeps the checkpoints in a JSON file, replaced atomically on every write."""
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning("Ignoring invalid checkpoint file {}: {}".format(self.path, e))
+            return {}
+
+    def _write(self, entries):
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # persist the rename as well
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:  # pragma: no cover
+            return
+        try:
+            os.fsync(fd)
+        except OSError:  # pragma: no cover
+            pass
+        finally:
+            os.close(fd)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Keeps the checkpoints in a SQLite database."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+            key TEXT PRIMARY KEY,
+            ts TEXT NOT NULL,
+            updated REAL NOT NULL)""")
+        self.db.commit()
+        super().__init__(path)
+
+    def _load(self):
+        return {row[0]: row[1] for row in self.db.execute("SELECT key, ts FROM checkpoints")}
+
+    def _write(self, entries):
+        now = time.time()
+        self.db.executemany("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)",
+                            [(key, ts, now) for key, ts in entries.items()])
+        self.db.commit()
+
+    def close(self):
+        super().close()
+        self.db.close()
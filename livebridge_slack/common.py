@@ -14,7 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import aiohttp
+import asyncio
+import json
 import logging
+import os
+import time
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.metrics import Metrics
+from livebridge_slack.ratelimit import RateLimited, Scheduler
+
+try:
+    # faster json parsing, when installed
+    from orjson import loads as json_loads
+except ImportError:  # pragma: no cover
+    json_loads = json.loads
 
 
 logger = logging.getLogger(__name__)
@@ -24,13 +37,61 @@ class SlackClient(object):
 
     type = "slack"
 
+    # defaults for the keep-alive connection pool of the shared http session
+    pool_limit_per_host = 10
+    pool_dns_cache_ttl = 300
+    pool_keepalive_timeout = 30
+
+    # one http session per process, shared by all sources and targets
+    _session = None
+    _session_loop = None
+    _session_users = 0
+
     def __init__(self, *, config={}, **kwargs):
         self.token = config.get("auth", {}).get("token")
         self.channel = config.get("channel")
-        self.endpoint = "https://slack.com/api/"
+        self.endpoint = config.get("endpoint", "https://slack.com/api/").rstrip("/") + "/"
         self.target_id = "{}-{}".format(self.type, self.channel)
         self._channel_id = None
+        self._session_ref = None
         self.last_updated = None
+        self.pool_config = config.get("pool", {})
+        Metrics.configure(config.get("metrics"))
+
+    @property
+    def session(self):
+        """Returns the process-wide http session, creates it on first use."""
+        loop = asyncio.get_event_loop()
+        if SlackClient._session is None or SlackClient._session.closed or SlackClient._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.pool_config.get("limit_per_host", self.pool_limit_per_host),
+                ttl_dns_cache=self.pool_config.get("dns_cache_ttl", self.pool_dns_cache_ttl),
+                keepalive_timeout=self.pool_config.get("keepalive_timeout", self.pool_keepalive_timeout))
+            SlackClient._session = aiohttp.ClientSession(connector=connector)
+            SlackClient._session_loop = loop
+            SlackClient._session_users = 0
+        if self._session_ref is not SlackClient._session:
+            self._session_ref = SlackClient._session
+            SlackClient._session_users += 1
+        return SlackClient._session
+
+    async def close(self):
+        """Releases the shared http session, closes it when no other client uses it anymore."""
+        if self._session_ref is not None and self._session_ref is SlackClient._session:
+            SlackClient._session_users -= 1
+            if SlackClient._session_users <= 0:
+                await SlackClient.close_session()
+        self._session_ref = None
+
+    @classmethod
+    async def close_session(cls):
+        """Closes the shared http session, for example on shutdown."""
+        session = SlackClient._session
+        SlackClient._session = None
+        SlackClient._session_loop = None
+        SlackClient._session_users = 0
+        if session is not None and not session.closed:
+            await session.close()
 
     @property
     def source_id(self):
@@ -40,12 +101,7 @@ class SlackClient(object):
     async def channel_id(self):
         """Lookups channel_id for channel from slack api."""
         if not self._channel_id:
-            url = "{}channels.list".format(self.endpoint)
-            res = await self._post(url, [("token", self.token)])
-            for c in res.get("channels", []):
-                if c.get("is_channel") == True and c.get("name") == self.channel:
-                    self._channel_id = c["id"]
-                    break
+            self._channel_id = await ChannelIndex.get(self).lookup(self, self.channel)
         return self._channel_id
 
     async def _build_post_data(self, params={}):
@@ -58,21 +114,88 @@ class SlackClient(object):
                 data.append((k, params[k]))
         return data
 
-    async def _post(self, url, data=[], *, images=[], status=200):
+    async def _request(self, method, data=[], *, images=[]):
+        """Calls Slack API *method*, queued by the rate limit of the method. The files
+           at the paths in *images* are sent along as multipart upload."""
+        url = "{}{}".format(self.endpoint, method)
+        channel = dict(data).get("channel")
+        if images:
+            return await Scheduler.get(self.token, method, channel).run(lambda: self._post(url, data, images=images))
+        return await Scheduler.get(self.token, method, channel).run(lambda: self._post(url, data))
+
+    async def _request_json(self, method, payload):
+        """Calls Slack API *method* with a JSON body, needed for example for messages with blocks."""
+        url = "{}{}".format(self.endpoint, method)
+        return await Scheduler.get(self.token, method, payload.get("channel")).run(
+            lambda: self._post(url, payload=payload))
+
+    async def _history(self, oldest, *, page_size=200):
+        """Returns all messages of the channel posted since *oldest*, newest first.
+
+        Returns **None** when a page could not be fetched."""
+        messages = []
+        cursor = None
+        while True:
+            data = [
+                ("token", self.token),
+                ("channel", await self.channel_id),
+                ("oldest", oldest),
+                ("inclusive", "true"),
+                ("limit", page_size),
+            ]
+            if cursor:
+                data.append(("cursor", cursor))
+            resp = await self._request("conversations.history", data)
+            if not resp.get("ok"):
+                return None
+            messages.extend(resp.get("messages", []))
+            cursor = resp.get("response_metadata", {}).get("next_cursor")
+            if not resp.get("has_more") or not cursor:
+                return messages
+
+    async def _post(self, url, data=[], *, images=[], status=200, payload=None):
+        start = time.perf_counter()
+        resp_status = "error"
+        msg = {}
+        files = []
         try:
             logger.debug("POST: {}".format(url))
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, data=data) as resp:
-                    if resp.status == status:
-                        msg = await resp.json()
-                        if msg.get("ok") == True:
-                            return msg
-                        else:
-                            logger.error("Error when posting to slack: {}".format(msg))
+            if payload is not None:
+                request = self.session.post(url, json=payload, headers={
+                    "Authorization": "Bearer {}".format(self.token)})
+            elif images:
+                # streamed from disk
+                form = aiohttp.FormData(data)
+                for path in images:
+                    files.append(open(path, "rb"))
+                    form.add_field("file", files[-1], filename=os.path.basename(path))
+                request = self.session.post(url, data=form)
+            else:
+                request = self.session.post(url, data=data)
+            async with request as resp:
+                resp_status = resp.status
+                if resp.status == 429:
+                    raise RateLimited(float(resp.headers.get("Retry-After", 1)))
+                elif resp.status == status:
+                    msg = await resp.json()
+                    if msg.get("ok") == True:
+                        return msg
                     else:
-                        logger.debug("POST request failed with status [{}], expected {}".format(resp.status, status))
-                        logger.debug(await resp.text())
+                        logger.error("Error when posting to slack: {}".format(msg))
+                else:
+                    logger.debug("POST request failed with status [{}], expected {}".format(resp.status, status))
+                    logger.debug(await resp.text())
         except aiohttp.client_exceptions.ClientOSError as e:
             logger.error("POST request failed for [{}] on {}".format(self.channel, self.endpoint))
             logger.error(e)
+        finally:
+            for f in files:
+                f.close()
+            if Metrics.enabled:
+                method = url.rsplit("/", 1)[-1]
+                Metrics.observe("slack_request_seconds", time.perf_counter() - start, method=method)
+                Metrics.inc("slack_requests_total", method=method, status=resp_status,
+                            ok="true" if msg.get("ok") == True else "false")
+                if resp_status == 429:
+                    Metrics.inc("slack_rate_limited_total", method=method)
         return {}
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# limits of Slack, see https://api.slack.com/reference/block-kit/blocks
+MAX_BLOCKS = 50
+MAX_SECTION_LENGTH = 3000
+
+
+class SlackContent(str):
+    """Text of a Slack message, which remembers the fragments it was joined from,
+       for example the converted items of a liveblog post.
+
+    Optionally the Block Kit blocks of every fragment are kept as well, *unfurl* tells
+    if links in the message need to be unfurled, for example for embedded tweets."""
+
+    def __new__(cls, text="", fragments=None, blocks=None, unfurl=False):
+        content = super().__new__(cls, text)
+        content.fragments = fragments if fragments is not None else [text]
+        content.blocks = blocks
+        content.unfurl = unfurl
+        return content
+
+    @classmethod
+    def join(cls, fragments, blocks=None, unfurl=False):
+        if blocks is not None:
+            blocks = [b for f, b in zip(fragments, blocks) if f]
+        fragments = [f for f in fragments if f]
+        return cls("".join(fragments), fragments, blocks, unfurl)
+
+
+def section_blocks(text):
+    """Returns mrkdwn *text* as section blocks, split at line breaks when too long for one."""
+    text = text.strip()
+    if not text:
+        return []
+    return [{"type": "section", "text": {"type": "mrkdwn", "text": part.strip()}}
+            for part in split_content(text, MAX_SECTION_LENGTH) if part.strip()]
+
+
+def _split_fragment(fragment, limit):
+    """Splits a single fragment longer than *limit* at line breaks, or anywhere if needed."""
+    if len(fragment) <= limit:
+        return [fragment]
+    parts = []
+    for line in fragment.splitlines(True):
+        while len(line) > limit:
+            parts.append(line[:limit])
+            line = line[limit:]
+        parts.append(line)
+    return parts
+
+
+def split_content(content, limit):
+    """Splits *content* into chunks of at most *limit* chars, between its fragments where possible."""
+    if len(content) <= limit:
+        return [content]
+    chunks = []
+    current = []
+    size = 0
+    for fragment in getattr(content, "fragments", [content]):
+        for part in _split_fragment(fragment, limit):
+            if current and size + len(part) > limit:
+                chunks.append("".join(current))
+                current = []
+                size = 0
+            current.append(part)
+            size += len(part)
+    if current:
+        chunks.append("".join(current))
+    # Slack doesn't accept messages without text
+    return [chunk for chunk in chunks if chunk.strip()] or chunks[:1]
+
+
+def split_blocks(content, limit, max_blocks=MAX_BLOCKS):
+    """Splits the blocks of *content* into chunks of at most *max_blocks* blocks, between
+       its fragments where possible. Returns a list of **(text, blocks)**, the text of a
+       chunk is the fallback shown in notifications, shortened to *limit* chars."""
+    chunks = []
+    text = []
+    current = []
+    for fragment, blocks in zip(content.fragments, content.blocks):
+        while blocks:
+            if current and len(current) + len(blocks) > max_blocks:
+                chunks.append(("".join(text), current))
+                text = []
+                current = []
+            current.extend(blocks[:max_blocks])
+            blocks = blocks[max_blocks:]
+        text.append(fragment)
+    if current:
+        chunks.append(("".join(text), current))
+    return [(text[:limit], blocks) for text, blocks in chunks]
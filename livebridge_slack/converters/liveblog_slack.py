@@ -13,53 +13,44 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import bleach
+import hashlib
+import json
 import logging
-import re
+import sys
+import time
 
 from livebridge.base import BaseConverter, ConversionResult
+from livebridge_slack.cache import LRUCache
+from livebridge_slack.content import SlackContent, section_blocks
+from livebridge_slack.metrics import Metrics
+from livebridge_slack.converters.mrkdwn import html_to_mrkdwn
 
 logger = logging.getLogger(__name__)
 
+# meta fields the conversion of an item depends on
+CACHE_FIELDS = {
+    "quote": ("quote", "credit"),
+    "image": ("media", "caption", "credit"),
+    "embed": ("original_url", "html"),
+}
+
+
+def _sizeof(value):
+    content, blocks = value
+    return sys.getsizeof(content) + sys.getsizeof(repr(blocks))
+
+
 class LiveblogSlackConverter(BaseConverter):
 
     source = "liveblog"
     target = "slack"
 
+    # converted items with their blocks, shared by all converter instances
+    cache = LRUCache(max_entries=5000, max_bytes=16 * 1024 * 1024, sizeof=_sizeof)
+
     async def _convert_text(self, item):
         logger.debug("CONVERTING TEXT")
-        content = "\n"+item["item"]["text"]
-        content = content.replace("&nbsp;", " ")
-        content = bleach.clean(content, tags=["p", "br", "b", "i", "strike", "ul", "li", "ol", "a", "div"], strip=True)
-        content = re.sub(r'<a.*?href="([^"]*)".*?>(.*?)</a>', '<\\1|\\2>', content, flags=re.I|re.M)
-        content = content.replace("<ol>", "").replace("</ol>", "\n")
-        content = re.sub(r'[ ]+', ' ', content)
-        content = re.sub(r'<b> ', ' <b>', content)
-        content = re.sub(r' </b>', '</b> ', content)
-        content = re.sub(r'<i> ', ' <i>', content)
-        content = re.sub(r' </i>', '</i> ', content)
-        content = re.sub(r'<b>[ ]*</b>', ' ', content)
-        content = re.sub(r'<i>[ ]*</i>', ' ', content)
-        content = content.replace("<ul>", "").replace("</ul>", "\n")
-        content = content.replace("</li>", "\n")
-        content = content.replace("<li>", " • ")
-        content = content.replace("</p>", "\n")
-        content = content.replace("</div>", "\n")
-        content = content.replace("<b>", "*")
-        content = content.replace("</b>", "* ")
-        content = content.replace("<br><br>", "<br>")
-        content = content.replace("<br>", "\n")
-        content = re.sub(r'<\/?i>', '_', content)
-        content = re.sub(r'<\/?strike>', '~', content)
-        content = re.sub('<(a|br|div|p)>', '', content)
-        content = content.replace("«_", "_«")
-        content = content.replace("_»", "»_")
-        content = content.replace("«*", "*«")
-        content = content.replace("*»", "»*")
-        content = content.replace(" ** ", " ")
-        content = content.replace("\n**", " ")
-        content = content.replace("*\n*", "\n")
-        return content+"\n"
+        return html_to_mrkdwn("\n"+item["item"]["text"])+"\n"
 
     async def _convert_quote(self, item):
         logger.debug("CONVERTING QUOTE")
@@ -103,25 +94,85 @@ class LiveblogSlackConverter(BaseConverter):
                 content = "\n{}\n".format(meta["original_url"])
         return content
 
+    def _cache_key(self, item):
+        item_type = item["item"]["item_type"]
+        if item_type == "text":
+            data = item["item"]["text"]
+        else:
+            meta = item["item"].get("meta", {})
+            data = json.dumps([meta.get(f) for f in CACHE_FIELDS[item_type]], sort_keys=True, default=str)
+        return item_type, hashlib.md5(data.encode("utf-8")).hexdigest()
+
+    def _image_blocks(self, item):
+        meta = item["item"]["meta"]
+        blocks = []
+        href = meta.get("media", {}).get("renditions", {}).get("viewImage", {}).get("href")
+        caption = (meta.get("caption") or "").strip()
+        credit = (meta.get("credit") or "").strip()
+        if href:
+            blocks.append({"type": "image", "image_url": href, "alt_text": caption or credit or "image"})
+        context = " ".join(t for t in [caption, "_({})_".format(credit) if credit else ""] if t)
+        if context:
+            blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": context}]})
+        return blocks
+
+    def _blocks(self, item, content):
+        """Returns Block Kit blocks for *item* converted to *content*."""
+        if item["item"]["item_type"] == "image":
+            return self._image_blocks(item)
+        return section_blocks(content)
+
+    async def _convert_item(self, item):
+        """Returns the mrkdwn of *item* together with its blocks."""
+        item_type = item["item"]["item_type"]
+        if item_type != "text" and item_type not in CACHE_FIELDS:
+            return "", []
+
+        key = self._cache_key(item)
+        converted = self.cache.get(key)
+        if converted is None:
+            start = time.perf_counter()
+            if item_type == "text":
+                content = await self._convert_text(item)
+            elif item_type == "quote":
+                content = await self._convert_quote(item)
+            elif item_type == "image":
+                content, _ = await self._convert_image(item)
+            elif item_type == "embed":
+                content = await self._convert_embed(item)
+            try:
+                blocks = self._blocks(item, content)
+            except Exception as e:
+                logger.error("SLACK: Building blocks of {} failed: {}".format(item_type, e))
+                blocks = section_blocks(content)
+            converted = (content, blocks)
+            self.cache.set(key, converted)
+            if Metrics.enabled:
+                Metrics.observe("slack_convert_seconds", time.perf_counter() - start,
+                                converter="liveblog_slack", item_type=item_type)
+        return converted
+
+    def _items(self, post):
+        for g in post.get("groups", []):
+            if g["id"] != "main":
+                continue
+
+            for item in g["refs"]:
+                yield item
+
     async def convert(self, post):
-        content =  ""
+        fragments = []
+        blocks = []
+        unfurl = False
         images = []
         try:
-            for g in post.get("groups", []):
-                if g["id"] != "main":
-                    continue
-
-                for item in g["refs"]:
-                    if item["item"]["item_type"] == "text":
-                        content += await self._convert_text(item)
-                    elif item["item"]["item_type"] == "quote":
-                        content += await self._convert_quote(item)
-                    elif item["item"]["item_type"] == "image":
-                        img_text, _ = await self._convert_image(item)
-                        content += img_text
-                    elif item["item"]["item_type"] == "embed":
-                        content += await self._convert_embed(item)
+            for item in self._items(post):
+                content, item_blocks = await self._convert_item(item)
+                fragments.append(content)
+                blocks.append(item_blocks)
+                # embeds are shown by unfurling their link
+                unfurl = unfurl or (item["item"]["item_type"] == "embed" and bool(content))
         except Exception as e:
             logger.error("Converting to slack post failed.")
             logger.exception(e)
-        return ConversionResult(content=content)
+        return ConversionResult(content=SlackContent.join(fragments, blocks, unfurl))
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+from html import escape
+from html.parser import HTMLParser
+
+ALLOWED_TAGS = frozenset(["p", "br", "b", "i", "strike", "ul", "li", "ol", "a", "div"])
+ALLOWED_PROTOCOLS = frozenset(["http", "https", "mailto"])
+
+MARKUP = {
+    "b": "*",
+    "/b": "* ",
+    "i": "_",
+    "/i": "_",
+    "strike": "~",
+    "/strike": "~",
+    "li": " • ",
+    "/li": "\n",
+    "/ol": "\n",
+    "/ul": "\n",
+    "/p": "\n",
+    "/div": "\n",
+    "/a": ">",
+}
+
+_SPACES = re.compile(r" {2,}")
+_PROTOCOL = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.\-]*):")
+# applied in order, every replacement sees the result of the previous one
+_QUOTE_FIXES = (("«_", "_«"), ("_»", "»_"), ("«*", "*«"), ("*»", "»*"))
+
+
+class _Tokenizer(HTMLParser):
+    """Splits HTML into a flat list alternating between text and allowed tags.
+
+    Every tag is surrounded by a (possibly empty) text slot, so the tokens at odd
+    positions are tags and the tokens at even positions are escaped text with
+    collapsed spaces. Links are a tuple of ``("a", href)``."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self._text = []
+        self._links = []
+
+    def _flush(self):
+        self.tokens.append(_SPACES.sub(" ", "".join(self._text)))
+        self._text = []
+
+    def _tag(self, tag):
+        self._flush()
+        self.tokens.append(tag)
+
+    def handle_data(self, data):
+        self._text.append(escape(data.replace("\xa0", " "), quote=False))
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ALLOWED_TAGS or tag == "ol":
+            return
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href is not None:
+                protocol = _PROTOCOL.match(href)
+                if protocol and protocol.group(1).lower() not in ALLOWED_PROTOCOLS:
+                    href = None
+            self._links.append(href is not None)
+            if href is not None:
+                self._tag(("a", escape(href, quote=False)))
+        else:
+            self._tag(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag not in ALLOWED_TAGS:
+            return
+        elif tag == "br":
+            self._tag("br")
+        elif tag == "a":
+            if self._links and self._links.pop():
+                self._tag("/a")
+        else:
+            self._tag("/" + tag)
+
+    def close(self):
+        super().close()
+        while self._links:
+            if self._links.pop():
+                self._tag("/a")
+        self._flush()
+
+
+def _move_spaces(tokens, tag):
+    """A space right after an opening tag moves in front of it, a space right \
+       before a closing tag moves behind it. Moved spaces are not moved again."""
+    end_tag = "/" + tag
+    moved = None
+    for x in range(1, len(tokens), 2):
+        if tokens[x] == tag and tokens[x + 1][:1] == " ":
+            tokens[x + 1] = tokens[x + 1][1:]
+            tokens[x - 1] += " "
+        elif tokens[x] == end_tag and tokens[x - 1][-1:] == " " and moved != x - 1:
+            tokens[x - 1] = tokens[x - 1][:-1]
+            if not tokens[x + 1]:
+                moved = x + 1
+            tokens[x + 1] = " " + tokens[x + 1]
+
+
+def _drop_empty(tokens, tag):
+    """Replaces formatting tags without content by a space."""
+    end_tag = "/" + tag
+    length = len(tokens)
+    result = [tokens[0]]
+    x = 1
+    while x < length:
+        if tokens[x] == tag and x + 2 < length and tokens[x + 2] == end_tag and not tokens[x + 1].strip(" "):
+            result[-1] += " " + tokens[x + 3]
+            x += 4
+        else:
+            result.append(tokens[x])
+            result.append(tokens[x + 1])
+            x += 2
+    return result
+
+
+def html_to_mrkdwn(html):
+    """Converts HTML of a liveblog text item to Slack mrkdwn."""
+    tokenizer = _Tokenizer()
+    tokenizer.feed(html)
+    tokenizer.close()
+    tokens = tokenizer.tokens
+    _move_spaces(tokens, "b")
+    _move_spaces(tokens, "i")
+    tokens = _drop_empty(tokens, "b")
+    tokens = _drop_empty(tokens, "i")
+
+    out = [tokens[0]]
+    pending_br = False
+    x = 1
+    length = len(tokens)
+    while x < length:
+        tag = tokens[x]
+        if tag == "br":
+            # pairs of line breaks are merged into one
+            if not pending_br:
+                out.append("\n")
+            pending_br = not pending_br
+        elif tag == "ul":
+            pass
+        elif type(tag) is tuple:
+            out.append("<{}|".format(tag[1]))
+            pending_br = False
+        else:
+            out.append(MARKUP.get(tag, ""))
+            pending_br = False
+        text = tokens[x + 1]
+        if text:
+            out.append(text)
+            pending_br = False
+        x += 2
+
+    content = "".join(out)
+    if "«" in content or "»" in content:
+        for old, new in _QUOTE_FIXES:
+            content = content.replace(old, new)
+    if "*" in content:
+        content = content.replace(" ** ", " ").replace("\n**", " ").replace("*\n*", "\n")
+    return content
+
+
+# a link, a complete formatting run without nested markup or a single mark
+_MRKDWN = re.compile(r"<(http[^>|]*)(?:\|([^>]*))?>?|([*_~])([^*_~<]*)\3|([*_~])")
+_LABEL_MARKS = re.compile(r"[*_~]")
+HTML_MARKUP = {"*": ("<b>", "</b>"), "_": ("<i>", "</i>"), "~": ("<s>", "</s>")}
+
+
+def _mark(char, opened):
+    if char in opened:
+        opened.remove(char)
+        return HTML_MARKUP[char][1]
+    opened.append(char)
+    return HTML_MARKUP[char][0]
+
+
+def mrkdwn_to_html(text, images=()):
+    """Converts Slack mrkdwn *text* to HTML in a single pass, links to one of the *images*
+       become image tags. Formatting left open at the end of *text* gets closed."""
+    opened = []
+
+    def replace(match):
+        url, label, run, run_text, char = match.groups()
+        if run:
+            if run not in opened:
+                start, end = HTML_MARKUP[run]
+                return start + run_text + end
+            # the run starts with the mark closing an outer one
+            return _mark(run, opened) + run_text + _mark(run, opened)
+        elif char:
+            return _mark(char, opened)
+        elif label is None:
+            if url in images:
+                return '<img src="{}" />'.format(url)
+            return '<a href="{0}">{0}</a>'.format(url)
+        label = _LABEL_MARKS.sub(lambda mark: _mark(mark.group(0), opened), label)
+        return '<a href="{}">{}</a>'.format(url, label)
+
+    html = _MRKDWN.sub(replace, text).replace("\n", "<br>")
+    return html + "".join(HTML_MARKUP[char][1] for char in reversed(opened))
@@ -14,8 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
-import re
+import time
 from livebridge.base import BaseConverter, ConversionResult
+from livebridge_slack.converters.mrkdwn import mrkdwn_to_html
+from livebridge_slack.metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
@@ -26,18 +28,14 @@ class SlackScribbleliveConverter(BaseConverter):
 
     async def convert(self, post):
         content =  ""
+        start = time.perf_counter()
         try:
             msg = post.get("message", post)
-            content = msg.get("text", "").strip()
-            for a in msg.get("attachments", []):
-                if a.get("from_url"):
-                    content = content.replace('<{}>'.format(a["from_url"]), '<img src="{}" />'.format(a["from_url"]))
-            content = re.sub(r'\*([^\*]*)\*?', "<b>\\1</b>", content, re.I|re.M)
-            content = re.sub(r'\_([^\_]*)\_?', "<i>\\1</i>", content, re.I|re.M)
-            content = re.sub(r'\~([^\~]*)\~?', "<s>\\1</s>", content, re.I|re.M)
-            content = re.sub(r'\<(http[^\>\|]*)\|([^\>]*)\>?', '<a href="\\1">\\2</a>', content, re.I|re.M)
-            content = re.sub(r'\<(http[^\>\|]*)\>?', '<a href="\\1">\\1</a>', content, re.I|re.M)
-            content = re.sub(r'\n', '<br>', content, re.I|re.M)
+            images = set(a["from_url"] for a in msg.get("attachments", []) if a.get("from_url"))
+            content = mrkdwn_to_html(msg.get("text", "").strip(), images)
+            if Metrics.enabled:
+                Metrics.observe("slack_convert_seconds", time.perf_counter() - start,
+                                converter="slack_scribblelive", item_type="message")
         except Exception as e:
             logger.error("Converting post failed.")
             logger.exception(e)
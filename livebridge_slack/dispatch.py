@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+from collections import OrderedDict
+from livebridge_slack.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher(object):
+    """Hands posts from a receive loop over to a pool of workers, which call the callback.
+
+    Every worker has its own bounded queue. Posts are assigned to a worker by their
+    key, so create, update and delete of the same message are handled in order.
+    :func:`put` blocks while the queue of the worker is full.
+
+    *on_dispatched* gets called with the latest post, which was dispatched together with
+    all posts put before it, whenever that changes."""
+
+    def __init__(self, callback, *, workers=1, maxsize=100, on_dispatched=None):
+        self.callback = callback
+        self.on_dispatched = on_dispatched
+        self.queues = [asyncio.Queue(maxsize=maxsize) for _ in range(max(workers, 1))]
+        self.dispatched = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self._tasks = []
+        # posts in the order they were put, None until dispatched
+        self._inflight = OrderedDict()
+        self._seq = 0
+
+    @property
+    def depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._work(q)) for q in self.queues]
+
+    async def put(self, key, post):
+        queue = self.queues[hash(key) % len(self.queues)]
+        seq = self._seq
+        self._seq += 1
+        self._inflight[seq] = None
+        await queue.put((asyncio.get_event_loop().time(), seq, post))
+
+    def _done(self, seq, post):
+        self._inflight[seq] = post
+        last = None
+        while self._inflight:
+            first = next(iter(self._inflight))
+            if self._inflight[first] is None:
+                break
+            last = self._inflight.pop(first)
+        if last is not None and self.on_dispatched:
+            try:
+                self.on_dispatched(last)
+            except Exception as e:
+                logger.error("Handling dispatched post failed: {}".format(e))
+
+    async def _work(self, queue):
+        loop = asyncio.get_event_loop()
+        while True:
+            received, seq, post = await queue.get()
+            try:
+                lag = loop.time() - received
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+                Metrics.observe("slack_dispatch_lag_seconds", lag)
+                self.dispatched += 1
+                await self.callback([post])
+            except Exception as e:
+                logger.error("Dispatching post failed: {}".format(e))
+                logger.exception(e)
+            finally:
+                self._done(seq, post)
+                queue.task_done()
+
+    async def close(self):
+        """Waits until all queued posts are dispatched, then stops the workers."""
+        for queue in self.queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "dispatched": self.dispatched,
+            "lag_total": self.lag_total,
+            "lag_max": self.lag_max,
+        }
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from aiohttp import web
+from livebridge_slack.common import json_loads
+from livebridge_slack.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+def signature(secret, timestamp, body):
+    """Returns the **X-Slack-Signature** of a request with *body* sent at *timestamp*,
+       see https://api.slack.com/authentication/verifying-requests-from-slack"""
+    base = "v0:{}:".format(timestamp).encode("utf-8") + body
+    return "v0=" + hmac.new(secret.encode("utf-8"), base, hashlib.sha256).hexdigest()
+
+
+class EventReceiver(object):
+    """HTTP endpoint for callbacks of the Slack Events API, shared by all sources of a
+       process listening on the same address.
+
+    Callbacks are verified by their signature and acknowledged right away, the events
+    are queued and handed over to the sources of their channel in order. Events Slack
+    retries, because the acknowledgement got lost, are recognized by their id."""
+
+    # seconds a signed request is valid, older ones are rejected as replays
+    max_age = 300
+
+    # number of event ids remembered to drop retried events
+    seen_size = 10000
+
+    _receivers = {}
+
+    def __init__(self, host, port, path, *, queue_size=1000):
+        self.key = (host, port, path)
+        self.secrets = set()
+        self.sources = {}
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.seen = OrderedDict()
+        self.received = 0
+        self.routed = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.connected = asyncio.Event()
+        self._runner = None
+        self._task = None
+
+    @classmethod
+    def get(cls, source):
+        """Returns the receiver for the address configured for *source*."""
+        key = (source.events_host, source.events_port, source.events_path)
+        if key not in cls._receivers:
+            cls._receivers[key] = cls(*key, queue_size=source.events_queue_size)
+        return cls._receivers[key]
+
+    def add(self, source):
+        """Registers *source* for events of its channel, starts serving on first source."""
+        self.secrets.add(source.signing_secret)
+        self.sources.setdefault(source._channel_id, []).append(source)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def remove(self, source):
+        """Unregisters *source*, stops serving when no source is left."""
+        sources = self.sources.get(source._channel_id, [])
+        if source in sources:
+            sources.remove(source)
+        if not sources:
+            self.sources.pop(source._channel_id, None)
+        if not self.sources:
+            await self.close()
+
+    async def close(self):
+        if EventReceiver._receivers.get(self.key) is self:
+            del EventReceiver._receivers[self.key]
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.connected.clear()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        for sources in list(self.sources.values()):
+            for source in sources:
+                source._disconnected()
+        self.sources = {}
+
+    def verify(self, headers, body):
+        """Checks the signature of a request against the signing secrets of the sources."""
+        timestamp = headers.get("X-Slack-Request-Timestamp", "")
+        try:
+            if abs(time.time() - int(timestamp)) > self.max_age:
+                return False
+        except ValueError:
+            return False
+        given = headers.get("X-Slack-Signature", "")
+        return any(hmac.compare_digest(signature(secret, timestamp, body), given) for secret in self.secrets if secret)
+
+    def _remember(self, event_id):
+        self.seen[event_id] = True
+        while len(self.seen) > self.seen_size:
+            self.seen.popitem(last=False)
+
+    async def handle(self, request):
+        body = await request.read()
+        if not self.verify(request.headers, body):
+            self.rejected += 1
+            Metrics.inc("slack_events_total", result="rejected")
+            return web.Response(status=401)
+        try:
+            # json.loads() of Python 3.5 takes no bytes
+            payload = json_loads(body.decode("utf-8"))
+        except ValueError:
+            return web.Response(status=400)
+
+        if payload.get("type") == "url_verification":
+            return web.json_response({"challenge": payload.get("challenge")})
+        if payload.get("type") != "event_callback" or not isinstance(payload.get("event"), dict):
+            return web.Response()
+        event_id = payload.get("event_id")
+        if event_id and event_id in self.seen:
+            self.duplicates += 1
+            Metrics.inc("slack_events_total", result="duplicate")
+            return web.Response()
+        try:
+            self.queue.put_nowait(payload["event"])
+        except asyncio.QueueFull:
+            # Slack retries later
+            logger.warning("Event queue full, rejecting event {}".format(event_id))
+            return web.Response(status=503)
+        if event_id:
+            self._remember(event_id)
+        self.received += 1
+        Metrics.inc("slack_events_total", result="accepted")
+        return web.Response()
+
+    async def _route(self, event):
+        channel = event.get("channel")
+        if not isinstance(channel, str):
+            return
+        sources = self.sources.get(channel)
+        if not sources:
+            return
+        self.routed += 1
+        for source in sources:
+            await source._handle_msg(dict(event) if len(sources) > 1 else event)
+
+    async def _run(self):
+        host, port, path = self.key
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Receiving Slack events on http://{}:{}{}".format(host, port, path))
+        self.connected.set()
+        while True:
+            event = await self.queue.get()
+            try:
+                await self._route(event)
+            except Exception as e:
+                logger.error("Handling event failed: {}".format(e))
+                logger.exception(e)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import OrderedDict
+
+
+class ChannelHistory(object):
+    """Remembers the latest dispatched messages of a channel as ts -> fingerprint.
+
+    Comparing the channel history against it reveals the messages created, edited
+    or deleted since, without dispatching anything twice."""
+
+    def __init__(self, size=500):
+        self.size = size
+        self.last_ts = None
+        self.seen = OrderedDict()
+
+    @staticmethod
+    def fingerprint(msg):
+        return hash(msg.get("text"))
+
+    @property
+    def oldest(self):
+        """Returns the ts the channel history has to be fetched from."""
+        return min([self.last_ts] + list(self.seen.keys()), key=float)
+
+    def is_dispatched(self, doc):
+        """Checks if the create or update in *doc* was dispatched already."""
+        action = doc.get("livebridge", {}).get("action")
+        msg = doc.get("message", doc)
+        if action == "create":
+            return msg.get("ts") in self.seen
+        elif action == "update":
+            return self.seen.get(msg.get("ts")) == self.fingerprint(msg)
+        return False
+
+    def remember(self, doc):
+        """Keeps track of the dispatched message in *doc*."""
+        action = doc.get("livebridge", {}).get("action")
+        # the ts of a deletion is no message posted, newer messages could be missed otherwise
+        if action != "delete" and doc.get("ts") and (self.last_ts is None or float(doc["ts"]) > float(self.last_ts)):
+            self.last_ts = doc["ts"]
+        if not self.size:
+            return
+        msg = doc.get("message", doc)
+        if action == "delete":
+            self.seen.pop(doc.get("deleted_ts"), None)
+        elif action:
+            self.seen.pop(msg.get("ts"), None)
+            self.seen[msg.get("ts")] = self.fingerprint(msg)
+            while len(self.seen) > self.size:
+                self.seen.popitem(last=False)
+
+    def diff(self, messages, channel_id):
+        """Compares *messages* fetched from the history since :attr:`oldest` with the \
+           remembered ones, returns the missing events as RTM message docs in order."""
+        events = []
+        found = set()
+        newest = self.last_ts
+        for msg in messages:
+            ts = msg.get("ts")
+            found.add(ts)
+            edited = msg.get("edited", {}).get("ts", ts)
+            if float(edited) > float(newest):
+                newest = edited
+            if ts in self.seen:
+                if self.seen[ts] != self.fingerprint(msg):
+                    events.append((float(edited), {
+                        "type": "message", "subtype": "message_changed", "hidden": True,
+                        "channel": channel_id, "message": msg, "ts": edited, "event_ts": edited,
+                        "livebridge": {"action": "update"}}))
+            elif float(ts) > float(self.last_ts):
+                doc = dict(msg, type="message", channel=channel_id, livebridge={"action": "create"})
+                events.append((float(ts), doc))
+        # deletions get the ts of the latest change fetched, not the local clock
+        for ts in [ts for ts in self.seen if ts not in found]:
+            events.append((float("inf"), {
+                "type": "message", "subtype": "message_deleted", "hidden": True,
+                "channel": channel_id, "deleted_ts": ts, "ts": newest, "event_ts": newest,
+                "livebridge": {"action": "delete"}}))
+        return [doc for _, doc in sorted(events, key=lambda event: event[0])]
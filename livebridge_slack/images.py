@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import copy
+import logging
+import os
+import tempfile
+from livebridge_slack.cache import LRUCache
+from livebridge_slack.content import SlackContent
+from livebridge_slack.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageHost(object):
+    """Uploads the images of posts to Slack, so Slack shows its own copy instead of
+       fetching them from the CDN of the source again on every view.
+
+    Images are downloaded by a bounded number of workers, streamed to a temporary file
+    and uploaded once with **files.upload**. The Slack file of every image URL is cached,
+    so an image is never uploaded twice, also when it is requested by several posts
+    at the same time. One host is shared by all targets with the same token."""
+
+    # number of image URLs whose Slack file is remembered
+    cache_size = 10000
+
+    # bytes read at once while downloading
+    chunk_size = 64 * 1024
+
+    _hosts = {}
+
+    def __init__(self, *, workers=4, max_size=20 * 1024 * 1024):
+        self.workers = workers
+        self.max_size = max_size
+        self.files = LRUCache(max_entries=self.cache_size)
+        self.uploaded = 0
+        self.failed = 0
+        self._semaphore = asyncio.Semaphore(workers)
+        self._pending = {}
+
+    @classmethod
+    def get(cls, client, **kwargs):
+        """Returns the host for the token and endpoint of *client*."""
+        key = (client.endpoint, client.token)
+        if key not in cls._hosts:
+            cls._hosts[key] = cls(**kwargs)
+        return cls._hosts[key]
+
+    @classmethod
+    def clear(cls):
+        cls._hosts = {}
+
+    async def rehost(self, client, url):
+        """Returns the Slack file of the image at *url*, uploads it on first use.
+
+        Returns **None**, when the image could not be uploaded."""
+        file = self.files.get(url)
+        if file is not None:
+            Metrics.inc("slack_images_total", result="cached")
+            return file
+        if url not in self._pending:
+            self._pending[url] = asyncio.ensure_future(self._upload(client, url))
+        try:
+            return await asyncio.shield(self._pending[url])
+        finally:
+            if url in self._pending and self._pending[url].done():
+                del self._pending[url]
+
+    async def _download(self, client, url, path):
+        size = 0
+        async with client.session.get(url) as resp:
+            if resp.status != 200:
+                raise IOError("HTTP {}".format(resp.status))
+            with open(path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise IOError("larger than {} bytes".format(self.max_size))
+                    f.write(chunk)
+
+    async def _upload(self, client, url):
+        async with self._semaphore:
+            fd, path = tempfile.mkstemp(prefix="livebridge-slack-", suffix=os.path.splitext(url.split("?")[0])[1])
+            os.close(fd)
+            try:
+                await self._download(client, url, path)
+                resp = await client._request("files.upload", [("token", client.token)], images=[path])
+                file = resp.get("file")
+                if not file or not file.get("id"):
+                    raise IOError("No file in response {}".format(resp))
+                file = {"id": file["id"], "permalink": file.get("permalink")}
+                self.files.set(url, file)
+                self.uploaded += 1
+                Metrics.inc("slack_images_total", result="uploaded")
+                return file
+            except Exception as e:
+                logger.warning("Uploading image {} failed: {}".format(url, e))
+                self.failed += 1
+                Metrics.inc("slack_images_total", result="failed")
+                return None
+            finally:
+                os.remove(path)
+
+    async def rehost_content(self, client, content):
+        """Returns *content* with its images replaced by their Slack files, images not
+           uploaded are kept as they are."""
+        urls = image_urls(content)
+        if not urls:
+            return content
+        files = await asyncio.gather(*[self.rehost(client, url) for url in urls])
+        files = {url: file for url, file in zip(urls, files) if file}
+        if not files:
+            return content
+        fragments = list(content.fragments)
+        for url, file in files.items():
+            if file.get("permalink"):
+                fragments = [fragment.replace(url, file["permalink"]) for fragment in fragments]
+        blocks = None
+        if content.blocks is not None:
+            blocks = copy.deepcopy(content.blocks)
+            for block in _image_blocks(blocks):
+                if block["image_url"] in files:
+                    block["slack_file"] = {"id": files[block.pop("image_url")]["id"]}
+        return SlackContent("".join(fragments), fragments, blocks, content.unfurl)
+
+
+def _image_blocks(blocks):
+    for fragment_blocks in blocks or []:
+        for block in fragment_blocks:
+            if block.get("type") == "image" and block.get("image_url"):
+                yield block
+
+
+def image_urls(content):
+    """Returns the URLs of the images in the blocks of *content*, in order."""
+    urls = []
+    for block in _image_blocks(getattr(content, "blocks", None)):
+        if block["image_url"] not in urls:
+            urls.append(block["image_url"])
+    return urls
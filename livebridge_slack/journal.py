@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import logging
+import sqlite3
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DELIVERED = "delivered"
+
+
+def fingerprint(text):
+    """Returns a fingerprint of a message text, stable across restarts."""
+    return hashlib.md5((text or "").strip().encode("utf-8")).hexdigest()
+
+
+class DeliveryJournal(object):
+    """Local journal of posts sent to Slack, stored in a SQLite file.
+
+    A post is recorded as *pending* before it gets sent and as *delivered* with its
+    ts once Slack confirmed it. All entries are kept in memory as well, so lookups
+    don't touch the file, with the pending posts and the delivered ts indexed per target."""
+
+    _journals = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS deliveries (
+            target_id TEXT NOT NULL,
+            post_id TEXT NOT NULL,
+            state TEXT NOT NULL,
+            ts TEXT,
+            fingerprint TEXT,
+            created REAL NOT NULL,
+            PRIMARY KEY (target_id, post_id))""")
+        self.db.commit()
+        self.entries = {}
+        self._pending = {}
+        self._delivered_ts = {}
+        for row in self.db.execute("SELECT target_id, post_id, state, ts, fingerprint, created FROM deliveries"):
+            self._index(row[0], row[1], row[2:])
+
+    @classmethod
+    def get(cls, path):
+        """Returns the journal stored at *path*, shared by all targets using it."""
+        if path not in cls._journals:
+            cls._journals[path] = cls(path)
+        return cls._journals[path]
+
+    @classmethod
+    def clear(cls):
+        for journal in cls._journals.values():
+            journal.close()
+        cls._journals = {}
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, target_id, post_id):
+        """Returns **(state, ts, fingerprint, created)** of the post, or **None** if unknown."""
+        return self.entries.get((target_id, post_id))
+
+    def _index(self, target_id, post_id, entry):
+        self._unindex(target_id, post_id)
+        self.entries[(target_id, post_id)] = entry
+        if entry[0] == PENDING:
+            self._pending.setdefault(target_id, {})[post_id] = entry
+        elif entry[0] == DELIVERED:
+            self._delivered_ts.setdefault(target_id, set()).add(entry[1])
+
+    def _unindex(self, target_id, post_id):
+        entry = self.entries.pop((target_id, post_id), None)
+        if entry is None:
+            return None
+        if entry[0] == PENDING:
+            self._pending[target_id].pop(post_id, None)
+        elif entry[0] == DELIVERED:
+            self._delivered_ts[target_id].discard(entry[1])
+        return entry
+
+    def _write(self, target_id, post_id, entry):
+        self._index(target_id, post_id, entry)
+        self.db.execute("INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?)", (target_id, post_id) + entry)
+        self.db.commit()
+
+    def pending(self, target_id, post_id, text):
+        self._write(target_id, post_id, (PENDING, None, fingerprint(text), time.time()))
+
+    def delivered(self, target_id, post_id, ts):
+        entry = self.entries.get((target_id, post_id))
+        self._write(target_id, post_id, (DELIVERED, ts, entry[2] if entry else None, entry[3] if entry else time.time()))
+
+    def remove(self, target_id, post_id):
+        if self._unindex(target_id, post_id):
+            self.db.execute("DELETE FROM deliveries WHERE target_id=? AND post_id=?", (target_id, post_id))
+            self.db.commit()
+
+    def pending_entries(self, target_id):
+        """Returns **{post_id: (state, ts, fingerprint, created)}** of all pending posts of the target."""
+        return dict(self._pending.get(target_id, {}))
+
+    def is_delivered(self, target_id, ts):
+        """Checks if the message with *ts* was recorded as delivered for the target."""
+        return ts in self._delivered_ts.get(target_id, ())
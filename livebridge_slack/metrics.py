@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import bisect
+import logging
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets in seconds, as used by the Prometheus clients
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "slack_requests_total": "Requests to the Slack API by method, HTTP status and ok field.",
+    "slack_request_seconds": "Latency of requests to the Slack API by method.",
+    "slack_rate_limited_total": "Requests answered with HTTP 429 by method.",
+    "slack_retry_wait_seconds": "Retry-After waits of rate limited requests by method.",
+    "slack_ratelimit_wait_seconds": "Time requests waited for the local rate limiter by method.",
+    "slack_ws_frames_received_total": "Frames received via the RTM websocket.",
+    "slack_ws_frames_accepted_total": "Messages accepted for dispatching by the sources.",
+    "slack_ws_reconnects_total": "Reconnects of the RTM websocket.",
+    "slack_events_total": "Callbacks of the Events API by result.",
+    "slack_convert_seconds": "Time converting an item by converter and item type.",
+    "slack_dispatch_lag_seconds": "Time posts waited in the dispatch queue.",
+    "slack_images_total": "Images of posts re-hosted at Slack by result.",
+    "slack_updates_skipped_total": "Updates not sent, because the content was unchanged.",
+}
+
+
+class Histogram(object):
+    """Counts of observed values per bucket, with their sum."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns **(upper bound, count)** per bucket as in the Prometheus text format."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsSink(object):
+    """Receives the metrics of the plugin, implement :func:`inc` and :func:`observe`
+       to forward them, for example to statsd."""
+
+    def inc(self, name, value=1, **labels):
+        raise NotImplementedError()
+
+    def observe(self, name, value, **labels):
+        raise NotImplementedError()
+
+
+class MemorySink(MetricsSink):
+    """Keeps counters and histograms in memory, renders them in the Prometheus text format."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def value(self, name, **labels):
+        """Returns the value of a counter, 0 if never incremented."""
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name, **labels):
+        """Returns a :class:`Histogram`, **None** if nothing was observed."""
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def clear(self):
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ""
+        return "{{{}}}".format(",".join('{}="{}"'.format(
+            k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels))
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        families = {}
+        for (name, labels), value in self.counters.items():
+            families.setdefault((name, "counter"), []).append((labels, value))
+        for (name, labels), histogram in self.histograms.items():
+            families.setdefault((name, "histogram"), []).append((labels, histogram))
+        for (name, kind), samples in sorted(families.items()):
+            if name in HELP:
+                lines.append("# HELP {} {}".format(name, HELP[name]))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, sample in sorted(samples, key=lambda s: s[0]):
+                if kind == "counter":
+                    lines.append("{}{} {}".format(name, self._labels(labels), sample))
+                    continue
+                for bound, count in sample.cumulative():
+                    lines.append("{}_bucket{} {}".format(name, self._labels(labels, [("le", bound)]), count))
+                lines.append("{}_bucket{} {}".format(name, self._labels(labels, [("le", "+Inf")]), sample.count))
+                lines.append("{}_sum{} {}".format(name, self._labels(labels), sample.sum))
+                lines.append("{}_count{} {}".format(name, self._labels(labels), sample.count))
+        return "\n".join(lines) + "\n"
+
+
+class Metrics(object):
+    """Process-wide registry of the metrics sink, all instrumentation reports to it.
+
+    Instrumented code checks :attr:`enabled` before measuring anything, so disabled
+    metrics cost an attribute lookup only."""
+
+    enabled = True
+    sink = MemorySink()
+    _server = None
+
+    @classmethod
+    def configure(cls, config):
+        """Applies the *metrics* section of a source or target config."""
+        if not config:
+            return
+        if config.get("enabled", True) is False:
+            cls.set_sink(None)
+        if config.get("port") and cls._server is None:
+            cls._server = asyncio.ensure_future(cls.serve(config.get("host", "0.0.0.0"), config["port"]))
+
+    @classmethod
+    def set_sink(cls, sink):
+        """Replaces the sink, **None** disables metrics."""
+        cls.sink = sink
+        cls.enabled = sink is not None
+
+    @classmethod
+    def inc(cls, name, value=1, **labels):
+        if cls.enabled:
+            cls.sink.inc(name, value, **labels)
+
+    @classmethod
+    def observe(cls, name, value, **labels):
+        if cls.enabled:
+            cls.sink.observe(name, value, **labels)
+
+    @classmethod
+    async def handle(cls, request):
+        if not isinstance(cls.sink, MemorySink):
+            return web.Response(status=404, text="Metrics are not kept in memory.\n")
+        return web.Response(body=cls.sink.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    @classmethod
+    async def serve(cls, host, port):
+        """Serves the metrics in the Prometheus text format at http://*host*:*port*/metrics."""
+        app = web.Application()
+        app.router.add_get("/metrics", cls.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Serving metrics on http://{}:{}/metrics".format(host, port))
+        return runner
+
+    @classmethod
+    async def close(cls):
+        """Stops serving the metrics."""
+        server, cls._server = cls._server, None
+        if server is None:
+            return
+        try:
+            runner = await server
+        except Exception as e:
+            logger.error("Serving metrics failed: {}".format(e))
+            return
+        await runner.cleanup()
+
+    @classmethod
+    def clear(cls):
+        cls.enabled = True
+        cls.sink = MemorySink()
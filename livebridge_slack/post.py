@@ -19,37 +19,71 @@ from livebridge.base import BasePost
 
 logger = logging.getLogger(__name__)
 
+# fields of an RTM message doc, which are read by converters and targets
+DOC_FIELDS = ("type", "subtype", "channel", "user", "text", "attachments", "files", "message",
+              "ts", "edited", "deleted_ts", "livebridge")
+MESSAGE_FIELDS = ("type", "subtype", "user", "text", "attachments", "files", "ts", "edited")
+
+
 class SlackPost(BasePost):
+    """Post of a Slack message.
+
+    Only the fields of the message doc needed for the conversion are kept, for example
+    the *previous_message* of an edit gets dropped. Id, channel, timestamps and action
+    are read once, the datetimes are created on first access."""
+
+    # BasePost isn't slotted, so posts still have a __dict__. As long as only these
+    # attributes are set, it never gets created.
+    __slots__ = ("data", "content", "images", "_existing", "_target_id", "_target_doc",
+                 "_id", "_source_id", "_created_ts", "_updated_ts", "_action", "_created", "_updated")
 
     source = "slack"
 
+    def __init__(self, data, *, content="", images=[]):
+        data = {k: data[k] for k in DOC_FIELDS if k in data}
+        message = data.get("message")
+        if message is not None:
+            data["message"] = message = {k: message[k] for k in MESSAGE_FIELDS if k in message}
+        super().__init__(data, content=content, images=images)
+        self._id = data.get("deleted_ts", (message or data).get("ts"))
+        self._source_id = data.get("channel")
+        self._created_ts = (message or data).get("ts")
+        self._updated_ts = data.get("ts")
+        self._action = data.get("livebridge", {}).get("action")
+        self._created = None
+        self._updated = None
+
     @property
     def id(self):
-        return self.data.get("deleted_ts", self.data.get("message", self.data).get("ts"))
+        return self._id
 
     @property
     def source_id(self):
-       return self.data.get("channel")
+        return self._source_id
 
     @property
     def created(self):
-       return datetime.utcfromtimestamp(float(self.data.get("message", self.data).get("ts")))
+        if self._created is None:
+            self._created = datetime.utcfromtimestamp(float(self._created_ts))
+        return self._created
 
     @property
     def updated(self):
-       return datetime.utcfromtimestamp(float(self.data.get("ts", None)))
+        if self._updated is None:
+            self._updated = datetime.utcfromtimestamp(float(self._updated_ts))
+        return self._updated
 
     @property
     def is_update(self):
-        return (self.data.get("livebridge", {}).get("action") == "update")
+        return self._action == "update"
 
     @property
     def is_deleted(self):
-        return (self.data.get("livebridge", {}).get("action") == "delete")
+        return self._action == "delete"
 
     @property
     def is_sticky(self):
-       return False
+        return False
 
     def get_action(self):
-        return self.data.get("livebridge", {}).get("action", None)
+        return self._action
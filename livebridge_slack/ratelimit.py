@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+from livebridge_slack.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+# requests per minute and burst size, see https://api.slack.com/docs/rate-limits
+TIER_1 = (1, 1)
+TIER_2 = (20, 3)
+TIER_3 = (50, 5)
+TIER_4 = (100, 10)
+
+METHOD_LIMITS = {
+    "chat.postMessage": (60, 3),
+    "chat.update": TIER_3,
+    "chat.delete": TIER_3,
+    "channels.list": TIER_2,
+    "conversations.history": TIER_3,
+    "files.upload": TIER_2,
+    "rtm.start": TIER_1,
+}
+
+# methods limited per channel instead of per workspace
+PER_CHANNEL = ("chat.postMessage",)
+
+
+class RateLimited(Exception):
+    """Slack answered with HTTP 429."""
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limited, retry after {}s".format(retry_after))
+        self.retry_after = retry_after
+
+
+class RateLimiter(object):
+    """Token bucket with a FIFO queue for the requests of one Slack API method.
+
+    Requests are started in order of arrival as tokens become available, the lock is
+    only held while waiting for a token, so several requests can be in flight at once.
+    A request answered with HTTP 429 is retried after *Retry-After* seconds instead of
+    being dropped, no request is started before that."""
+
+    max_retries = 10
+
+    def __init__(self, per_minute, burst, method=None):
+        self.method = method
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.blocked_until = 0
+        self.queued = 0
+        self.requests = 0
+        self.limited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = asyncio.Lock()
+        self._updated = asyncio.get_event_loop().time()
+
+    def _delay(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def _take(self):
+        loop = asyncio.get_event_loop()
+        delay = self._delay(loop.time())
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._delay(loop.time())
+        self.tokens -= 1
+
+    async def run(self, func):
+        """Runs coroutine function *func* when the limit allows it."""
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        self.queued += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                async with self._lock:
+                    await self._take()
+                if attempt == 0:
+                    self._waited(loop.time() - start)
+                self.requests += 1
+                try:
+                    return await func()
+                except RateLimited as e:
+                    logger.warning(e)
+                    self.limited += 1
+                    self.blocked_until = max(self.blocked_until, loop.time() + e.retry_after)
+                    Metrics.observe("slack_retry_wait_seconds", e.retry_after, method=self.method)
+            logger.error("Request dropped after {} rate limited retries.".format(self.max_retries))
+            return {}
+        finally:
+            self.queued -= 1
+
+    def _waited(self, seconds):
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        Metrics.observe("slack_ratelimit_wait_seconds", seconds, method=self.method)
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "requests": self.requests,
+            "limited": self.limited,
+            "wait_total": self.wait_total,
+            "wait_max": self.wait_max,
+        }
+
+
+class Scheduler(object):
+    """Process-wide registry of rate limiters per token, method and channel."""
+
+    _limiters = {}
+    _loop = None
+
+    @classmethod
+    def get(cls, token, method, channel=None):
+        loop = asyncio.get_event_loop()
+        if cls._loop is not loop:
+            cls._limiters = {}
+            cls._loop = loop
+        key = (token, method, channel if method in PER_CHANNEL else None)
+        if key not in cls._limiters:
+            per_minute, burst = METHOD_LIMITS.get(method, TIER_3)
+            cls._limiters[key] = RateLimiter(per_minute, burst, method)
+        return cls._limiters[key]
+
+    @classmethod
+    def stats(cls):
+        """Returns queue depth, wait times and 429 counts per limiter."""
+        return {key: limiter.stats() for key, limiter in cls._limiters.items()}
+
+    @classmethod
+    def clear(cls):
+        cls._limiters = {}
+        cls._loop = None
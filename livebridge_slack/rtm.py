@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+import random
+import websockets
+from livebridge_slack.common import SlackClient, json_loads
+from livebridge_slack.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class RTMConnection(object):
+    """One RTM websocket per token, shared by all sources listening with that token.
+
+    Every frame is parsed once and handed over to the sources registered for its channel.
+    The websocket gets closed when the last source is removed.
+
+    Failing connections are reconnected with an exponential backoff, a silent websocket
+    gets pinged to detect dead connections. After reconnecting the sources replay what
+    they missed in the meantime."""
+
+    # reconnect delays in seconds, doubled per failed attempt
+    backoff_base = 1
+    backoff_max = 60
+
+    # seconds without any frame before pinging, and to wait for the pong
+    heartbeat_interval = 30
+    heartbeat_timeout = 10
+
+    _connections = {}
+
+    def __init__(self, endpoint, token):
+        self.key = (endpoint, token)
+        self.client = SlackClient(config={"auth": {"token": token}, "endpoint": endpoint})
+        self.sources = {}
+        self.websocket = None
+        self.frames = 0
+        self.routed = 0
+        self.reconnects = 0
+        self.connected = asyncio.Event()
+        self._attempts = 0
+        self._task = None
+
+    @classmethod
+    def get(cls, client):
+        """Returns the connection for the token and endpoint of *client*."""
+        key = (client.endpoint, client.token)
+        if key not in cls._connections:
+            cls._connections[key] = cls(client.endpoint, client.token)
+        return cls._connections[key]
+
+    def add(self, source):
+        """Registers *source* for messages of its channel, connects on first source."""
+        self.sources.setdefault(source._channel_id, []).append(source)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def remove(self, source):
+        """Unregisters *source*, disconnects when no source is left."""
+        sources = self.sources.get(source._channel_id, [])
+        if source in sources:
+            sources.remove(source)
+        if not sources:
+            self.sources.pop(source._channel_id, None)
+        if not self.sources:
+            await self.close()
+
+    async def close(self):
+        if RTMConnection._connections.get(self.key) is self:
+            del RTMConnection._connections[self.key]
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.websocket:
+            await self.websocket.close(reason="Stopping bridge")
+            self.websocket = None
+        # let remaining sources stop listening
+        for sources in list(self.sources.values()):
+            for source in sources:
+                source._disconnected()
+        self.sources = {}
+        await self.client.close()
+
+    async def _get_ws_url(self):
+        streams = await self.client._request("rtm.start", [("token", self.client.token)])
+        return streams.get("url")
+
+    async def _route(self, frame):
+        self.frames += 1
+        Metrics.inc("slack_ws_frames_received_total")
+        # cheap check before parsing, only messages are of interest
+        if '"message"' not in frame:
+            return
+        msg = json_loads(frame)
+        channel = msg.get("channel") if isinstance(msg, dict) else None
+        # channel_joined, im_created and the like carry the channel as an object
+        if not isinstance(channel, str):
+            return
+        sources = self.sources.get(channel)
+        if not sources:
+            return
+        self.routed += 1
+        for source in sources:
+            await source._handle_msg(dict(msg) if len(sources) > 1 else msg)
+
+    def _backoff(self):
+        """Returns the delay before the next reconnect, with jitter."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** self._attempts)
+        self._attempts += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _recv(self):
+        """Receives the next frame, pings the server when nothing arrived for a while."""
+        while True:
+            try:
+                return await asyncio.wait_for(self.websocket.recv(), self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                pong = await self.websocket.ping()
+                try:
+                    await asyncio.wait_for(pong, self.heartbeat_timeout)
+                except asyncio.TimeoutError:
+                    raise ConnectionError("No pong received within {}s".format(self.heartbeat_timeout))
+
+    async def _backfill(self):
+        for sources in list(self.sources.values()):
+            for source in list(sources):
+                try:
+                    await source._backfill()
+                except Exception as e:
+                    logger.error("Backfill of {} failed: {}".format(source.channel, e))
+
+    async def _disconnect(self):
+        self.connected.clear()
+        websocket, self.websocket = self.websocket, None
+        if websocket:
+            try:
+                await asyncio.wait_for(websocket.close(), self.heartbeat_timeout)
+            except Exception as e:
+                logger.debug("Closing websocket failed: {}".format(e))
+
+    async def _run(self):
+        connected = False
+        while self.sources:
+            try:
+                wss_url = await self._get_ws_url()
+                if not wss_url:
+                    raise ConnectionError("No websocket url received.")
+                logger.info("Connecting to {}".format(wss_url))
+                self.websocket = await websockets.connect(wss_url)
+                if connected:
+                    self.reconnects += 1
+                    Metrics.inc("slack_ws_reconnects_total")
+                    await self._backfill()
+                connected = True
+                self.connected.set()
+                self._attempts = 0
+                # frames received before the connection closed are still handed out,
+                # then ConnectionClosed is raised
+                while True:
+                    frame = await self._recv()
+                    try:
+                        await self._route(frame)
+                    except asyncio.CancelledError:
+                        raise
+                    except ValueError as e:
+                        logger.debug("Failing inspection of msg: {}".format(e))
+                    except Exception as e:
+                        # one broken frame must not tear down the connection of all channels
+                        logger.error("Routing frame failed: {}".format(e))
+            except asyncio.CancelledError:
+                raise
+            except websockets.exceptions.ConnectionClosed as e:
+                logger.error("Websocket connection closed: {}".format(e))
+            except Exception as e:
+                logger.error("Exception listening to websocket: {}".format(e))
+            await self._disconnect()
+            if self.sources:
+                delay = self._backoff()
+                logger.debug("Reconnecting in {:.1f}s...".format(delay))
+                await asyncio.sleep(delay)
+        self._task = None
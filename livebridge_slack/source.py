@@ -15,11 +15,17 @@
 # limitations under the License.
 import asyncio
 import logging
-import websockets
-import json
+import time
+from calendar import timegm
+from livebridge_slack.checkpoint import CheckpointStore
 from livebridge_slack.common import SlackClient
+from livebridge_slack.dispatch import Dispatcher
+from livebridge_slack.events import EventReceiver
+from livebridge_slack.history import ChannelHistory
+from livebridge_slack.metrics import Metrics
 from livebridge_slack.post import SlackPost
-from livebridge.base import StreamingSource
+from livebridge_slack.rtm import RTMConnection
+from livebridge.base import PollingSource, StreamingSource
 
 
 logger = logging.getLogger(__name__)
@@ -29,60 +35,208 @@ class SlackSource(SlackClient, StreamingSource):
 
     type = "slack"
 
-    async def _get_ws_url(self):
-        url = "{}rtm.start".format(self.endpoint, None)
-        streams = await self._post(url, [("token", self.token)])
-        wss_url = streams.get("url")
-        return wss_url
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self.dispatch_workers = config.get("dispatch_workers", 1)
+        self.dispatch_queue_size = config.get("dispatch_queue_size", 100)
+        self.dispatcher = None
+        self.history = ChannelHistory(config.get("backfill_size", 500))
+        self.checkpoint = CheckpointStore.get(config["checkpoint"]) if config.get("checkpoint") else None
+        self.checkpoint_key = config.get("checkpoint_key")
+        self.connection = None
+        self._listening = None
+        self._resuming = None
+        self._held = None
 
-    async def _inspect_msg(self, msg_str):
+    def _inspect_doc(self, msg):
+        msg["livebridge"] = {}
+        if msg.get("type") == "message" and msg.get("channel") == self._channel_id:
+            if not msg.get("hidden"):
+                msg["livebridge"]["action"] = "create"
+            elif msg.get("subtype") == "message_changed":
+                if msg.get("message") and not msg["message"].get("attachements"):
+                    msg["livebridge"]["action"] = "update"
+            elif msg.get("subtype") == "message_deleted":
+                msg["livebridge"]["action"] = "delete"
+            if Metrics.enabled and msg["livebridge"]:
+                Metrics.inc("slack_ws_frames_accepted_total", action=msg["livebridge"]["action"])
+        else:
+            logger.debug("DATA: {}".format(msg))
+            return None
+        return msg
+
+    async def _handle_msg(self, msg):
+        if self._held is not None:
+            # live messages wait for the replay, or history.diff() would skip what was missed
+            self._held.append(msg)
+            return
+        await self._dispatch_msg(msg)
+
+    async def _dispatch_msg(self, msg):
+        doc = self._inspect_doc(msg)
+        if doc and not self.history.is_dispatched(doc):
+            self.history.remember(doc)
+            post = SlackPost(doc)
+            await self.dispatcher.put(post.id, post)
+
+    async def _backfill(self):
+        """Replays creates, updates and deletes missed while being disconnected, in order."""
+        if not self.history.size or self.history.last_ts is None:
+            return
+        await self._replay_history()
+
+    async def _replay_history(self):
+        oldest = self.history.oldest
+        messages = await self._history(oldest)
+        if messages is None:
+            logger.warning("Backfill of {} since {} failed.".format(self.channel, oldest))
+            return
+        docs = self.history.diff(messages, self._channel_id)
+        logger.info("Backfilling {} missed events of {}".format(len(docs), self.channel))
+        for doc in docs:
+            await self._dispatch_msg(doc)
+
+    def _dispatched(self, post):
+        ts = post.data.get("ts")
+        if ts:
+            self.checkpoint.update(self.checkpoint_key, ts)
+
+    async def _resume(self):
+        """Fetches the messages posted since the checkpoint, once connected.
+
+        Live messages received meanwhile are held back and dispatched afterwards."""
         try:
-            msg = json.loads(msg_str)
-            msg["livebridge"] = {}
-            if msg.get("type") == "message" and msg.get("channel") == await self.channel_id:
-                if not msg.get("hidden"):
-                    msg["livebridge"]["action"] = "create"
-                elif msg.get("subtype") == "message_changed":
-                    if msg.get("message") and not msg["message"].get("attachements"):
-                        msg["livebridge"]["action"] = "update"
-                elif msg.get("subtype") == "message_deleted":
-                    msg["livebridge"]["action"] = "delete"
-            else:
-                logger.debug("DATA: {}".format(msg_str))
-                return None
-            return msg
+            await self.connection.connected.wait()
+            logger.info("Resuming {} from checkpoint {}".format(self.channel, self.history.last_ts))
+            await self._replay_history()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.debug("Failing inspection of msg: {}".format(e))
-        return None
+            logger.error("Resuming {} failed: {}".format(self.channel, e))
+        finally:
+            while self._held:
+                await self._dispatch_msg(self._held.pop(0))
+            self._held = None
 
-    def reconnect(self, callback):
-        logger.debug("Reconnecting...")
-        asyncio.ensure_future(self.listen(callback))
+    def _disconnected(self):
+        if self._listening and not self._listening.done():
+            self._listening.set_result(True)
+
+    def _get_connection(self):
+        return RTMConnection.get(self)
 
     async def listen(self, callback):
+        self.dispatcher = Dispatcher(callback, workers=self.dispatch_workers, maxsize=self.dispatch_queue_size,
+                                     on_dispatched=self._dispatched if self.checkpoint is not None else None)
+        self.dispatcher.start()
         try:
-            wss_url = await self._get_ws_url()
             channel_id = await self.channel_id
             logger.info("Listening to ChannelID: {}".format(channel_id))
-            logger.info("Connecting to {}".format(wss_url))
-            self.websocket = await websockets.connect(wss_url)
-            while self.websocket.open:
-                msg = await self.websocket.recv()
-                doc = await self._inspect_msg(msg)
-                if doc:
-                    asyncio.ensure_future(callback([SlackPost(doc)]))
-        except ConnectionRefusedError as e:
-            logger.error("Exception listening to websocket {} {}: {}".format(self.type, self.channel, e))
-            asyncio.get_event_loop().call_later(5, self.reconnect, callback)
-        except websockets.exceptions.ConnectionClosed as e:
-            logger.error("Webocket connection closed: {} {} {}".format(self.type, self.channel, e))
-            if e.code == 1006:
-                asyncio.get_event_loop().call_later(5, self.reconnect, callback)
+            self._listening = asyncio.get_event_loop().create_future()
+            self.connection = self._get_connection()
+            if self.checkpoint is not None:
+                self.checkpoint_key = self.checkpoint_key or channel_id
+                last_ts = self.checkpoint.lookup(self.checkpoint_key)
+                if last_ts and self.history.last_ts is None:
+                    self.history.last_ts = last_ts
+                    self._held = []
+                    self._resuming = asyncio.ensure_future(self._resume())
+            self.connection.add(self)
+            await self._listening
         except Exception as e:
             logger.error("Exception listening to websocket {} {} {}".format(self.type, self.channel, e))
+        if self._resuming:
+            self._resuming.cancel()
+            self._resuming = None
+        await self.dispatcher.close()
+        if self.checkpoint is not None:
+            self.checkpoint.flush()
         return True
 
     async def stop(self):
         logger.debug("Stopping slack websocket")
-        asyncio.ensure_future(self.websocket.close(reason="Stopping bridge"))
+        if self.connection:
+            await self.connection.remove(self)
+            self.connection = None
+        self._disconnected()
+        await self.close()
+        return True
+
+
+class SlackEventsSource(SlackSource):
+    """Receives the messages of the channel as callbacks of the Slack Events API instead
+       of via RTM, so several bridge processes can share the load behind a reverse proxy."""
+
+    type = "slack_events"
+
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self.signing_secret = config.get("signing_secret")
+        self.events_host = config.get("events_host", "0.0.0.0")
+        self.events_port = config.get("events_port", 3000)
+        self.events_path = config.get("events_path", "/slack/events")
+        self.events_queue_size = config.get("events_queue_size", 1000)
+        if not self.signing_secret:
+            logger.warning("No signing_secret for {}, all events will be rejected.".format(self.source_id))
+
+    def _get_connection(self):
+        return EventReceiver.get(self)
+
+
+class SlackPollingSource(SlackClient, PollingSource):
+    """Polls the channel history instead of listening to the RTM websocket.
+
+    Edits and deletions are detected by comparing the history with the latest
+    messages seen. Every poll without any change doubles the time until the
+    history gets fetched again, up to **max_poll_interval**."""
+
+    type = "slack_polling"
+
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self.history = ChannelHistory(config.get("backfill_size", 500))
+        self.poll_interval = config.get("poll_interval", 10)
+        self.max_poll_interval = config.get("max_poll_interval", 600)
+        self.interval = 0
+        self._next_poll = 0
+
+    async def _get_oldest(self):
+        """Returns the ts to fetch the history from, the first one derived from *last_updated*."""
+        if self.history.last_ts is None:
+            self.last_updated = await self.get_last_updated(await self.channel_id)
+            if self.last_updated:
+                ts = timegm(self.last_updated.utctimetuple()) + self.last_updated.microsecond / 1000000
+            else:
+                ts = time.time()
+            self.history.last_ts = "{:.6f}".format(ts)
+        return self.history.oldest
+
+    def _schedule(self, active):
+        """Polls again on the next call when something changed, backs off on idle channels."""
+        if active:
+            self.interval = 0
+        else:
+            self.interval = min(self.max_poll_interval, max(self.interval * 2, self.poll_interval))
+        self._next_poll = time.monotonic() + self.interval
+
+    async def poll(self):
+        if time.monotonic() < self._next_poll:
+            return []
+        posts = []
+        try:
+            oldest = await self._get_oldest()
+            messages = await self._history(oldest)
+            if messages is None:
+                logger.warning("Polling {} since {} failed.".format(self.channel, oldest))
+            else:
+                for doc in self.history.diff(messages, self._channel_id):
+                    self.history.remember(doc)
+                    posts.append(SlackPost(doc))
+        except Exception as e:
+            logger.error("Polling {} failed: {}".format(self.channel, e))
+        self._schedule(len(posts) > 0)
+        return posts
+
+    async def stop(self):
+        await self.close()
         return True
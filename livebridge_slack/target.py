@@ -13,9 +13,20 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
+import hashlib
+import json
 import logging
+import time
+from collections import OrderedDict
 from livebridge.base import BaseTarget, TargetResponse
+from livebridge.components import get_converter
+from livebridge_slack.cache import LRUCache
 from livebridge_slack.common import SlackClient
+from livebridge_slack.content import split_blocks, split_content
+from livebridge_slack.images import ImageHost
+from livebridge_slack.journal import DELIVERED, PENDING, DeliveryJournal, fingerprint
+from livebridge_slack.metrics import Metrics
 
 
 logger = logging.getLogger(__name__)
@@ -25,19 +36,192 @@ class SlackTarget(SlackClient, BaseTarget):
 
     type = "slack" 
 
+    # seconds the clock of Slack may differ, when matching journal entries with the history
+    reconcile_margin = 10
+
+    # seconds a post stays pending in the journal, older ones aren't looked up in the history anymore
+    reconcile_max_age = 86400
+
+    # number of messages whose content fingerprint is remembered, for target docs without one
+    fingerprint_cache_size = 10000
+
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self.update_window = config.get("update_window", 0)
+        self.max_length = config.get("max_length", 4000)
+        self.blocks = config.get("blocks", False)
+        self.journal = DeliveryJournal.get(config["journal"]) if config.get("journal") else None
+        self.image_host = ImageHost.get(self, workers=config.get("rehost_workers", 4)) \
+            if config.get("rehost_images") else None
+        self.updates_coalesced = 0
+        self.updates_dropped = 0
+        self.updates_skipped = 0
+        self.fingerprints = LRUCache(max_entries=self.fingerprint_cache_size)
+        # target docs of messages updated after update_window, livebridge only got the one before
+        self.updated_docs = LRUCache(max_entries=self.fingerprint_cache_size)
+        self._pending_updates = {}
+        self._reconciled = False
+
     def get_id_at_target(self, post):
         id_at_target = None
         if post.target_doc:
             id_at_target = post.target_doc.get("ts")
         return id_at_target
 
+    def _get_chunk_ids(self, target_doc, id_at_target):
+        """Returns the ts of all messages a post was split into, starting with *id_at_target*."""
+        chunks = (target_doc or {}).get("chunks")
+        if chunks and chunks[0] == id_at_target:
+            return list(chunks)
+        return [id_at_target]
+
+    def _get_chunks(self, content):
+        """Returns the params of the messages *content* gets sent with, split when too long."""
+        if self.blocks and getattr(content, "blocks", None):
+            return [{
+                "text": text,
+                "blocks": blocks,
+                "unfurl_links": content.unfurl,
+                "unfurl_media": content.unfurl,
+            } for text, blocks in split_blocks(content, self.max_length)]
+        return [{"text": chunk, "unfurl_links": True} for chunk in split_content(content, self.max_length)]
+
+    @staticmethod
+    def _fingerprint(chunks):
+        """Returns a hash of the messages *chunks* get sent as."""
+        return hashlib.md5(json.dumps(chunks, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _sent(self, resp, chunks):
+        """Returns *resp* with the fingerprint of *chunks*, when they got sent."""
+        if not resp.get("ts"):
+            return resp
+        digest = self._fingerprint(chunks)
+        self.fingerprints.set(resp["ts"], digest)
+        return dict(resp, fingerprint=digest)
+
+    async def _rehost(self, content):
+        """Returns *content* with its images uploaded to Slack, when enabled."""
+        if self.image_host is None:
+            return content
+        return await self.image_host.rehost_content(self, content)
+
+    async def _send(self, method, params):
+        """Calls *method* for the channel, messages with blocks are sent as JSON."""
+        if "blocks" in params:
+            return await self._request_json(method, dict(params, channel=await self.channel_id))
+        return await self._request(method, await self._build_post_data(params))
+
+    async def _post_chunks(self, chunks):
+        """Sends every chunk as a message, returns the response of the first message,
+           with the ts of all messages as *chunks*, when there is more than one."""
+        first = {}
+        sent = []
+        for chunk in chunks:
+            resp = await self._send("chat.postMessage", chunk)
+            if not resp.get("ts"):
+                logger.error("Posting chunk {} of {} to {} failed.".format(len(sent) + 1, len(chunks), self.target_id))
+                break
+            sent.append(resp["ts"])
+            first = first or resp
+        if len(sent) > 1:
+            first = dict(first, chunks=sent)
+        return first
+
+    async def _send_message(self, post, chunks):
+        if self.journal is not None:
+            self.journal.pending(self.target_id, post.id, chunks[0]["text"])
+        resp = self._sent(await self._post_chunks(chunks), chunks)
+        if self.journal is not None and resp.get("ts"):
+            self.journal.delivered(self.target_id, post.id, resp["ts"])
+        return TargetResponse(resp)
+
+    async def _delivered(self, posts):
+        """Returns responses for those *posts*, which were delivered already according to the journal.
+
+        All pending posts of the target are reconciled on first use, later only those of
+        *posts*, for example when livebridge retries a post after a timeout."""
+        if self.journal is None:
+            return {}
+        if not self._reconciled:
+            self._reconciled = True
+            await self.reconcile()
+        else:
+            pending = [post.id for post in posts
+                       if (self.journal.lookup(self.target_id, post.id) or (None,))[0] == PENDING]
+            if pending:
+                await self.reconcile(pending)
+        delivered = {}
+        for post in posts:
+            entry = self.journal.lookup(self.target_id, post.id)
+            if entry and entry[0] == DELIVERED:
+                logger.info("Post [{}] was delivered to {} already.".format(post.id, self.target_id))
+                delivered[post.id] = TargetResponse({"ok": True, "channel": await self.channel_id, "ts": entry[1]})
+        return delivered
+
+    async def reconcile(self, post_ids=None):
+        """Resolves pending journal entries by looking for their messages in the channel history,
+           all of the target or those of *post_ids*. Entries older than *reconcile_max_age*
+           are dropped, their posts get sent again.
+
+        Returns the number of entries resolved."""
+        if post_ids is None:
+            pending = self.journal.pending_entries(self.target_id)
+        else:
+            entries = ((post_id, self.journal.lookup(self.target_id, post_id)) for post_id in post_ids)
+            pending = {post_id: entry for post_id, entry in entries if entry and entry[0] == PENDING}
+        expired = [post_id for post_id, entry in pending.items() if entry[3] < time.time() - self.reconcile_max_age]
+        for post_id in expired:
+            self.journal.remove(self.target_id, post_id)
+            del pending[post_id]
+        if expired:
+            logger.warning("Dropped {} pending posts of {} older than {}s.".format(
+                len(expired), self.target_id, self.reconcile_max_age))
+        if not pending:
+            return 0
+        oldest = min(entry[3] for entry in pending.values()) - self.reconcile_margin
+        messages = await self._history("{:.6f}".format(oldest))
+        if messages is None:
+            logger.warning("Reconciling journal of {} failed.".format(self.target_id))
+            return 0
+        found = {}
+        for msg in reversed(messages):
+            if not self.journal.is_delivered(self.target_id, msg.get("ts")):
+                found.setdefault(fingerprint(msg.get("text")), []).append(msg["ts"])
+        resolved = 0
+        for post_id, entry in sorted(pending.items(), key=lambda item: item[1][3]):
+            candidates = [ts for ts in found.get(entry[2], []) if float(ts) >= entry[3] - self.reconcile_margin]
+            if candidates:
+                found[entry[2]].remove(candidates[0])
+                self.journal.delivered(self.target_id, post_id, candidates[0])
+                resolved += 1
+        logger.info("Reconciled {} of {} pending posts of {}".format(resolved, len(pending), self.target_id))
+        return resolved
+
     async def post_item(self, post):
-        post_url = "{}chat.postMessage".format(self.endpoint)
-        data = await self._build_post_data({
-            "text": post.content,
-            "unfurl_links": True,
-        })
-        return TargetResponse(await self._post(post_url, data))
+        delivered = await self._delivered([post])
+        if post.id in delivered:
+            return delivered[post.id]
+        return await self._send_message(post, self._get_chunks(await self._rehost(post.content)))
+
+    async def post_items(self, posts):
+        """Creates all *posts* at once, returns a :class:`TargetResponse` per post, empty if failed.
+
+        The channel gets resolved once, posts already delivered are skipped. The images
+        of all posts are re-hosted concurrently, then the posts are sent one after another,
+        so they show up in Slack in the given order."""
+        await self.channel_id
+        delivered = await self._delivered(posts)
+        posts_left = [post for post in posts if post.id not in delivered]
+        contents = await asyncio.gather(*[self._rehost(post.content) for post in posts_left])
+        sent = []
+        for post, content in zip(posts_left, contents):
+            try:
+                sent.append(await self._send_message(post, self._get_chunks(content)))
+            except Exception as e:
+                logger.error("Posting [{}] to {} failed: {}".format(post.id, self.target_id, e))
+                sent.append(TargetResponse({}))
+        sent = iter(sent)
+        return [delivered[post.id] if post.id in delivered else next(sent) for post in posts]
 
     async def update_item(self, post):
         id_at_target = self.get_id_at_target(post)
@@ -45,12 +229,72 @@ class SlackTarget(SlackClient, BaseTarget):
             logger.warning("Handling updated item without TARGET-ID: [{}] on {}".format(post.id, self.target_id))
             return False
 
-        update_url = "{}chat.update".format(self.endpoint)
-        data = await self._build_post_data({
-            "text": post.content,
-            "ts": self.get_id_at_target(post),
-        })
-        return TargetResponse(await self._post(update_url, data))
+        if self.update_window:
+            return self._coalesce_update(id_at_target, post)
+        return await self._send_update(id_at_target, post.target_doc, post.content)
+
+    async def _send_update(self, id_at_target, target_doc, content):
+        """Updates the messages of a post, posts additional messages or deletes surplus ones,
+           when the number of chunks changed."""
+        ids = self._get_chunk_ids(target_doc, id_at_target)
+        chunks = self._get_chunks(await self._rehost(content))
+        sent = (target_doc or {}).get("fingerprint") or self.fingerprints.get(id_at_target)
+        if sent == self._fingerprint(chunks):
+            logger.debug("Skipping unchanged update of [{}] on {}".format(id_at_target, self.target_id))
+            self.updates_skipped += 1
+            Metrics.inc("slack_updates_skipped_total")
+            return TargetResponse(dict(target_doc))
+        responses = []
+        for chunk_id, chunk in zip(ids, chunks):
+            params = {key: chunk[key] for key in ("text", "blocks") if key in chunk}
+            params["ts"] = chunk_id
+            responses.append(await self._send("chat.update", params))
+        resp = responses[0] if responses else {}
+        if len(ids) == 1 and len(chunks) == 1:
+            return TargetResponse(self._sent(resp, chunks))
+        sent = ids[:len(chunks)]
+        if len(chunks) > len(ids):
+            added = await self._post_chunks(chunks[len(ids):])
+            sent += self._get_chunk_ids(added, added["ts"]) if added else []
+        for chunk_id in ids[len(chunks):]:
+            await self._request("chat.delete", await self._build_post_data({"ts": chunk_id}))
+        resp = dict(resp)
+        resp.pop("chunks", None)
+        if len(sent) > 1:
+            resp["chunks"] = sent
+        return TargetResponse(self._sent(resp, chunks))
+
+    def _coalesce_update(self, id_at_target, post):
+        """Schedules the update to be sent after *update_window* seconds and returns at once
+           with the target doc known so far, further updates of the same message within that
+           time only replace the content to send."""
+        target_doc = self.updated_docs.get(id_at_target) or post.target_doc
+        pending = self._pending_updates.get(id_at_target)
+        if pending:
+            logger.debug("Coalescing update of [{}] on {}".format(id_at_target, self.target_id))
+            pending["content"] = post.content
+            self.updates_coalesced += 1
+        else:
+            self._pending_updates[id_at_target] = pending = {"content": post.content, "target_doc": target_doc}
+            pending["task"] = asyncio.ensure_future(self._send_later(id_at_target, pending))
+        # without fingerprint, it isn't the one of the content sent later
+        return TargetResponse({key: value for key, value in (target_doc or {}).items() if key != "fingerprint"})
+
+    async def _send_later(self, id_at_target, pending):
+        try:
+            await asyncio.sleep(self.update_window)
+        finally:
+            if self._pending_updates.get(id_at_target) is pending:
+                del self._pending_updates[id_at_target]
+        await self._send_pending(id_at_target, pending)
+
+    async def _send_pending(self, id_at_target, pending):
+        try:
+            resp = await self._send_update(id_at_target, pending["target_doc"], pending["content"])
+            if resp:
+                self.updated_docs.set(id_at_target, dict(resp))
+        except Exception as e:
+            logger.error("Updating [{}] on {} failed: {}".format(id_at_target, self.target_id, e))
 
     async def delete_item(self, post):
         id_at_target = self.get_id_at_target(post)
@@ -58,11 +302,166 @@ class SlackTarget(SlackClient, BaseTarget):
             logger.warning("Handling deleted item without TARGET-ID: [{}] on {}".format(post.id, self.target_id))
             return False
 
-        url = "{}chat.delete".format(self.endpoint)
-        data = await self._build_post_data({
-            "ts": id_at_target,
-        })
-        return TargetResponse(await self._post(url, data))
+        pending = self._pending_updates.pop(id_at_target, None)
+        if pending:
+            logger.debug("Dropping update of deleted [{}] on {}".format(id_at_target, self.target_id))
+            pending["task"].cancel()
+            self.updates_dropped += 1
+        self.fingerprints.pop(id_at_target)
+        target_doc = self.updated_docs.pop(id_at_target) or post.target_doc
+
+        responses = []
+        for chunk_id in self._get_chunk_ids(target_doc, id_at_target):
+            data = await self._build_post_data({
+                "ts": chunk_id,
+            })
+            responses.append(await self._request("chat.delete", data))
+        resp = responses[0]
+        if self.journal is not None and resp.get("ok"):
+            self.journal.remove(self.target_id, post.id)
+        return TargetResponse(resp)
 
     async def handle_extras(self, post):
         pass
+
+    async def close(self):
+        """Sends the updates still waiting for *update_window* right away."""
+        for id_at_target, pending in list(self._pending_updates.items()):
+            pending["task"].cancel()
+            del self._pending_updates[id_at_target]
+            await self._send_pending(id_at_target, pending)
+        await super().close()
+
+
+class _ChannelPost(object):
+    """A post with the target doc of its copy in one channel."""
+
+    __slots__ = ("id", "content", "target_doc")
+
+    def __init__(self, post, target_doc):
+        self.id = post.id
+        self.content = post.content
+        self.target_doc = target_doc
+
+
+class SlackFanoutTarget(SlackTarget):
+    """Sends every post to all *channels*, converted once.
+
+    The channels are handled by one :class:`SlackTarget` each, resolved from the same
+    channel listing and sent to concurrently, up to **fanout_concurrency** at once.
+    The target doc keeps the ts of the copy in every channel under *channels*, its
+    *ts* is the one of the first channel."""
+
+    type = "slack_fanout"
+
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self.channels = list(config.get("channels", []))
+        self.fanout_concurrency = config.get("fanout_concurrency", 5)
+        self.target_id = "{}-{}".format(self.type, ",".join(self.channels))
+        self.targets = [SlackTarget(config=dict(config, channel=channel), **kwargs) for channel in self.channels]
+
+    def _get_converter(self, post):
+        # same content as in a single channel, converters are registered for slack only
+        return get_converter(post.source, SlackTarget.type)
+
+    async def _resolve(self):
+        """Returns the targets by their channel id, unknown channels are left out."""
+        channel_ids = await asyncio.gather(*[target.channel_id for target in self.targets])
+        targets = OrderedDict()
+        for target, channel_id in zip(self.targets, channel_ids):
+            if channel_id:
+                targets[channel_id] = target
+            else:
+                logger.error("Unknown channel {} of {}".format(target.channel, self.target_id))
+        return targets
+
+    async def _each(self, func, targets):
+        """Calls *func* with every channel id and target, returns the results by channel id."""
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def call(channel_id, target):
+            async with semaphore:
+                try:
+                    return await func(channel_id, target)
+                except Exception as e:
+                    logger.error("Sending to {} failed: {}".format(target.target_id, e))
+                    return None
+        results = await asyncio.gather(*[call(channel_id, target) for channel_id, target in targets.items()])
+        return OrderedDict(zip(targets.keys(), results))
+
+    @staticmethod
+    def _channel_doc(resp):
+        """Returns the part of a channel response kept in the target doc."""
+        if not resp or not resp.get("ts"):
+            return None
+        return {key: resp[key] for key in ("ts", "chunks", "fingerprint") if key in resp}
+
+    def _response(self, docs):
+        docs = OrderedDict((channel_id, doc) for channel_id, doc in docs.items() if doc)
+        if not docs:
+            return TargetResponse({})
+        channel_id, first = next(iter(docs.items()))
+        return TargetResponse({"ok": True, "channel": channel_id, "ts": first["ts"], "channels": dict(docs)})
+
+    def _channel_docs(self, target_doc):
+        return dict((target_doc or {}).get("channels") or {})
+
+    async def post_item(self, post):
+        targets = await self._resolve()
+        docs = await self._each(
+            lambda channel_id, target: target.post_item(_ChannelPost(post, None)), targets)
+        return self._response({channel_id: self._channel_doc(resp) for channel_id, resp in docs.items()})
+
+    async def post_items(self, posts):
+        targets = await self._resolve()
+        results = await self._each(lambda channel_id, target: target.post_items(posts), targets)
+        responses = []
+        for index, post in enumerate(posts):
+            responses.append(self._response(OrderedDict(
+                (channel_id, self._channel_doc(resps[index]) if resps else None)
+                for channel_id, resps in results.items())))
+        return responses
+
+    async def update_item(self, post):
+        docs = self._channel_docs(post.target_doc)
+        if not docs:
+            logger.warning("Handling updated item without TARGET-ID: [{}] on {}".format(post.id, self.target_id))
+            return False
+
+        async def update(channel_id, target):
+            if channel_id not in docs:
+                # channel added since the post was created
+                return self._channel_doc(await target.post_item(_ChannelPost(post, None)))
+            resp = await target.update_item(_ChannelPost(post, docs[channel_id]))
+            return self._channel_doc(resp) or docs[channel_id]
+        updated = await self._each(update, await self._resolve())
+        # keep copies in channels not resolved this time
+        for channel_id, doc in docs.items():
+            if not updated.get(channel_id):
+                updated[channel_id] = doc
+        return self._response(updated)
+
+    async def delete_item(self, post):
+        docs = self._channel_docs(post.target_doc)
+        if not docs:
+            logger.warning("Handling deleted item without TARGET-ID: [{}] on {}".format(post.id, self.target_id))
+            return False
+        targets = await self._resolve()
+        targets = OrderedDict((channel_id, target) for channel_id, target in targets.items() if channel_id in docs)
+        responses = await self._each(
+            lambda channel_id, target: target.delete_item(_ChannelPost(post, docs[channel_id])), targets)
+        # copies removed by an earlier, partly failed attempt count as deleted
+        deleted = [resp and (resp.get("ok") or resp.get("error") == "message_not_found")
+                   for resp in responses.values()]
+        if not deleted or not all(deleted):
+            # empty, so livebridge keeps the post and the copies can still be deleted
+            logger.error("Deleting [{}] from {} failed: {}".format(post.id, self.target_id, dict(responses)))
+            return TargetResponse({})
+        return TargetResponse({"ok": True,
+                               "channels": {channel_id: dict(resp) for channel_id, resp in responses.items()}})
+
+    async def close(self):
+        for target in self.targets:
+            await target.close()
+        await super().close()
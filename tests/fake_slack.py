@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import json
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class FakeSlack(object):
+    """Local stand-in for the Slack API, for tests and load tests.
+
+    Implements **channels.list**, **rtm.start** with a websocket replaying *stream*, a
+    list of RTM frames, at *rate* frames per second, **chat.postMessage**, **chat.update**,
+    **chat.delete**, **conversations.history** and **files.upload**. Messages are kept per
+    channel, so the history contains the replayed frames as well as the messages posted,
+    which are sent via the websocket too. The bytes in **images[name]** are served at
+    :func:`image_url`, like by the CDN of a source.
+
+    Injectable faults: *latency* in seconds, a number or a dict per method, HTTP 429
+    for the next **rate_limited[method]** requests or every *limit_every* request, and
+    closing the websockets after *disconnect_after* frames. Frames replayed while no
+    websocket is connected are missed, like at Slack."""
+
+    def __init__(self, channels={"foo": "C1123456"}, *, stream=(), rate=None, latency=0,
+                 limit_every=0, disconnect_after=None):
+        self.channels = channels
+        self.calls = []
+        self.rate_limited = {}
+        self.limit_every = limit_every
+        self.retry_after = "0.01"
+        self.latency = latency
+        self.stream = list(stream)
+        self.rate = rate
+        self.disconnect_after = disconnect_after
+        self.messages = {channel_id: {} for channel_id in channels.values()}
+        self.images = {}
+        self.downloads = []
+        self.files = {}
+        self.websockets = []
+        self.replayed = 0
+        self.disconnects = 0
+        self.server = None
+        self._ts = 1475157232
+        self._counts = {}
+        self._connected = None
+        self._replay = None
+
+    @property
+    def endpoint(self):
+        return str(self.server.make_url("/api/"))
+
+    @property
+    def ws_url(self):
+        return str(self.server.make_url("/ws")).replace("http", "ws", 1)
+
+    def image_url(self, name):
+        return str(self.server.make_url("/images/{}".format(name)))
+
+    async def start(self, port=None):
+        app = web.Application()
+        app.router.add_post("/api/{method}", self.handle)
+        app.router.add_get("/ws", self.handle_ws)
+        app.router.add_get("/images/{name}", self.handle_image)
+        self.server = TestServer(app, port=port) if port else TestServer(app)
+        await self.server.start_server()
+        self._connected = asyncio.Event()
+        self._replay = asyncio.ensure_future(self.replay())
+        return self
+
+    async def close(self):
+        if self._replay is not None:
+            self._replay.cancel()
+        for ws in list(self.websockets):
+            await ws.close()
+        await self.server.close()
+
+    def calls_of(self, method):
+        return [c[1] for c in self.calls if c[0] == method]
+
+    def _next_ts(self):
+        self._ts += 1
+        return "{}.000001".format(self._ts)
+
+    def _limited(self, method):
+        self._counts[method] = self._counts.get(method, 0) + 1
+        if self.rate_limited.get(method):
+            self.rate_limited[method] -= 1
+            return True
+        return bool(self.limit_every) and method.startswith("chat.") and self._counts[method] % self.limit_every == 0
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        upload = data.pop("file", None)
+        if upload is not None:
+            data["file"] = upload.filename
+        self.calls.append((method, data))
+        latency = self.latency.get(method, 0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+        if self._limited(method):
+            return web.json_response({"ok": False, "error": "ratelimited"},
+                                     status=429, headers={"Retry-After": self.retry_after})
+        if method == "channels.list":
+            return web.json_response({"ok": True, "channels": [
+                {"id": cid, "name": name, "is_channel": True} for name, cid in self.channels.items()]})
+        elif method == "rtm.start":
+            return web.json_response({"ok": True, "url": self.ws_url})
+        elif method == "conversations.history":
+            return web.json_response(self._history(data))
+        elif method == "files.upload":
+            file_id = "F{:08d}".format(len(self.files) + 1)
+            self.files[file_id] = upload.file.read()
+            return web.json_response({"ok": True, "file": {
+                "id": file_id, "name": upload.filename,
+                "permalink": "https://fake.slack.com/files/UFAKEBOT/{}/{}".format(file_id, upload.filename)}})
+        ts = self._next_ts()
+        channel = data.get("channel")
+        if method == "chat.postMessage":
+            msg = {"type": "message", "user": "UFAKEBOT", "text": data.get("text", ""), "ts": ts}
+            if data.get("blocks"):
+                msg["blocks"] = data["blocks"]
+            await self.apply(dict(msg, channel=channel))
+            return web.json_response({"ok": True, "channel": channel, "ts": ts, "message": msg})
+        elif method == "chat.update":
+            msg = {"type": "message", "user": "UFAKEBOT", "text": data.get("text", ""), "ts": data.get("ts"),
+                   "edited": {"user": "UFAKEBOT", "ts": ts}}
+            await self.apply({"type": "message", "subtype": "message_changed", "hidden": True, "channel": channel,
+                              "message": msg, "ts": ts, "event_ts": ts})
+        elif method == "chat.delete":
+            await self.apply({"type": "message", "subtype": "message_deleted", "hidden": True, "channel": channel,
+                              "deleted_ts": data.get("ts"), "ts": ts, "event_ts": ts})
+        return web.json_response({"ok": True, "channel": channel, "ts": data.get("ts", ts)})
+
+    async def handle_image(self, request):
+        name = request.match_info["name"]
+        self.downloads.append(name)
+        if name not in self.images:
+            return web.Response(status=404)
+        return web.Response(body=self.images[name], content_type="image/jpeg")
+
+    def _history(self, data):
+        messages = self.messages.get(data.get("channel"))
+        if messages is None:
+            return {"ok": False, "error": "channel_not_found"}
+        oldest = float(data.get("oldest") or 0)
+        found = sorted([msg for ts, msg in messages.items() if float(ts) >= oldest],
+                       key=lambda msg: float(msg["ts"]), reverse=True)
+        start = int(data.get("cursor") or 0)
+        limit = int(data.get("limit") or 100)
+        page = found[start:start + limit]
+        resp = {"ok": True, "messages": page, "has_more": start + limit < len(found)}
+        if resp["has_more"]:
+            resp["response_metadata"] = {"next_cursor": str(start + limit)}
+        return resp
+
+    async def apply(self, event):
+        """Applies a message *event* to the history of its channel and sends it via the websockets."""
+        messages = self.messages.get(event.get("channel"))
+        if event.get("type") == "message" and messages is not None:
+            msg = {k: v for k, v in event.items() if k != "channel"}
+            if event.get("subtype") == "message_changed":
+                messages[event["message"]["ts"]] = event["message"]
+            elif event.get("subtype") == "message_deleted":
+                messages.pop(event.get("deleted_ts"), None)
+            elif not event.get("hidden"):
+                messages[event["ts"]] = msg
+        frame = json.dumps(event)
+        for ws in self.websockets:
+            ws.outbox.put_nowait(frame)
+
+    async def _send(self, ws):
+        # like at Slack, a slow client doesn't block the api
+        while True:
+            await ws.send_str(await ws.outbox.get())
+
+    async def handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        ws.outbox = asyncio.Queue()
+        ws.outbox.put_nowait('{"type":"hello"}')
+        sender = asyncio.ensure_future(self._send(ws))
+        self.websockets.append(ws)
+        self._connected.set()
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            sender.cancel()
+            self.websockets.remove(ws)
+            if not self.websockets:
+                self._connected.clear()
+        return ws
+
+    async def disconnect(self):
+        """Closes all websockets, as Slack does from time to time."""
+        self.disconnects += 1
+        for ws in list(self.websockets):
+            await ws.close(code=1011, message=b"injected disconnect")
+
+    async def replay(self):
+        """Replays the frames of the stream, once the first websocket connected."""
+        await self._connected.wait()
+        for frame in self.stream:
+            if self.rate:
+                await asyncio.sleep(1 / self.rate)
+            else:
+                # let the server handle other requests in between
+                await asyncio.sleep(0)
+            await self.apply(json.loads(frame) if isinstance(frame, str) else frame)
+            self.replayed += 1
+            if self.disconnect_after and self.replayed % self.disconnect_after == 0:
+                await self.disconnect()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from livebridge_slack.cache import LRUCache
+
+
+class LRUCacheTest(asynctest.TestCase):
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_set(self):
+        cache = LRUCache()
+        assert cache.get("foo") is None
+        assert cache.get("foo", "baz") == "baz"
+        cache.set("foo", "bar")
+        assert cache.get("foo") == "bar"
+        assert "foo" in cache
+        assert len(cache) == 1
+        assert cache.stats() == {"entries": 1, "bytes": cache.sizeof("bar"), "hits": 1, "misses": 2}
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_max_entries(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_max_bytes(self):
+        cache = LRUCache(max_bytes=10, sizeof=len)
+        cache.set("a", "12345")
+        cache.set("b", "1234")
+        assert cache.size == 9
+        cache.set("c", "12")
+        assert "a" not in cache
+        assert cache.size == 6
+        # replaced
+        cache.set("c", "1")
+        assert cache.size == 5
+        # too large
+        cache.set("d", "12345678901")
+        assert "d" not in cache
+        assert cache.size == 5
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_pop_clear(self):
+        cache = LRUCache(sizeof=len)
+        cache.set("a", "123")
+        assert cache.pop("a") == "123"
+        assert cache.pop("a") is None
+        assert cache.size == 0
+        cache.set("a", "123")
+        cache.get("a")
+        cache.clear()
+        assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 0}
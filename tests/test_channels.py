@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack import SlackTarget, SlackSource
+
+API_RES = {"ok": True, "channels": [
+    {"id": "AAAAAA", "name": "bdt-to-weblines", "is_channel": True},
+    {"id": "BBBBBB", "name": "foo", "is_channel": True},
+    {"id": "CCCCC", "name": "random", "is_channel": True}]}
+
+
+class ChannelIndexTests(asynctest.TestCase):
+
+    def setUp(self):
+        ChannelIndex.clear()
+        self.client = SlackTarget(config={"auth": {"token": "baz"}, "channel": "foo"})
+        self.client._post = asynctest.CoroutineMock(return_value=API_RES)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get(self):
+        other = SlackSource(config={"auth": {"token": "baz"}, "channel": "random"})
+        index = ChannelIndex.get(self.client)
+        assert index is ChannelIndex.get(other)
+        assert index.token == "baz"
+        assert index.endpoint == "https://slack.com/api/"
+
+        other.token = "other"
+        assert index is not ChannelIndex.get(other)
+
+    async def test_lookup(self):
+        index = ChannelIndex.get(self.client)
+        assert await index.lookup(self.client, "foo") == "BBBBBB"
+        assert await index.lookup(self.client, "random") == "CCCCC"
+        assert self.client._post.call_count == 1
+        assert self.client._post.call_args == asynctest.call(
+            "https://slack.com/api/channels.list", [("token", "baz"), ("limit", 1000)])
+
+    async def test_lookup_shared_by_clients(self):
+        other = SlackSource(config={"auth": {"token": "baz"}, "channel": "random"})
+        other._post = self.client._post
+        assert await self.client.channel_id == "BBBBBB"
+        assert await other.channel_id == "CCCCC"
+        assert self.client._post.call_count == 1
+
+    async def test_lookup_coalesced(self):
+        async def slow_post(url, data):
+            await asyncio.sleep(0.01)
+            return API_RES
+        self.client._post = asynctest.CoroutineMock(side_effect=slow_post)
+        index = ChannelIndex.get(self.client)
+        res = await asyncio.gather(*[index.lookup(self.client, "foo") for _ in range(10)])
+        assert res == ["BBBBBB"] * 10
+        assert self.client._post.call_count == 1
+
+    async def test_lookup_paginated(self):
+        pages = [
+            {"ok": True, "channels": [{"id": "AAAAAA", "name": "first", "is_channel": True}],
+             "response_metadata": {"next_cursor": "abc"}},
+            {"ok": True, "channels": [{"id": "BBBBBB", "name": "foo", "is_channel": True}],
+             "response_metadata": {"next_cursor": ""}}]
+        self.client._post = asynctest.CoroutineMock(side_effect=pages)
+        index = ChannelIndex.get(self.client)
+        assert await index.lookup(self.client, "foo") == "BBBBBB"
+        assert await index.lookup(self.client, "first") == "AAAAAA"
+        assert self.client._post.call_count == 2
+        assert self.client._post.call_args == asynctest.call(
+            "https://slack.com/api/channels.list", [("token", "baz"), ("limit", 1000), ("cursor", "abc")])
+
+    async def test_lookup_ttl(self):
+        index = ChannelIndex.get(self.client)
+        assert await index.lookup(self.client, "foo") == "BBBBBB"
+        index.updated -= index.ttl + 1
+        assert await index.lookup(self.client, "foo") == "BBBBBB"
+        assert self.client._post.call_count == 2
+
+    async def test_lookup_unknown(self):
+        index = ChannelIndex.get(self.client)
+        assert await index.lookup(self.client, "unknown") is None
+        assert self.client._post.call_count == 1
+        # negative cached
+        assert await index.lookup(self.client, "unknown") is None
+        assert self.client._post.call_count == 1
+        # looked up again after negative ttl
+        index._misses["unknown"] -= index.negative_ttl + 1
+        assert await index.lookup(self.client, "unknown") is None
+        assert self.client._post.call_count == 2
+
+    async def test_lookup_failing(self):
+        self.client._post = asynctest.CoroutineMock(return_value={})
+        index = ChannelIndex.get(self.client)
+        assert await index.lookup(self.client, "foo") is None
+        assert index.updated is None
+        # retried, known index is kept on failure
+        self.client._post = asynctest.CoroutineMock(side_effect=[API_RES, {}])
+        assert await index.lookup(self.client, "foo") == "BBBBBB"
+        index.updated -= index.ttl + 1
+        assert await index.lookup(self.client, "foo") == "BBBBBB"
+        assert index.channels["foo"] == "BBBBBB"
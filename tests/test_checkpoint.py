@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+import json
+import os
+import tempfile
+from livebridge_slack.checkpoint import CheckpointStore, FileCheckpointStore, SQLiteCheckpointStore
+
+
+class CheckpointStoreTests(asynctest.TestCase):
+
+    def setUp(self):
+        CheckpointStore.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "checkpoint.json")
+        self.db_path = os.path.join(self.tmpdir.name, "checkpoint.db")
+
+    def tearDown(self):
+        CheckpointStore.clear()
+        self.tmpdir.cleanup()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get(self):
+        store = CheckpointStore.get(self.path)
+        assert type(store) == FileCheckpointStore
+        assert CheckpointStore.get(self.path) is store
+        assert type(CheckpointStore.get(self.db_path)) == SQLiteCheckpointStore
+        assert type(CheckpointStore.get(os.path.join(self.tmpdir.name, "foo.sqlite"))) == SQLiteCheckpointStore
+
+    async def test_update(self):
+        for path in [self.path, self.db_path]:
+            store = CheckpointStore.get(path)
+            assert store.lookup("C1123456") == None
+            store.update("C1123456", "1475166100.000019")
+            store.update("C1123456", "1475166092.000018")
+            store.update("C6543211", "1475166092.000018")
+            assert store.lookup("C1123456") == "1475166100.000019"
+            assert store.lookup("C6543211") == "1475166092.000018"
+            assert store.pending == 2
+            assert store.flushes == 0
+
+            store.flush()
+            assert store.pending == 0
+            assert store.flushes == 1
+            store.flush()
+            assert store.flushes == 1
+            CheckpointStore.clear()
+
+            store = CheckpointStore.get(path)
+            assert store.entries == {"C1123456": "1475166100.000019", "C6543211": "1475166092.000018"}
+
+    async def test_flush_batched(self):
+        store = CheckpointStore.get(self.path)
+        store.flush_count = 3
+        store.flush_interval = 0.05
+        store.update("C1123456", "1475166100.000001")
+        store.update("C1123456", "1475166100.000002")
+        assert os.path.exists(self.path) == False
+        store.update("C1123456", "1475166100.000003")
+        assert store.flushes == 1
+        with open(self.path) as f:
+            assert json.load(f) == {"C1123456": "1475166100.000003"}
+        assert os.listdir(self.tmpdir.name) == ["checkpoint.json"]
+
+        # flushed after flush_interval
+        store.update("C1123456", "1475166100.000004")
+        assert store.flushes == 1
+        await asyncio.sleep(0.1)
+        assert store.flushes == 2
+        with open(self.path) as f:
+            assert json.load(f) == {"C1123456": "1475166100.000004"}
+
+    async def test_close(self):
+        store = CheckpointStore.get(self.db_path)
+        store.update("C1123456", "1475166100.000001")
+        CheckpointStore.clear()
+        assert CheckpointStore.get(self.db_path).lookup("C1123456") == "1475166100.000001"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_invalid_file(self):
+        with open(self.path, "w") as f:
+            f.write("{foo")
+        assert CheckpointStore.get(self.path).entries == {}
+
+    async def test_write_failing(self):
+        store = CheckpointStore.get(os.path.join(self.tmpdir.name, "missing", "checkpoint.json"))
+        store.update("C1123456", "1475166100.000001")
+        store.flush()
+        assert store.flushes == 0
+        assert store.pending == 1
+        assert store.lookup("C1123456") == "1475166100.000001"
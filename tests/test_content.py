@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from copy import deepcopy
+from livebridge_slack.content import MAX_SECTION_LENGTH, SlackContent, section_blocks, split_blocks, split_content
+
+
+class SlackContentTests(asynctest.TestCase):
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_join(self):
+        content = SlackContent.join(["foo\n", "", "bar\n"])
+        assert content == "foo\nbar\n"
+        assert isinstance(content, str)
+        assert content.fragments == ["foo\n", "bar\n"]
+        assert str(content) == "foo\nbar\n"
+        assert SlackContent.join([]) == ""
+        assert not SlackContent.join([])
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_copy(self):
+        content = deepcopy(SlackContent.join(["foo\n", "bar\n"]))
+        assert content == "foo\nbar\n"
+        assert content.fragments == ["foo\n", "bar\n"]
+        assert SlackContent("foo").fragments == ["foo"]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_split_short(self):
+        assert split_content("foo", 10) == ["foo"]
+        assert split_content(SlackContent.join(["foo\n", "bar\n"]), 8) == ["foo\nbar\n"]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_split_fragments(self):
+        content = SlackContent.join(["aaaa\n", "bbbb\n", "cc\n", "dddd\n"])
+        assert split_content(content, 10) == ["aaaa\nbbbb\n", "cc\ndddd\n"]
+        assert split_content(content, 5) == ["aaaa\n", "bbbb\n", "cc\n", "dddd\n"]
+        assert "".join(split_content(content, 7)) == content
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_split_long_fragment(self):
+        content = SlackContent.join(["aa\n", "bbbb\nbbbb\nbbbbbbbbbbbb\n", "cc\n"])
+        chunks = split_content(content, 6)
+        assert chunks == ["aa\n", "bbbb\n", "bbbb\n", "bbbbbb", "bbbbbb", "\ncc\n"]
+        assert all(len(chunk) <= 6 for chunk in chunks)
+        # plain strings are split at line breaks
+        assert split_content("foo\nbar\nbaz", 8) == ["foo\nbar\n", "baz"]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_split_whitespace(self):
+        content = SlackContent.join(["aaaa\n", "    ", "\n"])
+        assert split_content(content, 5) == ["aaaa\n"]
+        assert split_content("      ", 3) == ["   "]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_join_blocks(self):
+        content = SlackContent.join(["foo\n", "", "bar\n"], [[{"type": "section"}], [], [{"type": "image"}]], True)
+        assert content.fragments == ["foo\n", "bar\n"]
+        assert content.blocks == [[{"type": "section"}], [{"type": "image"}]]
+        assert content.unfurl == True
+        assert SlackContent.join(["foo"]).blocks == None
+        assert SlackContent("foo").unfurl == False
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_section_blocks(self):
+        assert section_blocks("\n*foo*\n") == [{"type": "section", "text": {"type": "mrkdwn", "text": "*foo*"}}]
+        assert section_blocks(" \n") == []
+        text = "\n".join(["a" * 1000] * 5)
+        blocks = section_blocks(text)
+        assert len(blocks) == 3
+        assert all(len(b["text"]["text"]) <= MAX_SECTION_LENGTH for b in blocks)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_split_blocks(self):
+        content = SlackContent.join(["a\n", "b\n", "c\n"], [[1, 2], [3], [4, 5]])
+        assert split_blocks(content, 100) == [("a\nb\nc\n", [1, 2, 3, 4, 5])]
+        assert split_blocks(content, 100, max_blocks=3) == [("a\nb\n", [1, 2, 3]), ("c\n", [4, 5])]
+        assert split_blocks(content, 100, max_blocks=2) == [("a\n", [1, 2]), ("b\n", [3]), ("c\n", [4, 5])]
+        # fallback text shortened
+        assert split_blocks(content, 3, max_blocks=3) == [("a\nb", [1, 2, 3]), ("c\n", [4, 5])]
+        # fragment with too many blocks
+        content = SlackContent.join(["a\n", "b\n"], [[1], [2, 3, 4, 5, 6]])
+        assert split_blocks(content, 100, max_blocks=2) == [("a\n", [1]), ("", [2, 3]), ("", [4, 5]), ("b\n", [6])]
@@ -15,6 +15,7 @@
 # limitations under the License.
 import asynctest
 import os.path
+from livebridge_slack.content import SlackContent
 from livebridge_slack import LiveblogSlackConverter
 from livebridge.base import ConversionResult
 from tests import load_json
@@ -22,6 +23,7 @@ from tests import load_json
 class SlackConverterTest(asynctest.TestCase):
 
     def setUp(self):
+        LiveblogSlackConverter.cache.clear()
         self.converter = LiveblogSlackConverter()
 
     async def test_simple_conversion(self):
@@ -30,8 +32,51 @@ class SlackConverterTest(asynctest.TestCase):
         assert type(conversion) == ConversionResult
         assert len(conversion.content) >= 1
         assert conversion.content == """\n*Text*  mit ein parr _Formatierungen_. Und einem <http://dpa.de|Link>. Und weiterer ~Text~.\n\n\nhttp://newslab-liveblog-demo.s3-eu-central-1.amazonaws.com/aa7c892f1b1b7df17f635106e27c55d86a5c5b6144bebe2490f4ce14be671dd7\n\nGähn  _(Mich)_ \nListen:\n • Eins\n • Zwei\n • Drei\n\n\n • u1\n • u2\n • u3\n\n\n>*Mit dem Wissen wächst der Zweifel.*\n> • _Johann Wolfgang von Goethe_\n\n\nNochmal _*abschließender* _ Text.\n\nhttps://twitter.com/dpa_live/status/775991579676909568\n"""
+        # built from the items
+        assert type(conversion.content) == SlackContent
+        assert len(conversion.content.fragments) == 6
+        assert "".join(conversion.content.fragments) == conversion.content
+        assert conversion.content.fragments[-1] == "\nhttps://twitter.com/dpa_live/status/775991579676909568\n"
         await self.converter.remove_images(conversion.images)
 
+    async def test_conversion_cached(self):
+        post = load_json('post_to_convert.json')
+        conversion = await self.converter.convert(post)
+        stats = self.converter.cache.stats()
+        assert stats["hits"] == 0
+        assert stats["misses"] == 6
+        assert stats["entries"] == 6
+        assert stats["bytes"] > 0
+
+        # unchanged items are taken from cache, also by other instances
+        post["groups"][1]["refs"][0]["item"]["text"] = "<b>Changed</b>"
+        converter = LiveblogSlackConverter()
+        converter._convert_quote = asynctest.CoroutineMock(return_value="")
+        changed = await converter.convert(post)
+        assert converter._convert_quote.call_count == 0
+        assert changed.content.startswith("\n*Changed* \n")
+        assert changed.content.endswith(conversion.content[conversion.content.index("\n\nhttp://"):])
+        assert self.converter.cache.hits == 5
+        assert self.converter.cache.misses == 7
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_cache_key(self):
+        post = load_json('post_to_convert.json')
+        text, image = post["groups"][1]["refs"][0:2]
+        key = self.converter._cache_key(text)
+        assert key[0] == "text"
+        assert self.converter._cache_key(text) == key
+        text["item"]["text"] += " "
+        assert self.converter._cache_key(text) != key
+
+        key = self.converter._cache_key(image)
+        assert key[0] == "image"
+        image["item"]["meta"]["caption"] = "Changed"
+        assert self.converter._cache_key(image) != key
+        key = self.converter._cache_key(image)
+        image["item"]["meta"]["media"]["renditions"]["viewImage"]["href"] = "http://example.com/image.jpg"
+        assert self.converter._cache_key(image) != key
+
     async def test_simple_conversion_failing(self):
         # let it fail with catched exception
         post = load_json('post_to_convert.json')
@@ -100,3 +145,38 @@ class SlackConverterTest(asynctest.TestCase):
 
         del tweet_item["item"]["meta"]["original_url"]
         assert "" == await self.converter._convert_embed(tweet_item)
+
+    async def test_blocks(self):
+        post = load_json('post_to_convert.json')
+        conversion = await self.converter.convert(post)
+        blocks = conversion.content.blocks
+        assert len(blocks) == len(conversion.content.fragments)
+        assert blocks[0] == [{"type": "section", "text": {"type": "mrkdwn", "text": conversion.content.fragments[0].strip()}}]
+        assert blocks[1] == [
+            {"type": "image", "alt_text": "Gähn",
+             "image_url": "http://newslab-liveblog-demo.s3-eu-central-1.amazonaws.com/aa7c892f1b1b7df17f635106e27c55d86a5c5b6144bebe2490f4ce14be671dd7"},
+            {"type": "context", "elements": [{"type": "mrkdwn", "text": "Gähn _(Mich)_"}]}]
+        assert blocks[-1] == [{"type": "section", "text": {
+            "type": "mrkdwn", "text": "https://twitter.com/dpa_live/status/775991579676909568"}}]
+        # the tweet needs to be unfurled
+        assert conversion.content.unfurl == True
+
+    async def test_blocks_image(self):
+        post = load_json('post_to_convert.json')
+        img_item = post["groups"][1]["refs"][1]
+        img_item["item"]["meta"]["caption"] = ""
+        img_item["item"]["meta"]["credit"] = "dpa"
+        assert self.converter._image_blocks(img_item)[0]["alt_text"] == "dpa"
+        assert self.converter._image_blocks(img_item)[1]["elements"][0]["text"] == "_(dpa)_"
+        img_item["item"]["meta"]["credit"] = None
+        assert [b["type"] for b in self.converter._image_blocks(img_item)] == ["image"]
+        assert self.converter._image_blocks(img_item)[0]["alt_text"] == "image"
+        del img_item["item"]["meta"]["media"]
+        assert self.converter._image_blocks(img_item) == []
+
+    async def test_blocks_without_embed(self):
+        post = load_json('post_to_convert.json')
+        post["groups"][1]["refs"] = [r for r in post["groups"][1]["refs"] if r["item"]["item_type"] != "embed"]
+        conversion = await self.converter.convert(post)
+        assert conversion.content.unfurl == False
+        assert "twitter" not in conversion.content
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from livebridge_slack.converters.mrkdwn import html_to_mrkdwn
+
+
+class HtmlToMrkdwnTest(asynctest.TestCase):
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_formatting(self):
+        assert html_to_mrkdwn("<b>fett</b>und<i>kursiv</i> <strike>alt</strike>") == "*fett* und_kursiv_ ~alt~"
+        assert html_to_mrkdwn("<B>fett</B>") == "*fett* "
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_spaces(self):
+        assert html_to_mrkdwn("a&nbsp;  b") == "a b"
+        assert html_to_mrkdwn("a <b> fett </b>b") == "a  *fett*  b"
+        assert html_to_mrkdwn("a<b> </b>b<i></i>c") == "a  b c"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_links(self):
+        assert html_to_mrkdwn('<a title="x" href="http://dpa.de/?a=1&amp;b=2">Link</a>') == \
+            "<http://dpa.de/?a=1&amp;b=2|Link>"
+        assert html_to_mrkdwn('<a href="http://dpa.de">Link') == "<http://dpa.de|Link>"
+        assert html_to_mrkdwn('<a href="javascript:alert(1)">Link</a>') == "Link"
+        assert html_to_mrkdwn('<a>Link</a>') == "Link"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_line_breaks(self):
+        assert html_to_mrkdwn("a<br>b<br/><br />c<br><br><br>d") == "a\nb\nc\n\nd"
+        assert html_to_mrkdwn("<p>a</p><div>b</div>") == "a\nb\n"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_lists(self):
+        assert html_to_mrkdwn("<ul><li>a</li></ul><ol><li>b</li></ol>") == " • a\n\n • b\n\n"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_stripped_tags(self):
+        assert html_to_mrkdwn('<span class="x">a</span><!-- comment --><strong>b</strong>') == "ab"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_escaping(self):
+        assert html_to_mrkdwn("a &amp; b &lt;c&gt; & d") == "a &amp; b &lt;c&gt; &amp; d"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_quotes(self):
+        assert html_to_mrkdwn("<i>«Zitat»</i>") == "_«Zitat»_"
+        assert html_to_mrkdwn("<b>«Zitat»</b>") == "*«Zitat»* "
+        # closing quotes only
+        assert html_to_mrkdwn("<p>x <b>»Zitat</b> y</p>") == "x »*Zitat*  y\n"
+        assert html_to_mrkdwn("<i>»Hilfe</i>") == "»_Hilfe_"
+        # nested marks, every fix-up sees the result of the previous one
+        assert html_to_mrkdwn("<p><b><i>»Zitat«</i></b></p>") == "»*_Zitat_*« \n"
+        assert html_to_mrkdwn("<i><b>«Zitat»</b></i>") == "_*«Zitat»* _"
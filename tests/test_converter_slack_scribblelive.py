@@ -63,3 +63,44 @@ class SlackScribbleliveConverterTest(asynctest.TestCase):
         }],}
         conversion = await self.converter.convert(post)
         assert conversion.content == 'Text<br><br><img src="http://newslab-liveblog-demo.s3-eu-central-1.amazonaws.com/c55d86a5c5b6144bebe2490f4ce14be671dd7" />'
+
+    async def test_many_runs(self):
+        post = {"text": " ".join(["*b{0}* _i{0}_ ~s{0}~".format(x) for x in range(30)])}
+        conversion = await self.converter.convert(post)
+        assert conversion.content == " ".join(["<b>b{0}</b> <i>i{0}</i> <s>s{0}</s>".format(x) for x in range(30)])
+        assert conversion.content.count("<b>") == 30
+
+        post = {"text": "\n".join(["line {}".format(x) for x in range(20)])}
+        conversion = await self.converter.convert(post)
+        assert conversion.content.count("<br>") == 19
+
+    async def test_golden(self):
+        golden = [
+            ("*foo", "<b>foo</b>"),
+            ("**", "<b></b>"),
+            ("*bold _both_*", "<b>bold <i>both</i></b>"),
+            ("*open _twice", "<b>open <i>twice</i></b>"),
+            ("*a _b_ c* d *e*", "<b>a <i>b</i> c</b> d <b>e</b>"),
+            ("*a _b* c_", "<b>a <i>b</b> c</i>"),
+            ("<http://example.com/a_b_c*d~e>", '<a href="http://example.com/a_b_c*d~e">http://example.com/a_b_c*d~e</a>'),
+            ("<http://example.com/a_b|*Example*>", '<a href="http://example.com/a_b"><b>Example</b></a>'),
+            ("<http://example.com/x", '<a href="http://example.com/x">http://example.com/x</a>'),
+            ("<@U1F2VML58> and <#C1|general>", "<@U1F2VML58> and <#C1|general>"),
+            ("one\ntwo *three*\n<https://example.com>", 'one<br>two <b>three</b><br><a href="https://example.com">https://example.com</a>'),
+        ]
+        for text, expected in golden:
+            conversion = await self.converter.convert({"text": text})
+            assert conversion.content == expected, text
+
+    async def test_images_and_links(self):
+        post = {
+            "text": "<http://img.example.com/a_1.jpg> _caption_ <http://example.com/a_1.jpg>",
+            "attachments": [{"from_url": "http://img.example.com/a_1.jpg"}, {"title": "no image"}]}
+        conversion = await self.converter.convert(post)
+        assert conversion.content == '<img src="http://img.example.com/a_1.jpg" /> <i>caption</i> ' \
+                                     '<a href="http://example.com/a_1.jpg">http://example.com/a_1.jpg</a>'
+
+    async def test_convert_message_changed(self):
+        post = {"message": {"text": "*edited*"}, "text": "ignored"}
+        conversion = await self.converter.convert(post)
+        assert conversion.content == "<b>edited</b>"
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+from livebridge_slack.dispatch import Dispatcher
+
+
+class DispatcherTest(asynctest.TestCase):
+
+    async def test_dispatch(self):
+        cb = asynctest.CoroutineMock(return_value=True)
+        dispatcher = Dispatcher(cb)
+        dispatcher.start()
+        await dispatcher.put("1", "foo")
+        await dispatcher.put("2", "baz")
+        await dispatcher.close()
+        assert cb.call_args_list == [asynctest.call(["foo"]), asynctest.call(["baz"])]
+        stats = dispatcher.stats()
+        assert stats["depth"] == 0
+        assert stats["dispatched"] == 2
+        assert stats["lag_max"] >= 0
+
+    async def test_dispatch_ordered_by_key(self):
+        done = []
+
+        async def cb(posts):
+            key, action = posts[0]
+            # slow down creates
+            await asyncio.sleep(0.01 if action == "create" else 0)
+            done.append(posts[0])
+        dispatcher = Dispatcher(cb, workers=4)
+        dispatcher.start()
+        for key in ["1", "2", "3"]:
+            for action in ["create", "update", "delete"]:
+                await dispatcher.put(key, (key, action))
+        await dispatcher.close()
+        for key in ["1", "2", "3"]:
+            assert [d[1] for d in done if d[0] == key] == ["create", "update", "delete"]
+
+    async def test_backpressure(self):
+        event = asyncio.Event()
+
+        async def cb(posts):
+            await event.wait()
+        dispatcher = Dispatcher(cb, maxsize=2)
+        dispatcher.start()
+        for x in range(3):
+            await dispatcher.put("1", x)
+        put = asyncio.ensure_future(dispatcher.put("1", 3))
+        await asyncio.sleep(0.01)
+        assert put.done() == False
+        assert dispatcher.depth == 2
+        event.set()
+        await put
+        await dispatcher.close()
+        assert dispatcher.dispatched == 4
+
+    async def test_callback_failing(self):
+        cb = asynctest.CoroutineMock(side_effect=[Exception("Test"), True])
+        dispatcher = Dispatcher(cb)
+        dispatcher.start()
+        await dispatcher.put("1", "foo")
+        await dispatcher.put("1", "baz")
+        await dispatcher.close()
+        assert cb.call_count == 2
+
+    async def test_on_dispatched(self):
+        dispatched = []
+
+        async def cb(posts):
+            # the first post takes longest
+            await asyncio.sleep(0.02 if posts[0] == 1 else 0)
+        dispatcher = Dispatcher(cb, workers=3, on_dispatched=dispatched.append)
+        dispatcher.start()
+        # one worker per key
+        for key in [1, 2, 3]:
+            await dispatcher.put(key, key)
+        await asyncio.sleep(0.01)
+        assert dispatched == []
+        await dispatcher.close()
+        assert dispatched == [3]
+        assert len(dispatcher._inflight) == 0
+
+        # failing callbacks count as dispatched as well
+        dispatcher = Dispatcher(asynctest.CoroutineMock(side_effect=Exception("Test")),
+                                on_dispatched=dispatched.append)
+        dispatcher.start()
+        await dispatcher.put(4, 4)
+        await dispatcher.close()
+        assert dispatched == [3, 4]
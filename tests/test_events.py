@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import aiohttp
+import asyncio
+import asynctest
+import json
+import socket
+import time
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.common import SlackClient
+from livebridge_slack.events import EventReceiver, signature
+from livebridge_slack import SlackSource, SlackEventsSource
+from tests import load_file
+
+SECRET = "8f742231b10e8888abcd99yyyzzz85a5"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class EventReceiverTests(asynctest.TestCase):
+
+    async def setUp(self):
+        ChannelIndex.clear()
+        EventReceiver._receivers.clear()
+        self.port = free_port()
+        self.url = "http://127.0.0.1:{}/slack/events".format(self.port)
+        self.session = aiohttp.ClientSession()
+
+    async def tearDown(self):
+        for receiver in list(EventReceiver._receivers.values()):
+            await receiver.close()
+        await self.session.close()
+        await SlackClient.close_session()
+
+    def _source(self, channel_id="C1123456", secret=SECRET, **config):
+        source = SlackEventsSource(config=dict(config, **{
+            "auth": {"token": "baz"}, "channel": "foo", "signing_secret": secret,
+            "events_host": "127.0.0.1", "events_port": self.port}))
+        source._channel_id = channel_id
+        source._handle_msg = asynctest.CoroutineMock(return_value=None)
+        source._disconnected = asynctest.MagicMock()
+        return source
+
+    async def _start(self, *sources):
+        for source in sources:
+            EventReceiver.get(source).add(source)
+        await asyncio.sleep(0.05)
+        return EventReceiver.get(sources[0])
+
+    async def _post(self, body, secret=SECRET, timestamp=None):
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        timestamp = timestamp or int(time.time())
+        headers = {
+            "Content-Type": "application/json",
+            "X-Slack-Request-Timestamp": str(timestamp),
+            "X-Slack-Signature": signature(secret, timestamp, body),
+        }
+        async with self.session.post(self.url, data=body, headers=headers) as resp:
+            return resp.status, await resp.text()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_signature(self):
+        # example of https://api.slack.com/authentication/verifying-requests-from-slack
+        body = b"token=xyzz0WbapA4vBCDEFasx0q6G&team_id=T1DC2JH3J&team_domain=testteamnow&channel_id=G8PSS9T3V" \
+               b"&channel_name=foobar&user_id=U2CERLKJA&user_name=roadrunner&command=%2Fwebhook-collect&text=" \
+               b"&response_url=https%3A%2F%2Fhooks.slack.com%2Fcommands%2FT1DC2JH3J%2F397700885554%2F96rGlfmibIGl" \
+               b"gcZRskXaIFfN&trigger_id=398738663015.47445629121.803a0bc887a14d10d2c447fce8b6703c"
+        assert signature(SECRET, 1531420618, body) == \
+            "v0=a2114d57b48eac39b9ad189dd8316235a7b4a8d21a10bd27519666489c69b503"
+
+    async def test_get(self):
+        source = self._source()
+        receiver = EventReceiver.get(source)
+        assert receiver.key == ("127.0.0.1", self.port, "/slack/events")
+        assert EventReceiver.get(self._source("C2")) is receiver
+        source.events_port += 1
+        assert EventReceiver.get(source) is not receiver
+
+    async def test_url_verification(self):
+        await self._start(self._source())
+        body = json.dumps({"token": "XXYYZZ", "challenge": "3eZbrw1aBm2rZgRNFdxV2595E9CY3gmdALWMmHkvFXO7tYXAYM8P",
+                           "type": "url_verification"})
+        status, text = await self._post(body)
+        assert status == 200
+        assert json.loads(text) == {"challenge": "3eZbrw1aBm2rZgRNFdxV2595E9CY3gmdALWMmHkvFXO7tYXAYM8P"}
+
+    async def test_verification_failed(self):
+        receiver = await self._start(self._source())
+        body = load_file("event_message.json")
+        assert (await self._post(body, secret="wrong"))[0] == 401
+        assert (await self._post(body, timestamp=int(time.time()) - 600))[0] == 401
+        async with self.session.post(self.url, data=body) as resp:
+            assert resp.status == 401
+        assert receiver.rejected == 3
+        assert receiver.received == 0
+
+    async def test_events(self):
+        source_one, source_two, other = self._source(), self._source(), self._source("C2")
+        receiver = await self._start(source_one, source_two, other)
+        assert (await self._post(load_file("event_message.json")))[0] == 200
+        assert (await self._post(load_file("event_message_changed.json")))[0] == 200
+        # retried by Slack
+        assert (await self._post(load_file("event_message.json")))[0] == 200
+        # not an event
+        assert (await self._post('{"type": "app_rate_limited"}'))[0] == 200
+        assert (await self._post("invalid"))[0] == 400
+        await asyncio.sleep(0.01)
+        assert receiver.received == 2
+        assert receiver.duplicates == 1
+        assert receiver.routed == 2
+        assert source_one._handle_msg.call_count == 2
+        assert source_one._handle_msg.call_args_list[0][0][0]["text"] == "Foo bar"
+        assert source_one._handle_msg.call_args_list[1][0][0]["subtype"] == "message_changed"
+        # every source gets its own copy
+        assert source_two._handle_msg.call_args[0][0] is not source_one._handle_msg.call_args[0][0]
+        assert other._handle_msg.call_count == 0
+
+    async def test_events_str_only(self):
+        def loads(s):
+            # like json.loads() of Python 3.5
+            if not isinstance(s, str):
+                raise TypeError("the JSON object must be str, not 'bytes'")
+            return json.loads(s)
+        source = self._source()
+        receiver = await self._start(source)
+        with asynctest.patch("livebridge_slack.events.json_loads", loads):
+            assert (await self._post(load_file("event_message.json")))[0] == 200
+            assert (await self._post("invalid"))[0] == 400
+            assert (await self._post(b"\xff\xfe"))[0] == 400
+        # channel as an object
+        event = json.loads(load_file("event_message.json"))
+        event["event_id"] = "Ev0000002"
+        event["event"] = {"type": "channel_joined", "channel": {"id": "C1123456", "latest": event["event"]}}
+        assert (await self._post(json.dumps(event)))[0] == 200
+        await asyncio.sleep(0.01)
+        assert receiver.received == 2
+        assert receiver.routed == 1
+        assert source._handle_msg.call_count == 1
+
+    async def test_acknowledge_before_handling(self):
+        source = self._source(events_queue_size=1)
+        handled = asyncio.Event()
+
+        async def slow(msg):
+            await handled.wait()
+        source._handle_msg = slow
+        await self._start(source)
+        body = json.loads(load_file("event_message.json"))
+        statuses = []
+        for x in range(3):
+            body["event_id"] = "Ev{}".format(x)
+            statuses.append((await self._post(json.dumps(body)))[0])
+        # the first is handled, the second queued, the third is rejected and retried by Slack
+        assert statuses == [200, 200, 503]
+        handled.set()
+
+    async def test_remove(self):
+        source_one, source_two = self._source(), self._source("C2")
+        receiver = await self._start(source_one, source_two)
+        await receiver.remove(source_one)
+        assert (await self._post(load_file("event_message.json")))[0] == 200
+        await receiver.remove(source_two)
+        assert EventReceiver._receivers == {}
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            await self._post(load_file("event_message.json"))
+
+    async def test_listen(self):
+        source = SlackEventsSource(config={
+            "auth": {"token": "baz"}, "channel": "foo", "signing_secret": SECRET,
+            "events_host": "127.0.0.1", "events_port": self.port})
+        assert source.type == "slack_events"
+        assert isinstance(source, SlackSource)
+        source._channel_id = "C1123456"
+        received = []
+
+        async def callback(posts):
+            received.extend(posts)
+        task = asyncio.ensure_future(source.listen(callback))
+        await asyncio.sleep(0.05)
+        assert isinstance(source.connection, EventReceiver)
+        await self._post(load_file("event_message.json"))
+        await self._post(load_file("event_message_changed.json"))
+        await asyncio.sleep(0.05)
+        assert [(p.id, p.get_action()) for p in received] == [
+            ("1475166100.000019", "create"), ("1475166100.000019", "update")]
+        await source.stop()
+        assert await task == True
+        assert EventReceiver._receivers == {}
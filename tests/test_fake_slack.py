@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+import json
+import os
+import tempfile
+from asynctest import MagicMock
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.checkpoint import CheckpointStore
+from livebridge_slack.common import SlackClient
+from livebridge_slack.ratelimit import METHOD_LIMITS, Scheduler
+from livebridge_slack.rtm import RTMConnection
+from livebridge_slack import SlackPollingSource, SlackSource, SlackTarget
+from tests.fake_slack import FakeSlack
+
+CHANNELS = {"source": "C1", "target": "C2"}
+
+
+def message(ts, text="Foo"):
+    return json.dumps({"type": "message", "channel": "C1", "user": "U1F2VML58", "text": text, "ts": ts})
+
+
+class FakeSlackTests(asynctest.TestCase):
+
+    async def setUp(self):
+        ChannelIndex.clear()
+        Scheduler.clear()
+        RTMConnection._connections.clear()
+        self.limits = asynctest.patch.dict(METHOD_LIMITS, {"rtm.start": (6000, 10)})
+        self.limits.start()
+        self.slack = None
+
+    async def tearDown(self):
+        for connection in list(RTMConnection._connections.values()):
+            await connection.close()
+        await SlackClient.close_session()
+        if self.slack:
+            await self.slack.close()
+        self.limits.stop()
+
+    def _config(self, channel, **kwargs):
+        return dict(kwargs, auth={"token": "xoxb-fake"}, channel=channel, endpoint=self.slack.endpoint)
+
+    async def _listen(self, source):
+        received = []
+
+        async def callback(posts):
+            received.extend(posts)
+        task = asyncio.ensure_future(source.listen(callback))
+        return task, received
+
+    async def test_endpoint(self):
+        self.slack = await FakeSlack(CHANNELS).start()
+        target = SlackTarget(config=self._config("target"))
+        assert target.endpoint == self.slack.endpoint
+        target = SlackTarget(config=dict(self._config("target"), endpoint="http://localhost:8080/api"))
+        assert target.endpoint == "http://localhost:8080/api/"
+
+    async def test_replay(self):
+        stream = ['{"type":"presence_change","user":"U1F2VML58"}', message("1.000001"), message("2.000001", "Bar"),
+                  json.dumps({"type": "message", "subtype": "message_deleted", "hidden": True, "channel": "C1",
+                              "deleted_ts": "1.000001", "ts": "3.000001"})]
+        self.slack = await FakeSlack(CHANNELS, stream=stream, rate=1000).start()
+        source = SlackSource(config=self._config("source"))
+        task, received = await self._listen(source)
+        for _ in range(100):
+            if len(received) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert [p.get_action() for p in received] == ["create", "create", "delete"]
+        assert self.slack.replayed == 4
+        assert list(self.slack.messages["C1"]) == ["2.000001"]
+        await source.stop()
+        await task
+
+    async def test_target(self):
+        self.slack = await FakeSlack(CHANNELS).start()
+        target = SlackTarget(config=self._config("target"))
+        post = MagicMock(content="Foo", target_doc=None)
+        resp = await target.post_item(post)
+        assert resp["ts"] in self.slack.messages["C2"]
+        post.content = "Bar"
+        post.target_doc = resp
+        await target.update_item(post)
+        assert self.slack.messages["C2"][resp["ts"]]["text"] == "Bar"
+        assert self.slack.messages["C2"][resp["ts"]]["edited"]
+        assert [m["text"] for m in await target._history("0")] == ["Bar"]
+        await target.delete_item(post)
+        assert self.slack.messages["C2"] == {}
+
+    async def test_history_pages(self):
+        self.slack = await FakeSlack(CHANNELS).start()
+        for x in range(5):
+            await self.slack.apply(json.loads(message("{}.000001".format(x + 1))))
+        source = SlackSource(config=self._config("source"))
+        messages = await source._history("2.000001", page_size=2)
+        assert [m["ts"] for m in messages] == ["5.000001", "4.000001", "3.000001", "2.000001"]
+        assert len(self.slack.calls_of("conversations.history")) == 2
+
+    async def test_faults(self):
+        self.slack = await FakeSlack(CHANNELS, latency={"chat.postMessage": 0.05}, limit_every=2).start()
+        target = SlackTarget(config=self._config("target"))
+        await target.channel_id
+        post = MagicMock(content="Foo", target_doc=None)
+        start = asyncio.get_event_loop().time()
+        assert (await target.post_item(post))["ok"] == True
+        assert asyncio.get_event_loop().time() - start >= 0.05
+        # every second request is answered with 429 and retried
+        assert (await target.post_item(post))["ok"] == True
+        assert len(self.slack.calls_of("chat.postMessage")) == 3
+
+    async def test_disconnect_backfill(self):
+        stream = [message("{}.000001".format(x + 1)) for x in range(6)]
+        self.slack = await FakeSlack(CHANNELS, stream=stream, rate=200, disconnect_after=3).start()
+        source = SlackSource(config=self._config("source"))
+        with asynctest.patch.object(RTMConnection, "backoff_base", 0.01):
+            task, received = await self._listen(source)
+            for _ in range(200):
+                if len(received) == 6:
+                    break
+                await asyncio.sleep(0.01)
+        # frames missed while reconnecting are fetched from the history
+        assert sorted(p.id for p in received) == ["{}.000001".format(x + 1) for x in range(6)]
+        assert self.slack.disconnects == 2
+        assert source.connection.reconnects >= 1
+        await source.stop()
+        await task
+
+    async def test_resume_live_during_history(self):
+        CheckpointStore.clear()
+        tmpdir = tempfile.TemporaryDirectory()
+        checkpoint = os.path.join(tmpdir.name, "checkpoint.json")
+        CheckpointStore.get(checkpoint).update("C1", "1.000001")
+        self.slack = await FakeSlack(CHANNELS, latency={"conversations.history": 0.2}).start()
+        # missed while not running
+        for x in range(3):
+            await self.slack.apply(json.loads(message("{}.000001".format(x + 1))))
+        source = SlackSource(config=self._config("source", checkpoint=checkpoint))
+        task, received = await self._listen(source)
+        for _ in range(100):
+            if self.slack.calls_of("conversations.history"):
+                break
+            await asyncio.sleep(0.01)
+        # a live message arrives while the history is still being fetched
+        await self.slack.apply(json.loads(message("4.000001")))
+        for _ in range(100):
+            if len(received) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert [p.id for p in received] == ["2.000001", "3.000001", "4.000001"]
+        await source.stop()
+        await task
+        CheckpointStore.clear()
+        assert CheckpointStore.get(checkpoint).lookup("C1") == "4.000001"
+        CheckpointStore.clear()
+        tmpdir.cleanup()
+
+    async def test_polling_after_delete(self):
+        self.slack = await FakeSlack(CHANNELS).start()
+        source = SlackPollingSource(config=self._config("source"))
+        source.history.last_ts = "0"
+        poster = SlackTarget(config=self._config("source"))
+
+        async def poll():
+            source._next_poll = 0
+            return [(post.get_action(), post.id) for post in await source.poll()]
+        created = await poster.post_item(MagicMock(id="a", content="A"))
+        assert await poll() == [("create", created["ts"])]
+        await poster.delete_item(MagicMock(id="a", target_doc=created))
+        assert await poll() == [("delete", created["ts"])]
+
+        # messages posted after a deletion are still created, also while fetching the history
+        created = await poster.post_item(MagicMock(id="b", content="B"))
+        assert await poll() == [("create", created["ts"])]
+        self.slack.latency = {"conversations.history": 0.1}
+        polling = asyncio.ensure_future(poll())
+        await asyncio.sleep(0.05)
+        await poster.delete_item(MagicMock(id="b", target_doc=created))
+        assert await polling == [("delete", created["ts"])]
+        created = await poster.post_item(MagicMock(id="c", content="C"))
+        assert await poll() == [("create", created["ts"])]
+        assert await poll() == []
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import asyncio
+from asynctest import MagicMock
+from livebridge.base import BaseTarget
+from livebridge.components import CONVERTER_MAP, add_converter
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.common import SlackClient
+from livebridge_slack.content import SlackContent
+from livebridge_slack.ratelimit import METHOD_LIMITS, Scheduler
+from livebridge_slack import LiveblogSlackConverter, SlackFanoutTarget
+from tests import load_json
+from tests.fake_slack import FakeSlack
+
+CHANNELS = {"one": "C1", "two": "C2", "three": "C3"}
+
+
+class SlackFanoutTargetTests(asynctest.TestCase):
+
+    async def setUp(self):
+        ChannelIndex.clear()
+        Scheduler.clear()
+        self.limits = asynctest.patch.dict(METHOD_LIMITS, {"channels.list": (6000, 10), "chat.update": (6000, 10)})
+        self.limits.start()
+        self.slack = await FakeSlack(CHANNELS).start()
+        self.target = self._target(["one", "two", "three"])
+
+    async def tearDown(self):
+        await SlackClient.close_session()
+        await self.slack.close()
+        self.limits.stop()
+
+    def _target(self, channels, **kwargs):
+        return SlackFanoutTarget(config=dict(
+            kwargs, auth={"token": "xoxb-fake"}, channels=channels, endpoint=self.slack.endpoint))
+
+    def _post(self, post_id="1", text="Foo", target_doc=None):
+        return MagicMock(id=post_id, content=SlackContent(text), target_doc=target_doc)
+
+    def _sent(self, method):
+        return {call["channel"]: call for call in self.slack.calls_of(method)}
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_init(self):
+        assert self.target.type == "slack_fanout"
+        assert self.target.target_id == "slack_fanout-one,two,three"
+        assert self.target.fanout_concurrency == 5
+        assert [t.target_id for t in self.target.targets] == ["slack-one", "slack-two", "slack-three"]
+        assert issubclass(SlackFanoutTarget, BaseTarget) == True
+
+    async def test_post_item(self):
+        resp = await self.target.post_item(self._post())
+        assert len(self.slack.calls_of("channels.list")) == 1
+        sent = self._sent("chat.postMessage")
+        assert sorted(sent.keys()) == ["C1", "C2", "C3"]
+        assert resp["ok"] == True
+        assert resp["channel"] == "C1"
+        assert resp["ts"] == self.slack.messages["C1"].popitem()[0]
+        assert sorted(resp["channels"].keys()) == ["C1", "C2", "C3"]
+        assert len(set(doc["ts"] for doc in resp["channels"].values())) == 3
+        assert self.target.get_id_at_target(MagicMock(target_doc=resp)) == resp["ts"]
+
+    async def test_post_item_chunks(self):
+        target = self._target(["one", "two"], max_length=10)
+        resp = await target.post_item(self._post(text=SlackContent.join(["Foo bar\n", "Baz bar\n"])))
+        assert len(self.slack.calls_of("chat.postMessage")) == 4
+        assert len(resp["channels"]["C1"]["chunks"]) == 2
+        assert resp["channels"]["C1"]["ts"] == resp["channels"]["C1"]["chunks"][0]
+
+    async def test_update_item(self):
+        created = await self.target.post_item(self._post())
+        resp = await self.target.update_item(self._post(text="Bar", target_doc=created))
+        sent = self._sent("chat.update")
+        assert {channel_id: call["ts"] for channel_id, call in sent.items()} == \
+            {channel_id: doc["ts"] for channel_id, doc in created["channels"].items()}
+        assert all(call["text"] == "Bar" for call in sent.values())
+        assert {channel_id: doc["ts"] for channel_id, doc in resp["channels"].items()} == \
+            {channel_id: doc["ts"] for channel_id, doc in created["channels"].items()}
+        assert all(doc["fingerprint"] != created["channels"]["C1"]["fingerprint"] for doc in resp["channels"].values())
+
+        # channel added later
+        target = self._target(["one", "two", "three", "four"])
+        self.slack.channels["four"] = "C4"
+        self.slack.messages["C4"] = {}
+        ChannelIndex.clear()
+        resp = await target.update_item(self._post(text="Baz", target_doc=created))
+        assert len(self.slack.calls_of("chat.update")) == 6
+        assert self._sent("chat.postMessage")["C4"]["text"] == "Baz"
+        assert sorted(resp["channels"].keys()) == ["C1", "C2", "C3", "C4"]
+
+        # copies in channels not configured anymore are kept
+        target = self._target(["two"])
+        resp = await target.update_item(self._post(text="Foo", target_doc=created))
+        assert resp["channels"] == created["channels"]
+
+        assert await self.target.update_item(self._post()) == False
+
+    async def test_delete_item(self):
+        created = await self.target.post_item(self._post())
+        resp = await self.target.delete_item(self._post(target_doc=created))
+        assert resp["ok"] == True
+        assert {channel_id: call["ts"] for channel_id, call in self._sent("chat.delete").items()} == \
+            {channel_id: doc["ts"] for channel_id, doc in created["channels"].items()}
+        assert all(not messages for messages in self.slack.messages.values())
+        assert await self.target.delete_item(self._post()) == False
+
+    async def test_delete_item_failing(self):
+        target = self._target(["one", "two"])
+        created = await target.post_item(self._post())
+        target.targets[1]._request = asynctest.CoroutineMock(return_value={"ok": False, "error": "fatal_error"})
+        resp = await target.delete_item(self._post(target_doc=created))
+        # not deleted in livebridge either
+        assert bool(resp) == False
+        assert self.slack.messages["C1"] == {}
+        assert len(self.slack.messages["C2"]) == 1
+
+        # retried, the copy already deleted is no error
+        del target.targets[1]._request
+        target.targets[0]._request = asynctest.CoroutineMock(return_value={"ok": False, "error": "message_not_found"})
+        resp = await target.delete_item(self._post(target_doc=created))
+        assert resp["ok"] == True
+        assert self.slack.messages["C2"] == {}
+
+    async def test_handle_post(self):
+        post = MagicMock(id="1", source="liveblog", data=load_json("post_to_convert.json"), target_doc=None,
+                         is_deleted=False, images=[])
+        post.get_action.return_value = "create"
+        self.target._db_client = MagicMock(get_post=asynctest.CoroutineMock(return_value=None),
+                                           insert_post=asynctest.CoroutineMock())
+        with asynctest.patch.dict(CONVERTER_MAP, {}):
+            add_converter(LiveblogSlackConverter)
+            assert type(self.target._get_converter(post)) == LiveblogSlackConverter
+            await self.target.handle_post(post)
+        # converted once, sent to every channel
+        expected = (await LiveblogSlackConverter().convert(post.data)).content
+        assert post.content == expected
+        for channel_id in ["C1", "C2", "C3"]:
+            assert [msg["text"] for msg in self.slack.messages[channel_id].values()] == [expected]
+        assert self.target._db_client.insert_post.call_args[1]["target_doc"]["channels"].keys() == {"C1", "C2", "C3"}
+
+    async def test_post_items(self):
+        posts = [self._post(str(i), "Foo {}".format(i)) for i in range(3)]
+        responses = await self.target.post_items(posts)
+        assert len(responses) == 3
+        assert len(self.slack.calls_of("chat.postMessage")) == 9
+        for post, resp in zip(posts, responses):
+            for channel_id, doc in resp["channels"].items():
+                assert self.slack.messages[channel_id][doc["ts"]]["text"] == post.content
+
+    async def test_unknown_channel(self):
+        target = self._target(["one", "unknown"])
+        resp = await target.post_item(self._post())
+        assert list(resp["channels"].keys()) == ["C1"]
+        assert len(self.slack.calls_of("chat.postMessage")) == 1
+
+    async def test_failing(self):
+        target = self._target(["one", "two"])
+        await target._resolve()
+        target.targets[0]._request = asynctest.CoroutineMock(side_effect=Exception("Test"))
+        resp = await target.post_item(self._post())
+        assert resp["channel"] == "C2"
+        assert list(resp["channels"].keys()) == ["C2"]
+
+        target.targets[1]._request = asynctest.CoroutineMock(return_value={})
+        resp = await target.post_item(self._post())
+        assert resp.data == {}
+
+    async def test_close(self):
+        for target in self.target.targets:
+            target.close = asynctest.CoroutineMock()
+        await self.target.close()
+        assert all(target.close.call_count == 1 for target in self.target.targets)
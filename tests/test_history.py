@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from livebridge_slack.history import ChannelHistory
+
+
+class ChannelHistoryTests(asynctest.TestCase):
+
+    def setUp(self):
+        self.history = ChannelHistory(size=3)
+        for ts, text in [("10.000001", "kept"), ("11.000001", "edited"), ("12.000001", "deleted")]:
+            self.history.remember({"text": text, "ts": ts, "livebridge": {"action": "create"}})
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_remember(self):
+        assert self.history.last_ts == "12.000001"
+        assert list(self.history.seen.keys()) == ["10.000001", "11.000001", "12.000001"]
+        assert self.history.oldest == "10.000001"
+
+        # bounded, updates are moved to the end
+        self.history.remember({"message": {"text": "new", "ts": "10.000001"}, "ts": "13.000001",
+                               "livebridge": {"action": "update"}})
+        self.history.remember({"text": "foo", "ts": "14.000001", "livebridge": {"action": "create"}})
+        assert list(self.history.seen.keys()) == ["12.000001", "10.000001", "14.000001"]
+        assert self.history.last_ts == "14.000001"
+
+        self.history.remember({"deleted_ts": "12.000001", "ts": "15.000001", "livebridge": {"action": "delete"}})
+        assert list(self.history.seen.keys()) == ["10.000001", "14.000001"]
+        # deletions don't move last_ts
+        assert self.history.last_ts == "14.000001"
+
+        # unknown action
+        self.history.remember({"text": "foo", "ts": "16.000001", "livebridge": {}})
+        assert list(self.history.seen.keys()) == ["10.000001", "14.000001"]
+        assert self.history.last_ts == "16.000001"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_is_dispatched(self):
+        assert self.history.is_dispatched({"ts": "10.000001", "livebridge": {"action": "create"}}) == True
+        assert self.history.is_dispatched({"ts": "13.000001", "livebridge": {"action": "create"}}) == False
+        update = {"message": {"text": "kept", "ts": "10.000001"}, "ts": "14.000001", "livebridge": {"action": "update"}}
+        assert self.history.is_dispatched(update) == True
+        update["message"]["text"] = "changed"
+        assert self.history.is_dispatched(update) == False
+        assert self.history.is_dispatched({"deleted_ts": "10.000001", "livebridge": {"action": "delete"}}) == False
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_diff(self):
+        messages = [
+            {"type": "message", "text": "new two", "ts": "15.000001"},
+            {"type": "message", "text": "new one", "ts": "13.000001"},
+            {"type": "message", "text": "changed", "ts": "11.000001", "edited": {"ts": "14.000001"}},
+            {"type": "message", "text": "kept", "ts": "10.000001"}]
+        docs = self.history.diff(messages, "C1")
+        assert [(doc["livebridge"]["action"], doc.get("deleted_ts", doc.get("message", doc)["ts"]))
+                for doc in docs] == [
+            ("create", "13.000001"), ("update", "11.000001"), ("create", "15.000001"), ("delete", "12.000001")]
+        assert docs[0]["channel"] == "C1"
+        assert docs[1]["subtype"] == "message_changed"
+        assert docs[1]["ts"] == "14.000001"
+        assert docs[3]["subtype"] == "message_deleted"
+        # stamped with the latest change fetched
+        assert docs[3]["ts"] == "15.000001"
+
+        # nothing changed
+        messages = [{"type": "message", "text": text, "ts": ts}
+                    for ts, text in [("12.000001", "deleted"), ("11.000001", "edited"), ("10.000001", "kept")]]
+        assert self.history.diff(messages, "C1") == []
+
+        # older messages are not created again
+        messages.append({"type": "message", "text": "old", "ts": "9.000001"})
+        assert self.history.diff(messages, "C1") == []
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+import glob
+import os
+import tempfile
+from asynctest import MagicMock
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.common import SlackClient
+from livebridge_slack.content import SlackContent
+from livebridge_slack.images import ImageHost, image_urls
+from livebridge_slack.ratelimit import METHOD_LIMITS, Scheduler
+from livebridge_slack import SlackTarget
+from tests.fake_slack import FakeSlack
+
+
+class ImageHostTests(asynctest.TestCase):
+
+    async def setUp(self):
+        ChannelIndex.clear()
+        Scheduler.clear()
+        ImageHost.clear()
+        self.limits = asynctest.patch.dict(METHOD_LIMITS, {"files.upload": (6000, 10)})
+        self.limits.start()
+        self.slack = await FakeSlack({"foo": "C1123456"}).start()
+        self.slack.images["cat.jpg"] = b"\xff\xd8" + b"x" * 200000
+        self.image_url = self.slack.image_url("cat.jpg")
+        self.target = SlackTarget(config={
+            "auth": {"token": "xoxb-fake"}, "channel": "foo", "endpoint": self.slack.endpoint, "rehost_images": True})
+
+    async def tearDown(self):
+        await SlackClient.close_session()
+        await self.slack.close()
+        self.limits.stop()
+        ImageHost.clear()
+
+    def _content(self, url):
+        return SlackContent.join(["Intro\n", "\n{}\n\nCaption _(Credit)_ ".format(url)], [
+            [{"type": "section", "text": {"type": "mrkdwn", "text": "Intro"}}],
+            [{"type": "image", "image_url": url, "alt_text": "Caption"},
+             {"type": "context", "elements": [{"type": "mrkdwn", "text": "Caption _(Credit)_"}]}]])
+
+    def _tmp_files(self):
+        return glob.glob(os.path.join(tempfile.gettempdir(), "livebridge-slack-*"))
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_image_urls(self):
+        assert image_urls(self._content("http://foo.com/img.jpg")) == ["http://foo.com/img.jpg"]
+        assert image_urls(SlackContent("foo")) == []
+        assert image_urls("foo") == []
+
+    async def test_get(self):
+        assert self.target.image_host is ImageHost.get(self.target)
+        other = SlackTarget(config={"auth": {"token": "xoxb-other"}, "channel": "foo", "rehost_images": True})
+        assert other.image_host is not self.target.image_host
+        assert SlackTarget(config={"channel": "foo"}).image_host is None
+
+    async def test_post_item(self):
+        tmp_files = self._tmp_files()
+        post = MagicMock(id="1", content=self._content(self.image_url))
+        resp = await self.target.post_item(post)
+        assert resp["ts"]
+        assert list(self.slack.files.values()) == [self.slack.images["cat.jpg"]]
+        upload = self.slack.calls_of("files.upload")[0]
+        assert upload["file"].endswith(".jpg")
+        text = self.slack.calls_of("chat.postMessage")[0]["text"]
+        assert self.image_url not in text
+        assert "https://fake.slack.com/files/UFAKEBOT/F00000001/" in text
+        assert text.startswith("Intro\n")
+        # the original content is kept
+        assert self.image_url in post.content
+        assert self._tmp_files() == tmp_files
+
+        # uploaded once only
+        post.target_doc = resp
+        post.content = self._content(self.image_url).replace("Intro", "Updated")
+        post.content = SlackContent(post.content, [post.content], self._content(self.image_url).blocks)
+        await self.target.update_item(post)
+        await self.target.post_item(MagicMock(id="2", content=self._content(self.image_url)))
+        assert self.slack.downloads == ["cat.jpg"]
+        assert len(self.slack.calls_of("files.upload")) == 1
+        assert self.image_url not in self.slack.calls_of("chat.update")[0]["text"]
+        assert self.target.image_host.uploaded == 1
+
+    async def test_post_blocks(self):
+        self.target.blocks = True
+        await self.target.post_item(MagicMock(id="1", content=self._content(self.image_url)))
+        blocks = self.slack.calls_of("chat.postMessage")[0]["blocks"]
+        assert blocks[1] == {"type": "image", "slack_file": {"id": "F00000001"}, "alt_text": "Caption"}
+
+    async def test_concurrent(self):
+        host = self.target.image_host
+        files = await asyncio.gather(*[host.rehost(self.target, self.image_url) for _ in range(5)])
+        assert len(set(f["id"] for f in files)) == 1
+        assert len(self.slack.files) == 1
+        assert host._pending == {}
+
+        posts = [MagicMock(id=str(i), content=self._content(self.image_url)) for i in range(3)]
+        await self.target.post_items(posts)
+        assert len(self.slack.files) == 1
+        assert len(self.slack.calls_of("chat.postMessage")) == 3
+
+    async def test_failing(self):
+        tmp_files = self._tmp_files()
+        host = self.target.image_host
+        # not found
+        content = self._content(self.slack.image_url("missing.jpg"))
+        assert await host.rehost_content(self.target, content) is content
+        # too large
+        host.max_size = 1000
+        content = self._content(self.image_url)
+        assert await host.rehost_content(self.target, content) is content
+        # upload failed
+        host.max_size = 10 ** 9
+        self.target._request = asynctest.CoroutineMock(return_value={})
+        assert await host.rehost(self.target, self.image_url) == None
+        assert host.failed == 3
+        assert host.uploaded == 0
+        assert len(host.files) == 0
+        assert self._tmp_files() == tmp_files
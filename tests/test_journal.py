@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import os
+import tempfile
+from livebridge_slack.journal import DELIVERED, PENDING, DeliveryJournal, fingerprint
+
+
+class DeliveryJournalTests(asynctest.TestCase):
+
+    def setUp(self):
+        DeliveryJournal.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "journal.db")
+        self.journal = DeliveryJournal.get(self.path)
+
+    def tearDown(self):
+        DeliveryJournal.clear()
+        self.tmpdir.cleanup()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_fingerprint(self):
+        assert fingerprint(" Foo\n") == fingerprint("Foo")
+        assert fingerprint("Foo") != fingerprint("Bar")
+        assert fingerprint(None) == fingerprint("")
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get(self):
+        assert DeliveryJournal.get(self.path) is self.journal
+        other = DeliveryJournal.get(os.path.join(self.tmpdir.name, "other.db"))
+        assert other is not self.journal
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_states(self):
+        assert self.journal.lookup("slack-foo", "1") == None
+        self.journal.pending("slack-foo", "1", "Foo")
+        entry = self.journal.lookup("slack-foo", "1")
+        assert entry[:3] == (PENDING, None, fingerprint("Foo"))
+        assert self.journal.pending_entries("slack-foo") == {"1": entry}
+        assert self.journal.pending_entries("slack-bar") == {}
+
+        self.journal.delivered("slack-foo", "1", "1475157232.000001")
+        assert self.journal.lookup("slack-foo", "1") == (
+            DELIVERED, "1475157232.000001", fingerprint("Foo"), entry[3])
+        assert self.journal.pending_entries("slack-foo") == {}
+        assert len(self.journal) == 1
+
+        self.journal.remove("slack-foo", "1")
+        self.journal.remove("slack-foo", "unknown")
+        assert self.journal.lookup("slack-foo", "1") == None
+        assert len(self.journal) == 0
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_persisted(self):
+        self.journal.pending("slack-foo", "1", "Foo")
+        self.journal.pending("slack-foo", "2", "Bar")
+        self.journal.delivered("slack-foo", "2", "1475157232.000002")
+        self.journal.pending("slack-foo", "3", "Baz")
+        self.journal.remove("slack-foo", "3")
+        entries = dict(self.journal.entries)
+        DeliveryJournal.clear()
+
+        journal = DeliveryJournal.get(self.path)
+        assert journal is not self.journal
+        assert journal.entries == entries
+        assert journal.lookup("slack-foo", "2")[:2] == (DELIVERED, "1475157232.000002")
+        assert list(journal.pending_entries("slack-foo").keys()) == ["1"]
+        assert journal.is_delivered("slack-foo", "1475157232.000002") == True
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_indexes(self):
+        self.journal.pending("slack-foo", "1", "Foo")
+        self.journal.pending("slack-bar", "1", "Foo")
+        self.journal.delivered("slack-foo", "1", "1475157232.000001")
+        assert self.journal.pending_entries("slack-foo") == {}
+        assert list(self.journal.pending_entries("slack-bar").keys()) == ["1"]
+        assert self.journal.is_delivered("slack-foo", "1475157232.000001") == True
+        assert self.journal.is_delivered("slack-bar", "1475157232.000001") == False
+
+        # sent again
+        self.journal.pending("slack-foo", "1", "Foo")
+        assert self.journal.is_delivered("slack-foo", "1475157232.000001") == False
+        assert list(self.journal.pending_entries("slack-foo").keys()) == ["1"]
+        self.journal.remove("slack-foo", "1")
+        self.journal.remove("slack-bar", "1")
+        assert self.journal.pending_entries("slack-foo") == {}
+        assert self.journal.pending_entries("slack-bar") == {}
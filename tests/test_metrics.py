@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import aiohttp
+import asyncio
+import asynctest
+import socket
+from asynctest import MagicMock
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.common import SlackClient
+from livebridge_slack.dispatch import Dispatcher
+from livebridge_slack.metrics import Histogram, MemorySink, Metrics, MetricsSink
+from livebridge_slack.ratelimit import Scheduler
+from livebridge_slack.rtm import RTMConnection
+from livebridge_slack import LiveblogSlackConverter, SlackScribbleliveConverter, SlackSource, SlackTarget
+from tests import load_json
+from tests.fake_slack import FakeSlack
+
+
+class MemorySinkTests(asynctest.TestCase):
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value)
+        assert histogram.counts == [2, 1]
+        assert histogram.count == 4
+        assert histogram.sum == 2.65
+        assert histogram.cumulative() == [(0.1, 2), (1.0, 3)]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_counters(self):
+        sink = MemorySink()
+        sink.inc("requests_total", method="chat.update", ok="true")
+        sink.inc("requests_total", 2, ok="true", method="chat.update")
+        sink.inc("requests_total", method="chat.delete", ok="false")
+        assert sink.value("requests_total", method="chat.update", ok="true") == 3
+        assert sink.value("requests_total", method="chat.delete", ok="false") == 1
+        assert sink.value("requests_total", method="chat.postMessage") == 0
+        assert sink.histogram("request_seconds") is None
+        sink.clear()
+        assert sink.counters == {}
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_render(self):
+        sink = MemorySink(buckets=(0.1, 1.0))
+        sink.inc("slack_requests_total", method="chat.update", status=200)
+        sink.inc("plain_total")
+        sink.observe("slack_request_seconds", 0.5, method='a"b')
+        assert sink.render().splitlines() == [
+            "# TYPE plain_total counter",
+            "plain_total 1",
+            "# HELP slack_request_seconds Latency of requests to the Slack API by method.",
+            "# TYPE slack_request_seconds histogram",
+            'slack_request_seconds_bucket{method="a\\"b",le="0.1"} 0',
+            'slack_request_seconds_bucket{method="a\\"b",le="1.0"} 1',
+            'slack_request_seconds_bucket{method="a\\"b",le="+Inf"} 1',
+            'slack_request_seconds_sum{method="a\\"b"} 0.5',
+            'slack_request_seconds_count{method="a\\"b"} 1',
+            "# HELP slack_requests_total Requests to the Slack API by method, HTTP status and ok field.",
+            "# TYPE slack_requests_total counter",
+            'slack_requests_total{method="chat.update",status="200"} 1',
+        ]
+
+
+class MetricsTests(asynctest.TestCase):
+
+    async def setUp(self):
+        ChannelIndex.clear()
+        Scheduler.clear()
+        Metrics.clear()
+        self.slack = await FakeSlack().start()
+        self.target = SlackTarget(config={"auth": {"token": "baz"}, "channel": "foo"})
+        self.target.endpoint = self.slack.endpoint
+
+    async def tearDown(self):
+        await Metrics.close()
+        Metrics.clear()
+        await SlackClient.close_session()
+        await self.slack.close()
+
+    async def test_requests(self):
+        self.slack.rate_limited["chat.postMessage"] = 2
+        post = MagicMock()
+        post.content = "Test"
+        resp = await self.target.post_item(post)
+        assert resp["ok"] == True
+        sink = Metrics.sink
+        assert sink.value("slack_requests_total", method="chat.postMessage", status=429, ok="false") == 2
+        assert sink.value("slack_requests_total", method="chat.postMessage", status=200, ok="true") == 1
+        assert sink.value("slack_requests_total", method="channels.list", status=200, ok="true") == 1
+        assert sink.value("slack_rate_limited_total", method="chat.postMessage") == 2
+        assert sink.histogram("slack_request_seconds", method="chat.postMessage").count == 3
+        retries = sink.histogram("slack_retry_wait_seconds", method="chat.postMessage")
+        assert retries.count == 2
+        assert retries.sum == 0.02
+        assert sink.histogram("slack_ratelimit_wait_seconds", method="chat.postMessage").count == 1
+
+    async def test_disabled(self):
+        Metrics.set_sink(None)
+        assert Metrics.enabled == False
+        post = MagicMock()
+        post.content = "Test"
+        assert (await self.target.post_item(post))["ok"] == True
+        Metrics.inc("foo")
+        Metrics.observe("bar", 1)
+
+        # other sinks
+        sink = MagicMock(spec=MetricsSink)
+        Metrics.set_sink(sink)
+        await self.target.post_item(post)
+        assert sink.observe.call_args_list[0] == asynctest.call(
+            "slack_ratelimit_wait_seconds", asynctest.ANY, method="chat.postMessage")
+        assert sink.inc.call_args == asynctest.call(
+            "slack_requests_total", 1, method="chat.postMessage", status=200, ok="true")
+
+    async def test_configure(self):
+        Metrics.configure(None)
+        Metrics.configure({})
+        assert Metrics.enabled == True
+        assert Metrics._server is None
+        SlackSource(config={"metrics": {"enabled": False}})
+        assert Metrics.enabled == False
+
+    async def test_serve(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        Metrics.configure({"host": "127.0.0.1", "port": port})
+        await asyncio.sleep(0.05)
+        Metrics.inc("slack_ws_frames_received_total")
+        async with aiohttp.ClientSession() as session:
+            async with session.get("http://127.0.0.1:{}/metrics".format(port)) as resp:
+                assert resp.status == 200
+                assert resp.headers["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+                assert "slack_ws_frames_received_total 1\n" in await resp.text()
+            Metrics.set_sink(MagicMock(spec=MetricsSink))
+            async with session.get("http://127.0.0.1:{}/metrics".format(port)) as resp:
+                assert resp.status == 404
+        await Metrics.close()
+        assert Metrics._server is None
+
+    async def test_source_frames(self):
+        source = SlackSource(config={"auth": {"token": "baz"}, "channel": "foo"})
+        source._channel_id = "C1"
+        source.dispatcher = MagicMock(put=asynctest.CoroutineMock())
+        connection = RTMConnection("https://slack.com/api/", "baz")
+        connection.sources = {"C1": [source]}
+        await connection._route('{"type":"presence_change","user":"U1F2VML58"}')
+        await connection._route('{"type":"message","channel":"C1","text":"Foo","ts":"1"}')
+        await connection._route('{"type":"message","channel":"C1","subtype":"message_deleted","hidden":true,'
+                                '"deleted_ts":"1","ts":"2"}')
+        await connection._route('{"type":"message","channel":"C1","subtype":"channel_topic","hidden":true,"ts":"3"}')
+        sink = Metrics.sink
+        assert sink.value("slack_ws_frames_received_total") == 4
+        assert sink.value("slack_ws_frames_accepted_total", action="create") == 1
+        assert sink.value("slack_ws_frames_accepted_total", action="delete") == 1
+        await connection.client.close()
+
+    async def test_dispatch_lag(self):
+        dispatcher = Dispatcher(asynctest.CoroutineMock(), workers=2)
+        dispatcher.start()
+        for x in range(3):
+            await dispatcher.put(x, x)
+        await dispatcher.close()
+        assert Metrics.sink.histogram("slack_dispatch_lag_seconds").count == 3
+
+    async def test_convert(self):
+        LiveblogSlackConverter.cache.clear()
+        await LiveblogSlackConverter().convert(load_json("post_to_convert.json"))
+        await LiveblogSlackConverter().convert(load_json("post_to_convert.json"))
+        sink = Metrics.sink
+        # cached items aren't converted again
+        assert sink.histogram("slack_convert_seconds", converter="liveblog_slack", item_type="text").count == 3
+        assert sink.histogram("slack_convert_seconds", converter="liveblog_slack", item_type="image").count == 1
+        await SlackScribbleliveConverter().convert({"text": "*foo*"})
+        assert sink.histogram("slack_convert_seconds", converter="slack_scribblelive", item_type="message").count == 1
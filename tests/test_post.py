@@ -30,7 +30,10 @@ class SlackPostTest(asynctest.TestCase):
 
     @asynctest.fail_on(unused_loop=False)
     def test_init(self):
-        assert self.sp.data == self.post
+        expected = deepcopy(self.post)
+        for key in ["previous_message", "hidden", "event_ts"]:
+            del expected[key]
+        assert self.sp.data == expected
         assert hasattr(self.sp, "is_deleted") == True
         assert hasattr(self.sp, "is_update") == True
         assert self.sp.id == self.post["message"]["ts"]
@@ -45,29 +48,36 @@ class SlackPostTest(asynctest.TestCase):
         # ignore/submitted
         # should be update
         self.post["livebridge"]["action"] = "update"
-        assert self.sp.get_action() == "update"
+        assert SlackPost(self.post).get_action() == "update"
 
         # test delete
         self.post["livebridge"]["action"] = "delete"
-        assert self.sp.get_action() == "delete"
+        assert SlackPost(self.post).get_action() == "delete"
 
         # test ignore for unknown
         self.post["livebridge"]["action"] = "create"
-        assert self.sp.get_action() == "create"
+        assert SlackPost(self.post).get_action() == "create"
+
+        del self.post["livebridge"]
+        assert SlackPost(self.post).get_action() == None
 
     @asynctest.fail_on(unused_loop=False)
     def test_get_updated(self):
         assert self.sp.updated == datetime(2016, 10, 4, 11, 8, 27, 4)
         assert self.sp.created == datetime(2016, 10, 4, 11, 0, 6, 2)
-        del self.sp.data["message"]
-        assert self.sp.updated == datetime(2016, 10, 4, 11, 8, 27, 4)
-        assert self.sp.created == datetime(2016, 10, 4, 11, 8, 27, 4)
+        # cached
+        assert self.sp.updated is self.sp.updated
+        assert self.sp.created is self.sp.created
+        del self.post["message"]
+        sp = SlackPost(self.post)
+        assert sp.updated == datetime(2016, 10, 4, 11, 8, 27, 4)
+        assert sp.created == datetime(2016, 10, 4, 11, 8, 27, 4)
 
     @asynctest.fail_on(unused_loop=False)
     def test_get_deleted_id(self):
         assert self.sp.id==  "1475578806.000002"
-        self.sp.data["deleted_ts"] = "foo"
-        assert self.sp.id == "foo"
+        self.post["deleted_ts"] = "foo"
+        assert SlackPost(self.post).id == "foo"
 
     @asynctest.fail_on(unused_loop=False)
     def test_is_not_delete(self):
@@ -79,19 +89,50 @@ class SlackPostTest(asynctest.TestCase):
 
     @asynctest.fail_on(unused_loop=False)
     def test_is_deleted(self):
-        self.sp.data["livebridge"]["action"] = "delete"
-        assert self.sp.is_deleted == True
+        self.post["livebridge"]["action"] = "delete"
+        assert SlackPost(self.post).is_deleted == True
 
-        self.sp.data["livebridge"]["action"] = "update"
-        assert self.sp.is_deleted == False
+        self.post["livebridge"]["action"] = "update"
+        assert SlackPost(self.post).is_deleted == False
 
     @asynctest.fail_on(unused_loop=False)
     def test_is_update(self):
-        self.sp.data["livebridge"]["action"] = "update"
-        assert self.sp.is_update == True
+        self.post["livebridge"]["action"] = "update"
+        assert SlackPost(self.post).is_update == True
 
-        self.sp.data["livebridge"]["action"] = "delete"
-        assert self.sp.is_update == False
+        self.post["livebridge"]["action"] = "delete"
+        assert SlackPost(self.post).is_update == False
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_compact(self):
+        assert self.sp.data["message"] == {
+            'user': 'U1F2VML58', 'text': 'Developments', 'ts': '1475578806.000002',
+            'edited': {'user': 'U1F2VML58', 'ts': '1475579307.000000'}, 'type': 'message'}
+        assert "previous_message" not in self.sp.data
+        # source doc is untouched
+        assert self.post == SOURCE_DOC
+        # the attributes set by livebridge are kept in slots, not in the instance dict,
+        # which exists nonetheless, since BasePost isn't slotted
+        self.sp.target_doc = {"ts": "1"}
+        self.sp.set_existing({"target_id": "foo"})
+        self.sp.content = "foo"
+        self.sp.images = []
+        assert set(SlackPost.__slots__) >= {"data", "content", "images", "_existing", "_target_id", "_target_doc"}
+        assert vars(self.sp) == {}
+        self.sp.foo = 1
+        assert vars(self.sp) == {"foo": 1}
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_deepcopy(self):
+        self.sp.target_doc = {"ts": "1"}
+        sp = deepcopy(self.sp)
+        assert sp.data == self.sp.data
+        assert sp.data is not self.sp.data
+        assert sp.id == self.sp.id
+        assert sp.updated == self.sp.updated
+        assert sp.get_action() == "update"
+        assert sp.target_doc == {"ts": "1"}
+        assert sp.content == self.content
 
     @asynctest.fail_on(unused_loop=False)
     def test_target_doc(self):
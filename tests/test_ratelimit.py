@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+from asynctest import MagicMock
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.common import SlackClient
+from livebridge_slack.ratelimit import RateLimited, RateLimiter, Scheduler
+from livebridge_slack import SlackTarget
+from tests.fake_slack import FakeSlack
+
+
+class RateLimiterTests(asynctest.TestCase):
+
+    def setUp(self):
+        Scheduler.clear()
+
+    async def test_run(self):
+        limiter = RateLimiter(60, 2)
+        func = asynctest.CoroutineMock(return_value={"ok": True})
+        assert await limiter.run(func) == {"ok": True}
+        assert limiter.stats()["requests"] == 1
+        assert limiter.stats()["queued"] == 0
+
+    async def test_run_in_order(self):
+        limiter = RateLimiter(6000, 1)
+        started = []
+
+        async def func(x):
+            started.append(x)
+            await asyncio.sleep(0.01 if x % 2 else 0)
+        await asyncio.gather(*[limiter.run(lambda x=x: func(x)) for x in range(5)])
+        assert started == [0, 1, 2, 3, 4]
+        # waited for tokens
+        assert limiter.stats()["wait_max"] > 0
+
+    async def test_run_concurrently(self):
+        limiter = RateLimiter(6000, 3)
+        running = []
+
+        async def func():
+            running.append(True)
+            await asyncio.sleep(0.05)
+            concurrent.append(len(running))
+            running.pop()
+        concurrent = []
+        await asyncio.gather(*[limiter.run(func) for _ in range(3)])
+        # slow responses don't hold back the next requests
+        assert max(concurrent) == 3
+
+    async def test_queue_depth(self):
+        limiter = RateLimiter(6000, 1)
+        event = asyncio.Event()
+
+        async def func():
+            await event.wait()
+        tasks = [asyncio.ensure_future(limiter.run(func)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queued"] == 3
+        event.set()
+        await asyncio.gather(*tasks)
+        assert limiter.stats()["queued"] == 0
+
+    async def test_rate_limited(self):
+        limiter = RateLimiter(6000, 5)
+        func = asynctest.CoroutineMock(side_effect=[RateLimited(0.02), {"ok": True}])
+        start = self.loop.time()
+        assert await limiter.run(func) == {"ok": True}
+        assert self.loop.time() - start >= 0.02
+        assert func.call_count == 2
+        assert limiter.stats()["limited"] == 1
+
+    async def test_rate_limited_too_often(self):
+        limiter = RateLimiter(6000, 5)
+        limiter.max_retries = 2
+        func = asynctest.CoroutineMock(side_effect=RateLimited(0))
+        assert await limiter.run(func) == {}
+        assert func.call_count == 3
+
+    async def test_scheduler(self):
+        post_a = Scheduler.get("token", "chat.postMessage", "A")
+        assert post_a is Scheduler.get("token", "chat.postMessage", "A")
+        assert post_a is not Scheduler.get("token", "chat.postMessage", "B")
+        assert post_a is not Scheduler.get("other", "chat.postMessage", "A")
+        # limited per workspace
+        assert Scheduler.get("token", "chat.update", "A") is Scheduler.get("token", "chat.update", "B")
+        assert ("token", "chat.update", None) in Scheduler.stats()
+        assert Scheduler.stats()[("token", "chat.postMessage", "A")]["requests"] == 0
+
+
+class RateLimitedTargetTests(asynctest.TestCase):
+
+    async def setUp(self):
+        ChannelIndex.clear()
+        Scheduler.clear()
+        self.slack = await FakeSlack().start()
+        self.target = SlackTarget(config={"auth": {"token": "baz"}, "channel": "foo"})
+        self.target.endpoint = self.slack.endpoint
+
+    async def tearDown(self):
+        await SlackClient.close_session()
+        await self.slack.close()
+
+    async def test_post_item_rate_limited(self):
+        self.slack.rate_limited["chat.postMessage"] = 2
+        post = MagicMock()
+        post.content = "Test"
+        resp = await self.target.post_item(post)
+        assert resp["ok"] == True
+        assert resp["channel"] == "C1123456"
+        assert len(self.slack.calls_of("chat.postMessage")) == 3
+        stats = Scheduler.stats()[("baz", "chat.postMessage", "C1123456")]
+        assert stats["limited"] == 2
+        assert stats["requests"] == 3
+
+    async def test_burst_not_dropped(self):
+        self.slack.rate_limited["chat.update"] = 2
+        posts = []
+        for x in range(3):
+            post = MagicMock()
+            post.content = "Update {}".format(x)
+            post.target_doc = {"ts": "1475157232.000001"}
+            posts.append(post)
+        res = await asyncio.gather(*[self.target.update_item(p) for p in posts])
+        assert [r["ok"] for r in res] == [True] * 3
+        texts = [c["text"] for c in self.slack.calls_of("chat.update")]
+        # the rate limited ones are retried
+        assert len(texts) == 5
+        assert sorted(set(texts)) == ["Update 0", "Update 1", "Update 2"]
+
+    async def test_channel_list_rate_limited(self):
+        self.slack.rate_limited["channels.list"] = 1
+        assert await self.target.channel_id == "C1123456"
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import asyncio
+import websockets
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.common import SlackClient
+from livebridge_slack.rtm import RTMConnection
+from livebridge_slack import SlackSource
+
+MSG = """{{"type":"message","channel":"{}","user":"U1F2VML58","text":"Foo","ts":"{}"}}"""
+PRESENCE = """{"type":"presence_change","presence":"away","user":"U1F2VML58"}"""
+
+
+class FakeWebsocket(object):
+
+    def __init__(self, frames, close_code=None, pong=True):
+        self.frames = list(frames)
+        self.close_code = close_code
+        self.pong = pong
+        self.pings = 0
+        self.open = True
+        self.closed = asyncio.get_event_loop().create_future()
+
+    async def recv(self):
+        if self.frames:
+            return self.frames.pop(0)
+        if self.close_code:
+            self.open = False
+            raise websockets.exceptions.ConnectionClosed(self.close_code, "")
+        await asyncio.shield(self.closed)
+        raise websockets.exceptions.ConnectionClosed(1000, "")
+
+    async def ping(self):
+        self.pings += 1
+        pong = asyncio.get_event_loop().create_future()
+        if self.pong:
+            pong.set_result(None)
+        return pong
+
+    async def close(self, reason=""):
+        self.open = False
+        if not self.closed.done():
+            self.closed.set_result(True)
+
+
+class RTMConnectionTests(asynctest.TestCase):
+
+    def setUp(self):
+        ChannelIndex.clear()
+        RTMConnection._connections.clear()
+        self.config = {"auth": {"token": "baz"}, "channel": "foo"}
+
+    async def tearDown(self):
+        for connection in list(RTMConnection._connections.values()):
+            await connection.close()
+        await SlackClient.close_session()
+
+    def _source(self, channel_id):
+        source = SlackSource(config=self.config)
+        source._channel_id = channel_id
+        source._handle_msg = asynctest.CoroutineMock(return_value=None)
+        source._disconnected = asynctest.MagicMock()
+        source._backfill = asynctest.CoroutineMock(return_value=None)
+        return source
+
+    async def test_get(self):
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        assert connection.key == ("https://slack.com/api/", "baz")
+        assert RTMConnection.get(self._source("C2")) is connection
+        other = SlackSource(config={"auth": {"token": "other"}})
+        assert RTMConnection.get(other) is not connection
+
+    async def test_get_ws_url(self):
+        connection = RTMConnection.get(self._source("C1"))
+        connection.client._post = asynctest.CoroutineMock(return_value={"url": "ws://foo"})
+        res = await connection._get_ws_url()
+        assert res == "ws://foo"
+        assert connection.client._post.call_args == asynctest.call(
+            "https://slack.com/api/rtm.start", [("token", "baz")])
+
+    async def test_shared_connection(self):
+        frames = [PRESENCE, MSG.format("C1", "1"), MSG.format("C2", "2"), MSG.format("C3", "3")]
+        websocket = FakeWebsocket(frames)
+        source_one, source_two, source_three = self._source("C1"), self._source("C2"), self._source("C2")
+        connection = RTMConnection.get(source_one)
+        connection.client._post = asynctest.CoroutineMock(return_value={"url": "ws://foo"})
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(return_value=websocket)) as patched:
+            for source in [source_one, source_two, source_three]:
+                RTMConnection.get(source).add(source)
+            await asyncio.sleep(0.01)
+            assert patched.call_count == 1
+            assert patched.call_args == asynctest.call("ws://foo")
+        assert connection.frames == 4
+        assert connection.routed == 2
+        assert source_one._handle_msg.call_count == 1
+        assert source_one._handle_msg.call_args[0][0]["ts"] == "1"
+        assert source_two._handle_msg.call_count == 1
+        assert source_three._handle_msg.call_count == 1
+        # every source gets its own copy
+        assert source_two._handle_msg.call_args[0][0] is not source_three._handle_msg.call_args[0][0]
+
+        # stays open until the last source is removed
+        await connection.remove(source_one)
+        await connection.remove(source_two)
+        assert websocket.open == True
+        assert RTMConnection._connections
+        await connection.remove(source_three)
+        assert websocket.open == False
+        assert RTMConnection._connections == {}
+        assert connection._task is None
+
+    async def test_reconnect(self):
+        websockets_ = [FakeWebsocket([MSG.format("C1", "1")], close_code=1006),
+                       FakeWebsocket([MSG.format("C1", "2")], close_code=1000),
+                       FakeWebsocket([MSG.format("C1", "3")])]
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection.backoff_base = 0
+        connection._get_ws_url = asynctest.CoroutineMock(return_value="ws://foo")
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(side_effect=websockets_)) as patched:
+            connection.add(source)
+            await asyncio.sleep(0.01)
+            assert patched.call_count == 3
+        assert connection.reconnects == 2
+        assert source._handle_msg.call_count == 3
+        # missed messages get replayed after reconnecting only
+        assert source._backfill.call_count == 2
+        assert source._disconnected.call_count == 0
+        await connection.remove(source)
+
+    async def test_reconnect_failing(self):
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection.backoff_base = 0
+        connection._get_ws_url = asynctest.CoroutineMock(side_effect=[None, "ws://foo", "ws://foo"])
+        websocket = FakeWebsocket([MSG.format("C1", "1")])
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(side_effect=[ConnectionRefusedError(), websocket])) as patched:
+            connection.add(source)
+            await asyncio.sleep(0.01)
+            assert patched.call_count == 2
+        assert connection._attempts == 0
+        assert source._handle_msg.call_count == 1
+        assert source._backfill.call_count == 0
+        await connection.remove(source)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_backoff(self):
+        connection = RTMConnection("https://slack.com/api/", "baz")
+        delays = [connection._backoff() for _ in range(10)]
+        for attempt, delay in enumerate(delays):
+            expected = min(connection.backoff_max, connection.backoff_base * 2 ** attempt)
+            assert expected / 2 <= delay <= expected
+        assert delays[-1] <= connection.backoff_max
+
+    async def test_heartbeat(self):
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection.heartbeat_interval = 0.01
+        connection.heartbeat_timeout = 0.01
+        connection.websocket = FakeWebsocket([])
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(connection._recv(), 0.05)
+        assert connection.websocket.pings >= 2
+
+        # dead connection
+        connection.websocket = FakeWebsocket([], pong=False)
+        with self.assertRaises(ConnectionError):
+            await connection._recv()
+        assert connection.websocket.pings == 1
+
+    async def test_close(self):
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection._get_ws_url = asynctest.CoroutineMock(return_value="ws://foo")
+        websocket = FakeWebsocket([])
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(return_value=websocket)):
+            connection.add(source)
+            await asyncio.sleep(0.01)
+            await connection.close()
+        assert websocket.open == False
+        assert source._disconnected.call_count == 1
+        assert connection.sources == {}
+        assert RTMConnection._connections == {}
+
+    async def test_route_invalid_frame(self):
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection.client._post = asynctest.CoroutineMock(return_value={"url": "ws://foo"})
+        websocket = FakeWebsocket(['{"type":"message", invalid', MSG.format("C1", "1")])
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(return_value=websocket)):
+            connection.add(source)
+            await asyncio.sleep(0.01)
+        assert connection.frames == 2
+        assert source._handle_msg.call_count == 1
+        await connection.remove(source)
+
+    async def test_route_prefilter(self):
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection.sources = {"C1": [source]}
+        with asynctest.patch("livebridge_slack.rtm.json_loads") as patched:
+            await connection._route(PRESENCE)
+            assert patched.call_count == 0
+        # other channel
+        await connection._route(MSG.format("C2", "1"))
+        assert source._handle_msg.call_count == 0
+        await connection._route(MSG.format("C1", "1"))
+        assert source._handle_msg.call_args == asynctest.call({
+            "type": "message", "channel": "C1", "user": "U1F2VML58", "text": "Foo", "ts": "1"})
+        assert connection.frames == 3
+        assert connection.routed == 1
+
+    async def test_route_channel_object(self):
+        joined = ('{"type":"channel_joined","channel":{"id":"C1","name":"foo","latest":'
+                  '{"type":"message","user":"U1F2VML58","text":"Foo","ts":"1"}}}')
+        source = self._source("C1")
+        # a failing frame doesn't close the connection either
+        source._handle_msg.side_effect = [Exception("Test"), None]
+        connection = RTMConnection.get(source)
+        connection.client._post = asynctest.CoroutineMock(return_value={"url": "ws://foo"})
+        websocket = FakeWebsocket([joined, '["message"]', MSG.format("C1", "2"), MSG.format("C1", "3")])
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(return_value=websocket)) as patched:
+            connection.add(source)
+            await asyncio.sleep(0.01)
+            assert patched.call_count == 1
+        assert connection.frames == 4
+        assert connection.reconnects == 0
+        assert [c[0][0]["ts"] for c in source._handle_msg.call_args_list] == ["2", "3"]
+        await connection.remove(source)
+
+    async def test_frames_after_close(self):
+        # frames received before the connection was closed by Slack are still routed
+        websocket = FakeWebsocket([MSG.format("C1", "1"), MSG.format("C1", "2")], close_code=1006)
+        websocket.open = False
+        source = self._source("C1")
+        connection = RTMConnection.get(source)
+        connection.backoff_base = 10
+        connection._get_ws_url = asynctest.CoroutineMock(return_value="ws://foo")
+        with asynctest.patch("livebridge_slack.rtm.websockets.connect",
+                             asynctest.CoroutineMock(return_value=websocket)):
+            connection.add(source)
+            await asyncio.sleep(0.01)
+        assert source._handle_msg.call_count == 2
+        await connection.remove(source)
@@ -16,18 +16,25 @@
 import asynctest
 import asyncio
 import json
-import websockets
+import os
+import tempfile
+import time
 from asynctest import MagicMock
-from livebridge.base import StreamingSource
+from datetime import datetime
+from livebridge.base import PollingSource, StreamingSource
+from livebridge_slack.channels import ChannelIndex
+from livebridge_slack.checkpoint import CheckpointStore
 from livebridge_slack.common import SlackClient
-from livebridge_slack import SlackSource
+from livebridge_slack import SlackSource, SlackPollingSource
 from tests import load_json
 
 SLACK_MSG = """{"type":"message","message":{"type":"message","user":"U1F2VML58","text":"Foo baz","edited":{"user":"U1F2VML58","ts":"1475166092.000000"},"ts":"1475157232.000011"},"subtype":"message_changed","hidden":true,"channel":"C1123456","previous_message":{"type":"message","user":"U1F2VML58","text":"Foo baz!","edited":{"user":"U1F2VML58","ts":"1475166025.000000"},"ts":"1475157232.000011"},"event_ts":"1475166092.396510","ts":"1475166092.000018"}"""
+SLACK_CREATE_MSG = """{"type":"message","user":"U1F2VML58","text":"Foo bar","channel":"C1123456","ts":"1475166100.000019"}"""
 
 class SlackSourceTests(asynctest.TestCase):
 
     def setUp(self):
+        ChannelIndex.clear()
         self.token = "baz"
         self.channel = "foo"
         self.source = SlackSource(config={"auth": {"token":self.token}, "channel": self.channel})
@@ -42,88 +49,304 @@ class SlackSourceTests(asynctest.TestCase):
         assert issubclass(SlackSource, StreamingSource) == True
 
     async def test_stop(self):
-        self.source.websocket = MagicMock()
-        self.source.websocket.close = asynctest.CoroutineMock(return_value=True)
+        self.source.connection = MagicMock()
+        self.source.connection.remove = asynctest.CoroutineMock(return_value=None)
+        connection = self.source.connection
         res = await self.source.stop()
         assert res == True
+        assert connection.remove.call_args == asynctest.call(self.source)
+        assert self.source.connection is None
 
-    async def test_get_ws_url(self):
-        api_res = {"url": "wss:example.com"}
-        self.source._post = asynctest.CoroutineMock(return_value=api_res)
-        res = await self.source._get_ws_url()
-        assert res == api_res["url"]
-        self.source._post.assert_called_once_with('https://slack.com/api/rtm.start', [('token', 'baz')])
+        # not listening
+        res = await self.source.stop()
+        assert res == True
 
     async def test_listen(self):
-            conn = MagicMock(spec=websockets.client.WebSocketClientProtocol)
-            conn.open = True
-            conn.recv = asynctest.CoroutineMock(return_value=SLACK_MSG)
-            conn.close = asynctest.CoroutineMock(return_value=True)
-            websockets.connect = asynctest.CoroutineMock(return_value=True)
-            async def side_effect():
-                conn.open = False
-            websockets.connect.return_value=conn
-
-            self.source._get_ws_url = asynctest.CoroutineMock(return_value="ws://example.com")
-            self.source._inspect_msg = asynctest.CoroutineMock(return_value=SLACK_MSG, side_effect=["foo", "baz", side_effect()])
-            self.source._channel_id = "baz"
-
-            cb = asynctest.CoroutineMock(return_value=True)
-            res = await self.source.listen(cb)
-            assert self.source._inspect_msg.call_count == 3
-            assert cb.call_count == 2
+        self.source._channel_id = "C1123456"
+        connection = MagicMock()
 
-            # fail with exception I
-            self.source.websocket = "Test"
-            websockets.connect = asynctest.CoroutineMock(side_effect=Exception("Test"))
-            res = await self.source.listen(cb)
-            assert res == True
-            assert self.source.websocket == "Test"
+        def add(source):
+            async def receive():
+                await source._handle_msg(json.loads(SLACK_MSG))
+                await source._handle_msg(json.loads(SLACK_MSG.replace("C1123456", "C6543211")))
+                await source._handle_msg(json.loads(SLACK_CREATE_MSG))
+                # already dispatched
+                await source._handle_msg(json.loads(SLACK_CREATE_MSG))
+                await source._handle_msg(json.loads(SLACK_MSG))
+                source._disconnected()
+            asyncio.ensure_future(receive())
+        connection.add = add
 
-            # fail with exception II
-            websockets.connect = asynctest.CoroutineMock(side_effect=ConnectionRefusedError("ConnectionRefusedError"))
+        cb = asynctest.CoroutineMock(return_value=True)
+        with asynctest.patch("livebridge_slack.rtm.RTMConnection.get", return_value=connection) as patched:
             res = await self.source.listen(cb)
             assert res == True
-            assert self.source.websocket == "Test"
+            assert patched.call_args == asynctest.call(self.source)
+        assert self.source.connection is connection
+        assert cb.call_count == 2
+        assert cb.call_args_list[0][0][0][0].get_action() == "update"
+        assert cb.call_args_list[1][0][0][0].get_action() == "create"
+        assert self.source.dispatcher.stats()["dispatched"] == 2
 
-            # fail with exception III
-            websockets.connect = asynctest.CoroutineMock(
-                side_effect=websockets.exceptions.ConnectionClosed(code=1006, reason="Testing"))
-            res = await self.source.listen(cb)
-            assert res == True
-            assert self.source.websocket == "Test"
+    async def test_listen_stopped(self):
+        self.source._channel_id = "C1123456"
+        connection = MagicMock()
+        connection.remove = asynctest.CoroutineMock(return_value=None)
+        cb = asynctest.CoroutineMock(return_value=True)
+        with asynctest.patch("livebridge_slack.rtm.RTMConnection.get", return_value=connection):
+            listening = asyncio.ensure_future(self.source.listen(cb))
+            await asyncio.sleep(0.01)
+            assert connection.add.call_args == asynctest.call(self.source)
+            assert listening.done() == False
+            await self.source.stop()
+            assert await listening == True
+        assert connection.remove.call_args == asynctest.call(self.source)
+
+    async def test_listen_failing(self):
+        self.source._post = asynctest.CoroutineMock(side_effect=Exception("Test"))
+        cb = asynctest.CoroutineMock(return_value=True)
+        res = await self.source.listen(cb)
+        assert res == True
+        assert self.source.connection is None
+
+    async def test_listen_checkpoint(self):
+        CheckpointStore.clear()
+        tmpdir = tempfile.TemporaryDirectory()
+        config = {"auth": {"token": self.token}, "channel": self.channel, "dispatch_workers": 2,
+                  "checkpoint": os.path.join(tmpdir.name, "checkpoint.json")}
+        connection = MagicMock()
+        connection.remove = asynctest.CoroutineMock(return_value=None)
+        connection.connected = asyncio.Event()
+        connection.connected.set()
+
+        def add(source):
+            async def receive():
+                await source._handle_msg(json.loads(SLACK_CREATE_MSG))
+                await source._handle_msg(json.loads(SLACK_MSG))
+                source._disconnected()
+            asyncio.ensure_future(receive())
+        connection.add = add
+
+        source = SlackSource(config=config)
+        source._channel_id = "C1123456"
+        source._history = asynctest.CoroutineMock(return_value=[])
+        cb = asynctest.CoroutineMock(return_value=True)
+        with asynctest.patch("livebridge_slack.rtm.RTMConnection.get", return_value=connection):
+            assert await source.listen(cb) == True
+        assert cb.call_count == 2
+        assert source._history.call_count == 0
+        assert source.checkpoint.lookup("C1123456") == "1475166100.000019"
+        assert source.checkpoint.pending == 0
+        CheckpointStore.clear()
+
+        # restarted source fetches messages posted since the checkpoint
+        connection.add = lambda source: None
+        source = SlackSource(config=config)
+        source._channel_id = "C1123456"
+        dispatched = asyncio.Event()
+        source._history = asynctest.CoroutineMock(return_value=[
+            {"type": "message", "text": "new", "ts": "1475166200.000001"},
+            {"type": "message", "text": "Foo bar", "ts": "1475166100.000019"}])
+        cb = asynctest.CoroutineMock(side_effect=lambda posts: dispatched.set())
+        with asynctest.patch("livebridge_slack.rtm.RTMConnection.get", return_value=connection):
+            listening = asyncio.ensure_future(source.listen(cb))
+            await asyncio.wait_for(dispatched.wait(), 1)
+            await source.stop()
+            assert await listening == True
+        assert source._history.call_args == asynctest.call("1475166100.000019")
+        assert cb.call_count == 1
+        assert cb.call_args[0][0][0].id == "1475166200.000001"
+        assert source.checkpoint.lookup("C1123456") == "1475166200.000001"
+        CheckpointStore.clear()
+        assert CheckpointStore.get(config["checkpoint"]).lookup("C1123456") == "1475166200.000001"
+        CheckpointStore.clear()
+        tmpdir.cleanup()
 
     async def test_inspect(self):
         self.source._channel_id = "C1123456"
         exp_res = json.loads(SLACK_MSG)
         # update
         exp_res["livebridge"] = {"action": "update"}
-        res = await self.source._inspect_msg(SLACK_MSG)
+        res = self.source._inspect_doc(json.loads(SLACK_MSG))
         assert res == exp_res
         # create
         exp_res["livebridge"] = {"action": "create"}
         exp_res["hidden"] = False
-        res = await self.source._inspect_msg(SLACK_MSG.replace('"hidden":true', '"hidden":false'))
+        res = self.source._inspect_doc(json.loads(SLACK_MSG.replace('"hidden":true', '"hidden":false')))
         assert res == exp_res
         # delete
         exp_res["livebridge"] = {"action": "delete"}
         exp_res["hidden"] = True
         exp_res["subtype"] = "message_deleted"
-        res = await self.source._inspect_msg(SLACK_MSG.replace('"subtype":"message_changed"', '"subtype":"message_deleted"'))
+        res = self.source._inspect_doc(json.loads(SLACK_MSG.replace('"subtype":"message_changed"', '"subtype":"message_deleted"')))
         assert res == exp_res
 
-    async def test_inspect_unknown_message(self):
-        res = await self.source._inspect_msg("{}")
-        assert res == None
+    @asynctest.fail_on(unused_loop=False)
+    def test_inspect_unknown_message(self):
+        self.source._channel_id = "C1123456"
+        assert self.source._inspect_doc({}) == None
+        assert self.source._inspect_doc(json.loads(SLACK_MSG.replace("C1123456", "C6543211"))) == None
+
+    async def test_history(self):
+        self.source._channel_id = "C1123456"
+        self.source._post = asynctest.CoroutineMock(side_effect=[
+            {"ok": True, "messages": [{"ts": "3"}, {"ts": "2"}], "has_more": True,
+             "response_metadata": {"next_cursor": "abc"}},
+            {"ok": True, "messages": [{"ts": "1"}], "has_more": False}])
+        res = await self.source._history("1")
+        assert res == [{"ts": "3"}, {"ts": "2"}, {"ts": "1"}]
+        assert self.source._post.call_count == 2
+        assert self.source._post.call_args_list[0] == asynctest.call(
+            "https://slack.com/api/conversations.history",
+            [("token", "baz"), ("channel", "C1123456"), ("oldest", "1"), ("inclusive", "true"), ("limit", 200)])
+        assert self.source._post.call_args_list[1][0][1][-1] == ("cursor", "abc")
 
-    async def test_inspect_failing(self):
-        res = await self.source._inspect_msg({})
+        # failing page
+        self.source._post = asynctest.CoroutineMock(side_effect=[
+            {"ok": True, "messages": [{"ts": "3"}], "has_more": True, "response_metadata": {"next_cursor": "abc"}},
+            {}])
+        res = await self.source._history("1")
         assert res == None
 
-    async def test_reconnect(self):
-        self.source.listen = asynctest.CoroutineMock(return_value=None)
-        cb = "test"
-        res = self.source.reconnect(cb)
-        asyncio.sleep(2)
-        assert self.source.listen.call_count == 1
-        assert self.source.listen.call_args == asynctest.call(cb)
+    async def test_backfill(self):
+        self.source._channel_id = "C1123456"
+        self.source.dispatcher = MagicMock()
+        self.source.dispatcher.put = asynctest.CoroutineMock(return_value=None)
+        for ts, text in [("10.000001", "kept"), ("11.000001", "edited"), ("12.000001", "deleted")]:
+            await self.source._handle_msg({"type": "message", "channel": "C1123456", "text": text, "ts": ts})
+        assert self.source.history.last_ts == "12.000001"
+        assert self.source.dispatcher.put.call_count == 3
+
+        self.source.dispatcher.put.reset_mock()
+        self.source._history = asynctest.CoroutineMock(return_value=[
+            {"type": "message", "text": "new two", "ts": "15.000001"},
+            {"type": "message", "text": "new one", "ts": "13.000001"},
+            {"type": "message", "text": "changed", "ts": "11.000001", "edited": {"ts": "14.000001"}},
+            {"type": "message", "text": "kept", "ts": "10.000001"}])
+        await self.source._backfill()
+        assert self.source._history.call_args == asynctest.call("10.000001")
+        posts = [call[0][1] for call in self.source.dispatcher.put.call_args_list]
+        assert [(post.get_action(), post.id) for post in posts] == [
+            ("create", "13.000001"), ("update", "11.000001"), ("create", "15.000001"), ("delete", "12.000001")]
+        assert posts[1].data["message"]["text"] == "changed"
+        assert list(self.source.history.seen.keys()) == ["10.000001", "13.000001", "11.000001", "15.000001"]
+
+        # nothing missed
+        self.source.dispatcher.put.reset_mock()
+        self.source._history.return_value = self.source._history.return_value[:-1] + [
+            {"type": "message", "text": "kept", "ts": "10.000001"}]
+        await self.source._backfill()
+        assert self.source.dispatcher.put.call_count == 0
+
+    async def test_backfill_skipped(self):
+        self.source._history = asynctest.CoroutineMock(return_value=None)
+        # nothing received yet
+        await self.source._backfill()
+        assert self.source._history.call_count == 0
+        # failing history
+        self.source.history.last_ts = "10.000001"
+        self.source.history.seen["10.000001"] = 1
+        await self.source._backfill()
+        assert self.source._history.call_count == 1
+        assert list(self.source.history.seen.keys()) == ["10.000001"]
+        # disabled
+        self.source.history.size = 0
+        await self.source._backfill()
+        assert self.source._history.call_count == 1
+
+
+class SlackPollingSourceTests(asynctest.TestCase):
+
+    def setUp(self):
+        ChannelIndex.clear()
+        self.source = SlackPollingSource(config={"auth": {"token": "baz"}, "channel": "foo", "poll_interval": 10})
+        self.source._channel_id = "C1123456"
+        self.source.get_last_updated = asynctest.CoroutineMock(return_value=None)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_init(self):
+        assert self.source.type == "slack_polling"
+        assert self.source.mode == "polling"
+        assert issubclass(SlackPollingSource, SlackClient) == True
+        assert issubclass(SlackPollingSource, PollingSource) == True
+        assert self.source.poll_interval == 10
+        assert self.source.max_poll_interval == 600
+        assert self.source.history.size == 500
+
+    async def test_get_oldest(self):
+        self.source.get_last_updated.return_value = datetime(2016, 9, 29, 15, 20, 32, 11)
+        res = await self.source._get_oldest()
+        assert res == "1475162432.000011"
+        assert self.source.get_last_updated.call_args == asynctest.call("C1123456")
+        assert self.source.last_updated == datetime(2016, 9, 29, 15, 20, 32, 11)
+        # only once
+        res = await self.source._get_oldest()
+        assert self.source.get_last_updated.call_count == 1
+
+        # nothing in db yet
+        self.source.history.last_ts = None
+        self.source.get_last_updated.return_value = None
+        before = time.time()
+        res = await self.source._get_oldest()
+        assert before <= float(res) <= time.time() + 0.001
+
+    async def test_poll(self):
+        self.source.history.last_ts = "10.000001"
+        self.source._history = asynctest.CoroutineMock(return_value=[
+            {"type": "message", "text": "two", "ts": "12.000001"},
+            {"type": "message", "text": "one", "ts": "11.000001"}])
+        posts = await self.source.poll()
+        assert self.source._history.call_args == asynctest.call("10.000001")
+        assert [(post.get_action(), post.id, post.source_id) for post in posts] == [
+            ("create", "11.000001", "C1123456"), ("create", "12.000001", "C1123456")]
+        assert self.source.interval == 0
+
+        # edit and delete
+        self.source._history.return_value = [{"type": "message", "text": "changed", "ts": "11.000001",
+                                              "edited": {"ts": "13.000001"}}]
+        posts = await self.source.poll()
+        assert self.source._history.call_args == asynctest.call("11.000001")
+        assert [(post.get_action(), post.id) for post in posts] == [("update", "11.000001"), ("delete", "12.000001")]
+        assert posts[0].is_update == True
+        assert posts[1].is_deleted == True
+
+        # nothing new
+        posts = await self.source.poll()
+        assert posts == []
+        assert self.source.interval == 10
+        assert self.source._history.call_count == 3
+
+    async def test_poll_adaptive(self):
+        self.source.history.last_ts = "10.000001"
+        self.source._history = asynctest.CoroutineMock(return_value=[])
+        assert await self.source.poll() == []
+        assert self.source.interval == 10
+        # skipped until the interval passed
+        assert await self.source.poll() == []
+        assert self.source._history.call_count == 1
+
+        intervals = []
+        for _ in range(8):
+            self.source._next_poll = 0
+            await self.source.poll()
+            intervals.append(self.source.interval)
+        assert intervals == [20, 40, 80, 160, 320, 600, 600, 600]
+
+        # activity resets the interval
+        self.source._next_poll = 0
+        self.source._history.return_value = [{"type": "message", "text": "one", "ts": "11.000001"}]
+        assert len(await self.source.poll()) == 1
+        assert self.source.interval == 0
+        assert self.source._next_poll <= time.monotonic()
+
+    async def test_poll_failing(self):
+        self.source.history.last_ts = "10.000001"
+        self.source._history = asynctest.CoroutineMock(return_value=None)
+        assert await self.source.poll() == []
+        self.source._next_poll = 0
+        self.source._history = asynctest.CoroutineMock(side_effect=Exception("Test"))
+        assert await self.source.poll() == []
+        assert self.source.interval == 20
+
+    async def test_stop(self):
+        assert await self.source.stop() == True
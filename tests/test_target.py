@@ -13,11 +13,19 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import asynctest
+import os
+import tempfile
+import time
 from asynctest import MagicMock
 from aiohttp.client_exceptions import ClientOSError
 from livebridge.base import BaseTarget, BasePost, TargetResponse
+from livebridge_slack.channels import ChannelIndex
 from livebridge_slack.common import SlackClient
+from livebridge_slack.content import SlackContent
+from livebridge_slack.journal import DeliveryJournal
+from livebridge_slack.ratelimit import METHOD_LIMITS, Scheduler
 from livebridge_slack import SlackTarget
 from tests import load_json
 
@@ -45,10 +53,14 @@ class TestResponse:
 class SlackTargetTests(asynctest.TestCase):
 
     def setUp(self):
+        ChannelIndex.clear()
         self.token = "baz"
         self.channel = "foo"
         self.client = SlackTarget(config={"auth": {"token":self.token}, "channel": self.channel})
 
+    async def tearDown(self):
+        await SlackClient.close_session()
+
     @asynctest.fail_on(unused_loop=False)
     def test_init(self):
         assert self.client.type == "slack"
@@ -118,6 +130,7 @@ class SlackTargetTests(asynctest.TestCase):
         post.images = []
         post.content = "Test, mit Ü."
         resp = await self.client.post_item(post)
+        assert resp.pop("fingerprint")
         assert resp == api_res
 
     async def test_update_item(self):
@@ -133,10 +146,51 @@ class SlackTargetTests(asynctest.TestCase):
         post.content = "Test, mit Ü."
         post.target_doc = {"ts": 456}
         resp = await self.client.update_item(post)
+        assert resp.pop("fingerprint")
         assert resp == api_res
         assert self.client._post.call_args == asynctest.call('https://slack.com/api/chat.update',
                              [('token', 'baz'), ('channel', None), ('text', 'Test, mit Ü.'), ('ts', 456)])
 
+    async def test_update_item_unchanged(self):
+        self.client._channel_id = "ABCDEFG"
+        self.client._post = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1466511630.000011"})
+        post = MagicMock(id="1", content="Foo")
+        post.target_doc = await self.client.post_item(post)
+        assert post.target_doc["fingerprint"]
+
+        # only metadata changed
+        res = await self.client.update_item(post)
+        assert res == post.target_doc
+        assert self.client._post.call_count == 1
+        assert self.client.updates_skipped == 1
+
+        # target doc without fingerprint
+        post.target_doc = {"ts": "1466511630.000011"}
+        res = await self.client.update_item(post)
+        assert res == post.target_doc
+        assert self.client.updates_skipped == 2
+
+        post.content = "Bar"
+        res = await self.client.update_item(post)
+        assert self.client._post.call_count == 2
+        assert res["fingerprint"] == self.client.fingerprints.get("1466511630.000011")
+        post.target_doc = res
+        await self.client.update_item(post)
+        assert self.client._post.call_count == 2
+        assert self.client.updates_skipped == 3
+
+        # failed updates are not remembered
+        self.client._post.return_value = {}
+        post.content = "Baz"
+        await self.client.update_item(post)
+        await self.client.update_item(post)
+        assert self.client._post.call_count == 4
+
+        # forgotten after deletion
+        self.client._post.return_value = {"ok": True}
+        await self.client.delete_item(post)
+        assert "1466511630.000011" not in self.client.fingerprints
+
     async def test_update_item_failin(self):
         self.client.get_id_at_target = lambda x: None
         post = MagicMock()
@@ -185,3 +239,488 @@ class SlackTargetTests(asynctest.TestCase):
             patched.side_effect = ClientOSError()
             res = await self.client._post("https://dpa.com/resource", data={"foo": "bla"}, status=201)
             assert res == {}
+
+    async def test_session_shared(self):
+        other = SlackTarget(config={"auth": {"token": "other"}, "channel": "bar"})
+        session = self.client.session
+        assert session is other.session
+        assert session is self.client.session
+        assert SlackClient._session_users == 2
+        assert session.closed == False
+
+        # recreated after close
+        await SlackClient.close_session()
+        assert session.closed == True
+        assert self.client.session is not session
+        assert self.client.session.closed == False
+
+    async def test_session_pool_config(self):
+        client = SlackTarget(config={"channel": "foo", "pool": {
+            "limit_per_host": 3, "dns_cache_ttl": 60, "keepalive_timeout": 5}})
+        with asynctest.patch("aiohttp.TCPConnector") as patched:
+            client.session
+            assert patched.call_args == asynctest.call(limit_per_host=3, ttl_dns_cache=60, keepalive_timeout=5)
+        SlackClient._session = None
+
+    async def test_session_close(self):
+        other = SlackTarget(config={"auth": {"token": "other"}, "channel": "bar"})
+        session = self.client.session
+        other.session
+        await other.close()
+        assert session.closed == False
+        assert SlackClient._session_users == 1
+
+        # second close has no effect
+        await other.close()
+        assert SlackClient._session_users == 1
+
+        await self.client.close()
+        assert session.closed == True
+        assert SlackClient._session is None
+
+    async def test_update_item_coalesced(self):
+        api_res = {"ok": True, "channel": "ABCDEFG", "ts": "1466511630.000011"}
+        self.client._post = asynctest.CoroutineMock(return_value=api_res)
+        self.client._channel_id = "ABCDEFG"
+        self.client.update_window = 0.05
+        posts = []
+        for x in range(3):
+            post = MagicMock()
+            post.content = "Update {}".format(x)
+            post.target_doc = {"ts": "1466511630.000011", "fingerprint": "abc"}
+            posts.append(post)
+        # one after another like livebridge, each returns at once
+        res = [await self.client.update_item(p) for p in posts]
+        assert res == [{"ts": "1466511630.000011"}] * 3
+        assert self.client._post.call_count == 0
+        assert self.client.updates_coalesced == 2
+        await asyncio.sleep(0.07)
+        assert self.client._post.call_count == 1
+        assert self.client._post.call_args == asynctest.call('https://slack.com/api/chat.update',
+            [('token', 'baz'), ('channel', 'ABCDEFG'), ('text', 'Update 2'), ('ts', '1466511630.000011')])
+        assert self.client._pending_updates == {}
+        assert self.client.updated_docs.get("1466511630.000011")["fingerprint"] != "abc"
+
+        # next update is sent again
+        res = await self.client.update_item(posts[0])
+        await asyncio.sleep(0.07)
+        assert self.client._post.call_count == 2
+
+    async def test_update_item_coalesced_failing(self):
+        self.client._post = asynctest.CoroutineMock(side_effect=Exception("Test"))
+        self.client._channel_id = "ABCDEFG"
+        self.client.update_window = 0.01
+        post = MagicMock()
+        post.target_doc = {"ts": "1466511630.000011"}
+        assert await self.client.update_item(post) == {"ts": "1466511630.000011"}
+        await asyncio.sleep(0.03)
+        assert self.client._post.call_count == 1
+        assert self.client._pending_updates == {}
+        assert len(self.client.updated_docs) == 0
+
+    async def test_update_item_dropped_by_delete(self):
+        self.client._post = asynctest.CoroutineMock(return_value={"ok": True})
+        self.client._channel_id = "ABCDEFG"
+        self.client.update_window = 0.01
+        post = MagicMock()
+        post.content = "Update"
+        post.target_doc = {"ts": "1466511630.000011"}
+        await self.client.update_item(post)
+        await self.client.update_item(post)
+        resp = await self.client.delete_item(post)
+        assert resp == {"ok": True}
+        await asyncio.sleep(0.03)
+        assert self.client._post.call_count == 1
+        assert self.client._post.call_args[0][0] == 'https://slack.com/api/chat.delete'
+        assert self.client.updates_dropped == 1
+        assert self.client._pending_updates == {}
+
+    async def test_update_item_coalesced_close(self):
+        self.client._post = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1466511630.000011"})
+        self.client._channel_id = "ABCDEFG"
+        self.client.update_window = 10
+        post = MagicMock(content="Update")
+        post.target_doc = {"ts": "1466511630.000011"}
+        await self.client.update_item(post)
+        # sent on close, without waiting for the window
+        await self.client.close()
+        assert self.client._post.call_count == 1
+        assert self.client._post.call_args[0][0] == 'https://slack.com/api/chat.update'
+        assert self.client._pending_updates == {}
+
+    async def test_post_items(self):
+        self.client._channel_id = "C1123456"
+        posts = []
+        for x in range(10):
+            post = MagicMock(id=str(x))
+            post.content = "Post {}".format(x)
+            posts.append(post)
+        sent, sending = [], []
+
+        async def _post(url, data):
+            sending.append(True)
+            assert len(sending) == 1
+            text = dict(data)["text"]
+            # later posts are answered faster
+            await asyncio.sleep(0.001 * (10 - int(text.split()[-1])))
+            sending.pop()
+            sent.append(text)
+            if text == "Post 4":
+                raise ValueError("Test")
+            return {"ok": True, "ts": "1475157232.00000{}".format(len(sent))}
+
+        self.client._post = _post
+        with asynctest.patch.dict(METHOD_LIMITS, {"chat.postMessage": (60000, 100)}):
+            Scheduler.clear()
+            res = await self.client.post_items(posts)
+        assert [r.get("ts") for r in res] == [
+            "1475157232.00000{}".format(x) for x in range(1, 5)] + [None] + [
+            "1475157232.00000{}".format(x) for x in range(6, 11)]
+        assert all(type(r) == TargetResponse for r in res)
+        # sent one after another, in order
+        assert sent == [post.content for post in posts]
+
+        # empty batch
+        assert await self.client.post_items([]) == []
+
+
+class JournaledTargetTests(asynctest.TestCase):
+
+    def setUp(self):
+        ChannelIndex.clear()
+        DeliveryJournal.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.client = SlackTarget(config={"auth": {"token": "baz"}, "channel": "foo",
+                                          "journal": os.path.join(self.tmpdir.name, "journal.db")})
+        self.client._channel_id = "C1123456"
+        self.journal = self.client.journal
+        self.post = MagicMock(id="post-1", content="Foo")
+
+    async def tearDown(self):
+        await SlackClient.close_session()
+        DeliveryJournal.clear()
+        self.tmpdir.cleanup()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_init(self):
+        assert SlackTarget(config={}).journal == None
+        assert type(self.journal) == DeliveryJournal
+        other = SlackTarget(config={"channel": "bar", "journal": self.journal.path})
+        assert other.journal is self.journal
+
+    async def test_post_item(self):
+        self.client._request = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1475157232.000001"})
+        res = await self.client.post_item(self.post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "ts": "1475157232.000001"}
+        assert self.journal.lookup("slack-foo", "post-1")[:2] == ("delivered", "1475157232.000001")
+
+        # retry is answered from the journal
+        res = await self.client.post_item(self.post)
+        assert res == {"ok": True, "channel": "C1123456", "ts": "1475157232.000001"}
+        assert self.client._request.call_count == 1
+
+    async def test_post_item_failing(self):
+        self.client._request = asynctest.CoroutineMock(side_effect=asyncio.TimeoutError())
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.client.post_item(self.post)
+        assert self.journal.lookup("slack-foo", "post-1")[0] == "pending"
+
+        # message was created before the timeout
+        created = self.journal.lookup("slack-foo", "post-1")[3]
+        self.client._history = asynctest.CoroutineMock(return_value=[
+            {"text": "Foo", "ts": "{:.6f}".format(created + 1)},
+            {"text": "Bar", "ts": "{:.6f}".format(created)},
+            {"text": "Foo", "ts": "{:.6f}".format(created - 60)}])
+        self.client._request = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1"})
+        res = await self.client.post_item(self.post)
+        assert res["ts"] == "{:.6f}".format(created + 1)
+        assert self.client._request.call_count == 0
+        assert self.client._history.call_args == asynctest.call("{:.6f}".format(created - 10))
+
+    async def test_post_item_pending_not_found(self):
+        self.journal.pending("slack-foo", "post-1", "Foo")
+        self.client._history = asynctest.CoroutineMock(return_value=[{"text": "Bar", "ts": "1.000001"}])
+        self.client._request = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1475157232.000001"})
+        res = await self.client.post_item(self.post)
+        assert res["ts"] == "1475157232.000001"
+        assert self.client._request.call_count == 1
+        assert self.journal.lookup("slack-foo", "post-1")[:2] == ("delivered", "1475157232.000001")
+
+    async def test_reconcile(self):
+        assert await self.client.reconcile() == 0
+        self.journal.delivered("slack-foo", "post-0", "1000.000001")
+        for x in range(1, 4):
+            self.journal.pending("slack-foo", "post-{}".format(x), "Foo")
+        entry = self.journal.lookup("slack-foo", "post-1")
+        self.client._history = asynctest.CoroutineMock(return_value=None)
+        assert await self.client.reconcile() == 0
+
+        # same text posted twice, the already delivered message doesn't count
+        self.client._history = asynctest.CoroutineMock(return_value=[
+            {"text": "Foo", "ts": "{:.6f}".format(entry[3] + 2)},
+            {"text": "Foo", "ts": "{:.6f}".format(entry[3] + 1)},
+            {"text": "Foo", "ts": "1000.000001"}])
+        assert await self.client.reconcile() == 2
+        states = [self.journal.lookup("slack-foo", "post-{}".format(x))[:2] for x in range(1, 4)]
+        assert states == [("delivered", "{:.6f}".format(entry[3] + 1)),
+                          ("delivered", "{:.6f}".format(entry[3] + 2)),
+                          ("pending", None)]
+
+    async def test_reconcile_once(self):
+        # rejected by Slack, never found in the history
+        self.journal.pending("slack-foo", "post-0", "Rejected")
+        self.client._history = asynctest.CoroutineMock(return_value=[])
+        self.client._request = asynctest.CoroutineMock(side_effect=[
+            {"ok": True, "ts": "1475157232.00000{}".format(x)} for x in range(1, 4)])
+        await self.client.post_item(self.post)
+        assert self.client._history.call_count == 1
+        # not for further posts with journal entries
+        self.journal.delivered("slack-foo", "post-2", "1475157232.000000")
+        await self.client.post_item(MagicMock(id="post-2", content="Bar"))
+        await self.client.post_item(MagicMock(id="post-3", content="Baz"))
+        assert self.client._history.call_count == 1
+
+        # a post pending itself is looked up again, from the time it was sent
+        self.journal.pending("slack-foo", "post-4", "Foo")
+        created = self.journal.lookup("slack-foo", "post-4")[3]
+        await self.client.post_item(MagicMock(id="post-4", content="Foo"))
+        assert self.client._history.call_count == 2
+        assert self.client._history.call_args == asynctest.call("{:.6f}".format(created - 10))
+
+    async def test_reconcile_expired(self):
+        self.journal.pending("slack-foo", "post-1", "Foo")
+        self.journal.pending("slack-foo", "post-2", "Foo")
+        entry = self.journal.lookup("slack-foo", "post-1")
+        self.journal._write("slack-foo", "post-1", entry[:3] + (time.time() - self.client.reconcile_max_age - 1,))
+        self.client._history = asynctest.CoroutineMock(return_value=[])
+        assert await self.client.reconcile() == 0
+        assert self.journal.lookup("slack-foo", "post-1") == None
+        # looked up from the entry left
+        created = self.journal.lookup("slack-foo", "post-2")[3]
+        assert self.client._history.call_args == asynctest.call("{:.6f}".format(created - 10))
+        assert list(self.journal.pending_entries("slack-foo").keys()) == ["post-2"]
+
+    async def test_post_items(self):
+        self.journal.pending("slack-foo", "post-0", "Foo")
+        self.journal.delivered("slack-foo", "post-0", "1475157232.000001")
+        posts = [MagicMock(id="post-{}".format(x), content="Foo {}".format(x)) for x in range(3)]
+        self.client._history = asynctest.CoroutineMock(return_value=[])
+        self.client._request = asynctest.CoroutineMock(side_effect=[
+            {"ok": True, "ts": "1475157232.000002"}, {}])
+        res = await self.client.post_items(posts)
+        assert [r.get("ts") for r in res] == ["1475157232.000001", "1475157232.000002", None]
+        assert self.client._request.call_count == 2
+        assert self.journal.lookup("slack-foo", "post-2")[0] == "pending"
+
+    async def test_delete_item(self):
+        self.journal.delivered("slack-foo", "post-1", "1475157232.000001")
+        self.post.target_doc = {"ts": "1475157232.000001"}
+        self.client._request = asynctest.CoroutineMock(return_value={})
+        await self.client.delete_item(self.post)
+        assert self.journal.lookup("slack-foo", "post-1") != None
+        self.client._request = asynctest.CoroutineMock(return_value={"ok": True})
+        await self.client.delete_item(self.post)
+        assert self.journal.lookup("slack-foo", "post-1") == None
+
+
+class ChunkedTargetTests(asynctest.TestCase):
+
+    def setUp(self):
+        ChannelIndex.clear()
+        self.client = SlackTarget(config={"auth": {"token": "baz"}, "channel": "foo", "max_length": 10})
+        self.client._channel_id = "C1123456"
+        self.ts = 0
+
+        async def _request(method, data):
+            data = dict(data)
+            if method == "chat.postMessage":
+                self.ts += 1
+                return {"ok": True, "channel": "C1123456", "ts": str(self.ts), "text": data["text"]}
+            return {"ok": True, "channel": "C1123456", "ts": data["ts"]}
+
+        self.client._request = asynctest.CoroutineMock(side_effect=_request)
+
+    def _calls(self):
+        return [(c[0][0], dict(c[0][1]).get("ts"), dict(c[0][1]).get("text")) for c in self.client._request.call_args_list]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_init(self):
+        assert self.client.max_length == 10
+        assert SlackTarget(config={}).max_length == 4000
+
+    async def test_post_item(self):
+        post = MagicMock(id="1", content=SlackContent.join(["aaaa\n", "bbbb\n", "cc\n"]))
+        res = await self.client.post_item(post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "channel": "C1123456", "ts": "1", "text": "aaaa\nbbbb\n", "chunks": ["1", "2"]}
+        assert self._calls() == [("chat.postMessage", None, "aaaa\nbbbb\n"), ("chat.postMessage", None, "cc\n")]
+
+        # short post
+        post = MagicMock(id="2", content="foo")
+        res = await self.client.post_item(post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "channel": "C1123456", "ts": "3", "text": "foo"}
+
+    async def test_post_item_chunk_failing(self):
+        post = MagicMock(id="1", content=SlackContent.join(["aaaa\n", "bbbb\n", "cc\n"]))
+        self.client._request = asynctest.CoroutineMock(side_effect=[{"ok": True, "ts": "1"}, {}])
+        res = await self.client.post_item(post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "ts": "1"}
+        self.client._request = asynctest.CoroutineMock(return_value={})
+        assert await self.client.post_item(post) == {}
+
+    async def test_update_item(self):
+        post = MagicMock(id="1", content=SlackContent.join(["aaaa\n", "bbbb\n", "cc\n"]))
+        post.target_doc = {"ts": "1", "chunks": ["1", "2"]}
+        res = await self.client.update_item(post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "channel": "C1123456", "ts": "1", "chunks": ["1", "2"]}
+        assert self._calls() == [("chat.update", "1", "aaaa\nbbbb\n"), ("chat.update", "2", "cc\n")]
+
+        # grows
+        self.client._request.reset_mock()
+        self.ts = 2
+        post.content = SlackContent.join(["aaaa\n", "bbbb\n", "cccc\n", "dddd\n", "eeee\n"])
+        res = await self.client.update_item(post)
+        assert res["chunks"] == ["1", "2", "3"]
+        assert self._calls() == [("chat.update", "1", "aaaa\nbbbb\n"), ("chat.update", "2", "cccc\ndddd\n"),
+                                 ("chat.postMessage", None, "eeee\n")]
+
+        # shrinks
+        self.client._request.reset_mock()
+        post.target_doc = res
+        post.content = "foo"
+        res = await self.client.update_item(post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "channel": "C1123456", "ts": "1"}
+        assert self._calls() == [("chat.update", "1", "foo"), ("chat.delete", "2", None), ("chat.delete", "3", None)]
+
+    async def test_update_item_not_chunked(self):
+        post = MagicMock(id="1", content=SlackContent.join(["aaaa\n", "bbbb\n", "cc\n"]))
+        post.target_doc = {"ts": "1"}
+        self.ts = 1
+        res = await self.client.update_item(post)
+        assert res["chunks"] == ["1", "2"]
+        assert self._calls() == [("chat.update", "1", "aaaa\nbbbb\n"), ("chat.postMessage", None, "cc\n")]
+
+    async def test_update_item_coalesced(self):
+        self.client.update_window = 0.01
+        self.ts = 1
+        post = MagicMock(id="1", content=SlackContent.join(["aaaa\n", "bbbb\n", "cc\n"]))
+        post.target_doc = {"ts": "1"}
+        assert await self.client.update_item(post) == {"ts": "1"}
+        await asyncio.sleep(0.03)
+        assert self._calls() == [("chat.update", "1", "aaaa\nbbbb\n"), ("chat.postMessage", None, "cc\n")]
+
+        # chunks added later are known to further updates and deletes
+        res = await self.client.update_item(post)
+        assert res == {"ok": True, "channel": "C1123456", "ts": "1", "chunks": ["1", "2"]}
+        await asyncio.sleep(0.03)
+        self.client._request.reset_mock()
+        await self.client.delete_item(post)
+        assert self._calls() == [("chat.delete", "1", None), ("chat.delete", "2", None)]
+
+    async def test_delete_item(self):
+        post = MagicMock(id="1")
+        post.target_doc = {"ts": "1", "chunks": ["1", "2"]}
+        res = await self.client.delete_item(post)
+        assert res == {"ok": True, "channel": "C1123456", "ts": "1"}
+        assert self._calls() == [("chat.delete", "1", None), ("chat.delete", "2", None)]
+
+        # chunks not matching the ts
+        self.client._request.reset_mock()
+        post.target_doc = {"ts": "3", "chunks": ["1", "2"]}
+        await self.client.delete_item(post)
+        assert self._calls() == [("chat.delete", "3", None)]
+
+    async def test_post_items(self):
+        posts = [MagicMock(id="1", content="foo"),
+                 MagicMock(id="2", content=SlackContent.join(["aaaa\n", "bbbb\n", "cc\n"])),
+                 MagicMock(id="3", content="bar")]
+        res = await self.client.post_items(posts)
+        assert [r["ts"] for r in res] == ["1", "2", "4"]
+        assert res[1]["chunks"] == ["2", "3"]
+        assert [c[2] for c in self._calls()] == ["foo", "aaaa\nbbbb\n", "cc\n", "bar"]
+
+
+class BlocksTargetTests(asynctest.TestCase):
+
+    def setUp(self):
+        ChannelIndex.clear()
+        self.client = SlackTarget(config={"auth": {"token": "baz"}, "channel": "foo", "blocks": True})
+        self.client._channel_id = "C1123456"
+        self.content = SlackContent.join(
+            ["*foo*\n", "\nhttp://foo.com/img.jpg\n"],
+            [[{"type": "section", "text": {"type": "mrkdwn", "text": "*foo*"}}],
+             [{"type": "image", "image_url": "http://foo.com/img.jpg", "alt_text": "img"}]])
+
+    async def tearDown(self):
+        await SlackClient.close_session()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_init(self):
+        assert self.client.blocks == True
+        assert SlackTarget(config={}).blocks == False
+
+    async def test_request_json(self):
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            patched.return_value = TestResponse(url="http://foo.com", data={"ok": True, "ts": "1"})
+            res = await self.client._request_json("chat.postMessage", {"channel": "C1123456", "blocks": []})
+            assert res == {"ok": True, "ts": "1"}
+            assert patched.call_args == asynctest.call(
+                "https://slack.com/api/chat.postMessage", json={"channel": "C1123456", "blocks": []},
+                headers={"Authorization": "Bearer baz"})
+
+    async def test_post_item(self):
+        self.client._request_json = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1"})
+        self.client._request = asynctest.CoroutineMock(return_value={"ok": True, "ts": "2"})
+        res = await self.client.post_item(MagicMock(id="1", content=self.content))
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "ts": "1"}
+        assert self.client._request.call_count == 0
+        assert self.client._request_json.call_args == asynctest.call("chat.postMessage", {
+            "channel": "C1123456",
+            "text": "*foo*\n\nhttp://foo.com/img.jpg\n",
+            "blocks": self.content.blocks[0] + self.content.blocks[1],
+            "unfurl_links": False,
+            "unfurl_media": False,
+        })
+
+        # content without blocks
+        res = await self.client.post_item(MagicMock(id="2", content="foo"))
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "ts": "2"}
+        assert self.client._request_json.call_count == 1
+
+    async def test_post_item_unfurled(self):
+        self.content.unfurl = True
+        self.client._request_json = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1"})
+        await self.client.post_item(MagicMock(id="1", content=self.content))
+        assert self.client._request_json.call_args[0][1]["unfurl_links"] == True
+        assert self.client._request_json.call_args[0][1]["unfurl_media"] == True
+
+    async def test_update_item(self):
+        self.client._request_json = asynctest.CoroutineMock(return_value={"ok": True, "ts": "1"})
+        post = MagicMock(id="1", content=self.content)
+        post.target_doc = {"ts": "1"}
+        res = await self.client.update_item(post)
+        assert res.pop("fingerprint")
+        assert res == {"ok": True, "ts": "1"}
+        assert self.client._request_json.call_args == asynctest.call("chat.update", {
+            "channel": "C1123456",
+            "text": "*foo*\n\nhttp://foo.com/img.jpg\n",
+            "blocks": self.content.blocks[0] + self.content.blocks[1],
+            "ts": "1",
+        })
+
+    async def test_post_item_split(self):
+        section = {"type": "section", "text": {"type": "mrkdwn", "text": "foo"}}
+        content = SlackContent.join(["foo\n"] * 3, [[section] * 20] * 3)
+        self.client._request_json = asynctest.CoroutineMock(side_effect=[{"ok": True, "ts": "1"}, {"ok": True, "ts": "2"}])
+        res = await self.client.post_item(MagicMock(id="1", content=content))
+        assert res["chunks"] == ["1", "2"]
+        payloads = [c[0][1] for c in self.client._request_json.call_args_list]
+        assert [len(p["blocks"]) for p in payloads] == [40, 20]
+        assert [p["text"] for p in payloads] == ["foo\nfoo\n", "foo\n"]